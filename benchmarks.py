@@ -0,0 +1,278 @@
+'''
+Benchmark de regressão do analisador léxico com tokens muito longos.
+
+Mede o tempo por caractere de Lexer.tokenize para identificadores e números
+cada vez maiores. Com o maximal munch linear esse custo fica praticamente
+constante; se o laço voltar a copiar o lexema a cada estado de aceitação, o
+custo por caractere cresce com o tamanho do token e o script falha.
+
+Identificadores e números longos são consumidos de uma vez pelo laço de um
+estado sobre si mesmo; por isso também são medidos tokens longos cujo caminho
+no AFD alterna entre estados (PAIRS: (ab)+, e cadeias com escapes), em que o
+laço interno passa por um estado de aceitação a cada poucos caracteres.
+
+Também mede o modo linear_time do Lexer numa especificação patológica
+(A: a, AB: a*b sobre uma sequência de 'a'), que no modo padrão é quadrática.
+
+Os mesmos tokens longos são medidos em Lexer.tokenize_stream, com blocos
+pequenos (sufixo /S): um token que atravessa muitos blocos não pode ser
+recopiado a cada bloco.
+
+Por fim mede entradas com muitos tokens curtos, em que pesa o custo fixo por
+token: o custo por caractere não pode crescer com o tamanho da entrada, e
+montar as tuplas de Lexer.tokenize não pode custar muito mais que a análise
+colunar de Lexer.tokenize_columnar. O módulo gerado por core/lexer_codegen.py
+não pode ser mais lento que Lexer.tokenize numa especificação grande (80
+palavras reservadas, centenas de estados no AFD). Nessa mesma especificação,
+load_lexer de um AFD binário (CompiledDFA montado direto das tabelas) tem de
+custar no máximo MAX_LOAD_RATIO de reconstruir o AFD com load_dfa e compilá-lo
+no Lexer.
+
+Uso: python benchmarks.py
+'''
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+
+from core.automata import _minimize_dfa
+from core.dfa_serialization import DFA_BINARY_SUFFIX, save_dfa, load_dfa, load_lexer
+from core.lexer_codegen import generate_lexer_module
+from core.lexer_core import Lexer, parse_re_file_data
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+
+RE_DEFINITIONS = (
+    "ID: [a-zA-Z_][a-zA-Z0-9_]*\n"
+    "NUM: [0-9]+(\\.[0-9]+)?\n"
+    "WS: [ ]+ %ignore"
+)
+LONG_PATH_RE_DEFINITIONS = (
+    "PAIRS: (ab)+\n"
+    "STR: \"([a-z ]|\\\\\"|\\\\\\\\)*\"\n"
+    "WS: [ ]+ %ignore"
+)
+BACKTRACKING_RE_DEFINITIONS = (
+    "A: a\n"
+    "AB: a*b"
+)
+SHORT_TOKEN_RE_DEFINITIONS = (
+    "ID: [a-zA-Z_][a-zA-Z0-9_]*\n"
+    "NUM: [0-9]+\n"
+    "OP: [=+;]\n"
+    "WS: [ ]+ %ignore"
+)
+# Especificação grande para o lexer gerado: KEYWORD_COUNT palavras reservadas
+# (sorteadas com KEYWORD_SEED) além de identificadores, números e operadores
+KEYWORD_COUNT = 80
+KEYWORD_SEED = 1
+KEYWORD_SOURCE_TOKENS = 60_000
+# Razão máxima aceita entre o tempo do módulo gerado e o de Lexer.tokenize
+MAX_GENERATED_LEXER_RATIO = 1.0
+# Custo máximo de load_lexer em relação a Lexer(*load_dfa(...)) no mesmo arquivo
+MAX_LOAD_RATIO = 0.5
+# Trecho repetido nas entradas de tokens curtos, e quantos tokens ele tem
+SHORT_TOKEN_SNIPPET = "a = b1 + 22; "
+SHORT_TOKEN_SNIPPET_TOKENS = 6
+TOKEN_LENGTHS = [2_000, 8_000, 32_000, 128_000]
+# Razão máxima aceita entre o custo por caractere do maior e do menor token
+MAX_PER_CHAR_RATIO = 4.0
+# Razão máxima aceita entre o tempo de tokenize (tuplas) e o de tokenize_columnar
+MAX_TUPLE_OVERHEAD_RATIO = 1.15
+# Blocos pequenos em tokenize_stream, para que os tokens longos atravessem muitos deles
+STREAM_CHUNK_SIZE = 64
+REPEATS = 3
+
+
+def build_lexer(re_definitions, linear_time=False):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, _ = parse_re_file_data(re_definitions)
+    dfa = regex_to_direct_dfa(definitions, pattern_order)[0]
+    return Lexer(_minimize_dfa(dfa), reserved_words, patterns_to_ignore, linear_time=linear_time)
+
+
+def long_token_sources(length):
+    return {
+        "ID": "x" + "a1_" * (length // 3),
+        "NUM": "7" * (length // 2) + "." + "3" * (length // 2),
+    }
+
+
+def best_time(tokenize, source_code, expected_tokens):
+    best = None
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        tokens, _ = tokenize(source_code)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    assert len(tokens) == expected_tokens, f"Expected {expected_tokens} tokens, got {len(tokens)}"
+    return best
+
+
+def long_path_token_sources(length):
+    return {
+        "PAIRS": "ab" * (length // 2),
+        "STR": '"' + 'ab\\"' * (length // 4) + '"',
+    }
+
+
+def stream_tokenize(lexer):
+    '''
+    Lexer.tokenize_stream sobre blocos de STREAM_CHUNK_SIZE caracteres, com o
+    mesmo retorno de tokenize para uso em best_time.
+    '''
+    def tokenize(source_code):
+        chunks = (source_code[base:base + STREAM_CHUNK_SIZE] for base in range(0, len(source_code), STREAM_CHUNK_SIZE))
+        return list(lexer.tokenize_stream(chunks)), lexer.symbol_table
+    return tokenize
+
+
+def time_per_char(tokenize, source_code, expected_tokens):
+    return best_time(tokenize, source_code, expected_tokens) / len(source_code)
+
+
+def check_linear_cost(label, tokenize, sources, expected_tokens):
+    costs = []
+    for source_code in sources:
+        cost = time_per_char(tokenize, source_code, expected_tokens(source_code))
+        costs.append(cost)
+        print(f"{label:>6} {len(source_code):>8} chars: {cost * 1e9:8.1f} ns/char")
+    ratio = costs[-1] / costs[0]
+    print(f"{label:>6} per-char cost ratio (largest/smallest): {ratio:.2f}")
+    if ratio > MAX_PER_CHAR_RATIO:
+        print(f"FAIL: {label} tokenization cost grows with input length (ratio {ratio:.2f} > {MAX_PER_CHAR_RATIO})")
+        return False
+    return True
+
+
+def check_tuple_overhead(lexer, source_code, expected_tokens):
+    tuple_time = best_time(lexer.tokenize, source_code, expected_tokens)
+    columnar_time = best_time(lexer.tokenize_columnar, source_code, expected_tokens)
+    ratio = tuple_time / columnar_time
+    print(f"{'SHORT':>6} tokenize {tuple_time * 1e9 / expected_tokens:8.1f} ns/token, "
+          f"tokenize_columnar {columnar_time * 1e9 / expected_tokens:8.1f} ns/token (ratio {ratio:.2f})")
+    if ratio > MAX_TUPLE_OVERHEAD_RATIO:
+        print(f"FAIL: tokenize costs {ratio:.2f}x tokenize_columnar (> {MAX_TUPLE_OVERHEAD_RATIO})")
+        return False
+    return True
+
+
+def keyword_spec_and_source():
+    '''
+    Especificação com KEYWORD_COUNT palavras reservadas e uma entrada de
+    KEYWORD_SOURCE_TOKENS tokens misturando palavras reservadas,
+    identificadores, números e operadores.
+    '''
+    rng = random.Random(KEYWORD_SEED)
+    words = set()
+    while len(words) < KEYWORD_COUNT:
+        words.add("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 9))))
+    words = sorted(words)
+    re_definitions = "\n".join(f"{word.upper()}: {word}" for word in words) + (
+        "\nID: [a-zA-Z_][a-zA-Z0-9_]*"
+        "\nNUM: [0-9]+"
+        "\nOP: [=+;(){}<>*-]"
+        "\nWS: [ \\n]+ %ignore")
+    tokens = []
+    for _ in range(KEYWORD_SOURCE_TOKENS):
+        kind = rng.random()
+        if kind < 0.4:
+            tokens.append(rng.choice(words))
+        elif kind < 0.7:
+            tokens.append("v" + str(rng.randint(0, 999)))
+        elif kind < 0.85:
+            tokens.append(str(rng.randint(0, 99999)))
+        else:
+            tokens.append(rng.choice("=+;()"))
+    return re_definitions, " ".join(tokens)
+
+
+def check_generated_lexer():
+    re_definitions, source_code = keyword_spec_and_source()
+    definitions, pattern_order, reserved_words, patterns_to_ignore, _ = parse_re_file_data(re_definitions)
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0])
+    lexer = Lexer(dfa, reserved_words, patterns_to_ignore)
+    generated = types.ModuleType("generated_lexer")
+    exec(compile(generate_lexer_module(dfa, reserved_words, patterns_to_ignore), "<generated>", "exec"),
+         generated.__dict__)
+
+    lexer_time = best_time(lexer.tokenize, source_code, KEYWORD_SOURCE_TOKENS)
+    generated_time = best_time(generated.tokenize, source_code, KEYWORD_SOURCE_TOKENS)
+    ratio = generated_time / lexer_time
+    print(f"{'KWGEN':>6} {lexer.compiled_dfa.num_states} states: Lexer.tokenize {lexer_time:.3f} s, "
+          f"generated module {generated_time:.3f} s (ratio {ratio:.2f})")
+    if ratio > MAX_GENERATED_LEXER_RATIO:
+        print(f"FAIL: the generated lexer costs {ratio:.2f}x Lexer.tokenize (> {MAX_GENERATED_LEXER_RATIO})")
+        return False
+    return True
+
+
+def best_load_time(load):
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        lexer = load()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, lexer
+
+
+def check_saved_lexer_load():
+    re_definitions, source_code = keyword_spec_and_source()
+    definitions, pattern_order, reserved_words, patterns_to_ignore, directives = parse_re_file_data(re_definitions)
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0])
+    with tempfile.TemporaryDirectory() as temp_dir:
+        filepath = os.path.join(temp_dir, "keywords" + DFA_BINARY_SUFFIX)
+        save_dfa(filepath, dfa, reserved_words, patterns_to_ignore, pattern_order, directives)
+
+        def load_through_dfa():
+            loaded_dfa, loaded_reserved, loaded_ignored, _, _ = load_dfa(filepath)
+            return Lexer(loaded_dfa, loaded_reserved, loaded_ignored)
+
+        dfa_time, dfa_lexer = best_load_time(load_through_dfa)
+        load_time, loaded_lexer = best_load_time(lambda: load_lexer(filepath))
+    if loaded_lexer.tokenize(source_code)[0] != dfa_lexer.tokenize(source_code)[0]:
+        print("FAIL: load_lexer and load_dfa produce different tokens")
+        return False
+    ratio = load_time / dfa_time
+    print(f"{'LOAD':>6} {loaded_lexer.compiled_dfa.num_states} states: load_dfa + Lexer {dfa_time:.4f} s, "
+          f"load_lexer {load_time:.4f} s (ratio {ratio:.2f})")
+    if ratio > MAX_LOAD_RATIO:
+        print(f"FAIL: load_lexer costs {ratio:.2f}x load_dfa + Lexer (> {MAX_LOAD_RATIO})")
+        return False
+    return True
+
+
+def main():
+    lexer = build_lexer(RE_DEFINITIONS)
+    passed = True
+    for token_type in ("ID", "NUM"):
+        sources = [long_token_sources(length)[token_type] for length in TOKEN_LENGTHS]
+        passed = check_linear_cost(token_type, lexer.tokenize, sources, lambda source_code: 1) and passed
+        passed = check_linear_cost(token_type + "/S", stream_tokenize(lexer), sources,
+                                   lambda source_code: 1) and passed
+
+    long_path_lexer = build_lexer(LONG_PATH_RE_DEFINITIONS)
+    for token_type in ("PAIRS", "STR"):
+        sources = [long_path_token_sources(length)[token_type] for length in TOKEN_LENGTHS]
+        passed = check_linear_cost(token_type, long_path_lexer.tokenize, sources, lambda source_code: 1) and passed
+        passed = check_linear_cost(token_type + "/S", stream_tokenize(long_path_lexer), sources,
+                                   lambda source_code: 1) and passed
+
+    linear_lexer = build_lexer(BACKTRACKING_RE_DEFINITIONS, linear_time=True)
+    sources = ["a" * length for length in TOKEN_LENGTHS]
+    passed = check_linear_cost("A/AB", linear_lexer.tokenize, sources, len) and passed
+    passed = check_linear_cost("A/AB/S", stream_tokenize(linear_lexer), sources, len) and passed
+
+    short_token_lexer = build_lexer(SHORT_TOKEN_RE_DEFINITIONS)
+    sources = [SHORT_TOKEN_SNIPPET * (length // len(SHORT_TOKEN_SNIPPET)) for length in TOKEN_LENGTHS]
+    expected_tokens = lambda source_code: len(source_code) // len(SHORT_TOKEN_SNIPPET) * SHORT_TOKEN_SNIPPET_TOKENS
+    passed = check_linear_cost("SHORT", short_token_lexer.tokenize, sources, expected_tokens) and passed
+    passed = check_tuple_overhead(short_token_lexer, sources[-1], expected_tokens(sources[-1])) and passed
+    passed = check_generated_lexer() and passed
+    passed = check_saved_lexer_load() and passed
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,30 @@
-from .config import EPSILON, CONCAT_OP
+import sys
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+from .config import EPSILON, CONCAT_OP, INITIAL_MODE
 from .regex_utils import is_token_literal
+from .char_ranges import (range_symbol, symbol_range, is_range_symbol, is_class_token, class_token_ranges,
+                          split_labels)
+
+ASCII_LIMIT = 128
 
 class NFAState:
     _id_counter = 0
+    # Incrementado a cada transição ε nova: invalida os fechos-ε guardados nos
+    # estados (ver epsilon_closure)
+    _epsilon_version = 0
     def __init__(self):
         self.id = NFAState._id_counter
         NFAState._id_counter += 1
         self.transitions = {}
+        self._closure = None
+        self._closure_version = -1
 
     def add_transition(self, symbol, next_state):
         self.transitions.setdefault(symbol, set()).add(next_state)
+        if symbol == EPSILON:
+            NFAState._epsilon_version += 1
 
     def __repr__(self):
         return f"S{self.id}"
@@ -40,6 +55,12 @@ def build_nfa_from_char_token(char_token):
     start = NFAState()
     accept = NFAState()
     
+    # Token de classe: uma aresta por intervalo, rotulada com o símbolo do intervalo
+    if is_class_token(char_token):
+        for low, high in class_token_ranges(char_token):
+            start.add_transition(range_symbol(low, high), accept)
+        return NFA(start, accept)
+
     actual_char_for_transition = char_token
     if len(char_token) == 2 and char_token.startswith('\\'):
         actual_char_for_transition = char_token[1] 
@@ -181,34 +202,119 @@ def postfix_to_nfa(postfix_tokens_list):
     final_nfa = stack.pop()
     return _finalize_nfa_properties(final_nfa)
 
+def _strongly_connected_components(successors):
+    '''
+    Componentes fortemente conexos do grafo de vértices 0..n-1
+    ('successors[v]' = vizinhos de v), pelo algoritmo de Tarjan sem recursão.
+    Os componentes saem em ordem topológica reversa: todo componente
+    alcançável a partir de outro vem antes dele na lista.
+    '''
+    num_nodes = len(successors)
+    order = [-1] * num_nodes
+    lowlink = [0] * num_nodes
+    on_stack = [False] * num_nodes
+    stack = []
+    components = []
+    next_order = 0
+    for root in range(num_nodes):
+        if order[root] != -1:
+            continue
+        order[root] = lowlink[root] = next_order
+        next_order += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, 0)]
+        while work:
+            node, edge = work[-1]
+            neighbours = successors[node]
+            if edge < len(neighbours):
+                work[-1] = (node, edge + 1)
+                neighbour = neighbours[edge]
+                if order[neighbour] == -1:
+                    order[neighbour] = lowlink[neighbour] = next_order
+                    next_order += 1
+                    stack.append(neighbour)
+                    on_stack[neighbour] = True
+                    work.append((neighbour, 0))
+                elif on_stack[neighbour] and order[neighbour] < lowlink[node]:
+                    lowlink[node] = order[neighbour]
+                continue
+            work.pop()
+            if work and lowlink[node] < lowlink[work[-1][0]]:
+                lowlink[work[-1][0]] = lowlink[node]
+            if lowlink[node] == order[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    return components
+
+def _refresh_epsilon_closures(nfa_states):
+    '''
+    Calcula o fecho-ε dos estados alcançáveis por ε a partir de 'nfa_states'
+    cujo fecho guardado está desatualizado. Os laços de ε (ex: do fecho de
+    Kleene) formam componentes fortemente conexos, e todos os estados de um
+    componente compartilham o mesmo frozenset: o fecho do componente são os
+    seus estados mais os fechos dos componentes que ele alcança, já prontos
+    pela ordem de saída do algoritmo de Tarjan.
+    '''
+    version = NFAState._epsilon_version
+    stale_states = []
+    index_of = {}
+    for state in nfa_states:
+        if state._closure_version != version and id(state) not in index_of:
+            index_of[id(state)] = len(stale_states)
+            stale_states.append(state)
+    position = 0
+    while position < len(stale_states):
+        for next_state in stale_states[position].transitions.get(EPSILON, ()):
+            if next_state._closure_version != version and id(next_state) not in index_of:
+                index_of[id(next_state)] = len(stale_states)
+                stale_states.append(next_state)
+        position += 1
+    if not stale_states:
+        return
+
+    successors = [[index_of[id(next_state)] for next_state in state.transitions.get(EPSILON, ())
+                   if id(next_state) in index_of]
+                  for state in stale_states]
+    for component in _strongly_connected_components(successors):
+        members = [stale_states[index] for index in component]
+        closure = set(members)
+        for member in members:
+            for next_state in member.transitions.get(EPSILON, ()):
+                if next_state not in closure:
+                    closure.update(next_state._closure)
+        closure = frozenset(closure)
+        for member in members:
+            member._closure = closure
+            member._closure_version = version
+
 def epsilon_closure(nfa_states_set_arg):
-    if not isinstance(nfa_states_set_arg, set) and not isinstance(nfa_states_set_arg, frozenset):
-        if isinstance(nfa_states_set_arg, NFAState):
-             nfa_states_set = {nfa_states_set_arg}
-        else: 
-            nfa_states_set = set(nfa_states_set_arg)
+    '''
+    Fecho-ε de um estado ou conjunto de estados: união dos fechos guardados
+    em cada estado (ver _refresh_epsilon_closures), recalculados só depois de
+    alguma transição ε nova.
+    '''
+    if isinstance(nfa_states_set_arg, NFAState):
+        nfa_states_set = (nfa_states_set_arg,)
     else:
-        nfa_states_set = set(nfa_states_set_arg)
+        nfa_states_set = tuple(nfa_states_set_arg)
     if not nfa_states_set: return frozenset()
-    closure = set(nfa_states_set)
-    worklist = list(nfa_states_set) 
-    while worklist:
-        s = worklist.pop()
-        if EPSILON in s.transitions:
-            for next_s in s.transitions[EPSILON]:
-                if next_s not in closure:
-                    closure.add(next_s)
-                    worklist.append(next_s)
-    return frozenset(closure)
+    _refresh_epsilon_closures(nfa_states_set)
+    if len(nfa_states_set) == 1:
+        return nfa_states_set[0]._closure
+    return frozenset().union(*(s._closure for s in nfa_states_set))
 
 def move(nfa_states_fset, symbol_from_input):
-    reachable = set()
-    for s in nfa_states_fset:
-        # As transições no NFA são armazenadas com o símbolo real (ex: '+', não '\+')
-        # symbol_from_input é o caractere real da entrada.
-        if symbol_from_input in s.transitions:
-            reachable.update(s.transitions[symbol_from_input])
-    return frozenset(reachable)
+    # As transições no NFA são armazenadas com o símbolo real (ex: '+', não '\+')
+    # symbol_from_input é o caractere real da entrada.
+    return frozenset().union(*(s.transitions[symbol_from_input] for s in nfa_states_fset
+                               if symbol_from_input in s.transitions))
 
 class DFA:
     def __init__(self):
@@ -217,6 +323,11 @@ class DFA:
         self.transitions = {}
         self.start_state_id = None
         self.accept_states = {} 
+        # Estados de aceitação cujo lexema é uma palavra reservada: id -> tipo reservado
+        self.keyword_accept_states = {}
+        # Estado inicial de cada condição de início (modo), quando o .re usa modos;
+        # o de INITIAL é o próprio start_state_id
+        self.mode_start_states = {}
         self._state_map = {} 
         self._next_dfa_id = 0
 
@@ -236,163 +347,298 @@ class DFA:
     def set_accept_state(self, dfa_id, pattern_name):
         self.accept_states[dfa_id] = pattern_name
 
+def _refine_partition(states, alphabet, transitions, initial_groups):
+    '''
+    Algoritmo de Hopcroft: refina 'initial_groups' até a partição mais
+    grossa estável sob as transições, em O(n·|Σ|·log n).
+
+    Os estados ficam num único array 'elements' em que cada bloco ocupa uma
+    faixa contígua [first, end); marcar um estado é trocá-lo para o início da
+    faixa do seu bloco, e dividir um bloco é só mover a fronteira, sem recriar
+    os outros blocos. Os predecessores de um estado por um símbolo vêm de um
+    índice inverso das transições, então cada divisor (bloco, símbolo) só
+    visita as transições que entram no bloco. Transições ausentes equivalem a
+    um estado morto fora de todos os blocos. Retorna a lista de blocos (listas
+    de estados).
+    '''
+    index_of = {state_id: index for index, state_id in enumerate(states)}
+    predecessors = {symbol: {} for symbol in alphabet}
+    for (from_id, symbol), to_id in transitions.items():
+        if from_id in index_of and to_id in index_of and symbol in predecessors:
+            predecessors[symbol].setdefault(index_of[to_id], []).append(index_of[from_id])
+
+    elements = []
+    block_of = [0] * len(states)
+    block_first = []
+    block_end = []
+    for block, group in enumerate(initial_groups):
+        block_first.append(len(elements))
+        for state_id in group:
+            block_of[index_of[state_id]] = block
+            elements.append(index_of[state_id])
+        block_end.append(len(elements))
+    location = [0] * len(states)
+    for position, state in enumerate(elements):
+        location[state] = position
+    marked = [0] * len(block_first)
+
+    symbols = sorted(alphabet)
+    waiting = [(block, symbol) for block in range(len(block_first)) for symbol in symbols]
+    in_waiting = set(waiting)
+    while waiting:
+        splitter = waiting.pop()
+        in_waiting.discard(splitter)
+        block, symbol = splitter
+        predecessors_by_target = predecessors[symbol]
+        if not predecessors_by_target:
+            continue
+        touched_blocks = []
+        for target in elements[block_first[block]:block_end[block]]:
+            for state in predecessors_by_target.get(target, ()):
+                state_block = block_of[state]
+                marked_end = block_first[state_block] + marked[state_block]
+                if location[state] < marked_end:
+                    continue
+                # Troca o estado com o primeiro não marcado do seu bloco
+                other = elements[marked_end]
+                elements[marked_end], elements[location[state]] = state, other
+                location[other], location[state] = location[state], marked_end
+                if marked[state_block] == 0:
+                    touched_blocks.append(state_block)
+                marked[state_block] += 1
+
+        for touched in touched_blocks:
+            marked_count = marked[touched]
+            marked[touched] = 0
+            if marked_count == block_end[touched] - block_first[touched]:
+                continue
+            # A parte marcada vira um bloco novo; o bloco antigo fica com o resto
+            new_block = len(block_first)
+            block_first.append(block_first[touched])
+            block_end.append(block_first[touched] + marked_count)
+            marked.append(0)
+            block_first[touched] += marked_count
+            for state in elements[block_first[new_block]:block_end[new_block]]:
+                block_of[state] = new_block
+            smaller = new_block if marked_count <= block_end[touched] - block_first[touched] else touched
+            for waiting_symbol in symbols:
+                if (touched, waiting_symbol) in in_waiting:
+                    entry = (new_block, waiting_symbol)
+                else:
+                    entry = (smaller, waiting_symbol)
+                in_waiting.add(entry)
+                waiting.append(entry)
+
+    return [[states[state] for state in elements[block_first[block]:block_end[block]]]
+            for block in range(len(block_first))]
+
 def _minimize_dfa(unminimized_dfa):
     if not unminimized_dfa.states:
         return unminimized_dfa 
 
     initial_partition_map = {}
-    for state_id in unminimized_dfa.states:
+    for state_id in sorted(unminimized_dfa.states):
         if state_id in unminimized_dfa.accept_states:
             pattern = unminimized_dfa.accept_states[state_id]
-            key = (True, pattern)
+            key = (True, pattern, unminimized_dfa.keyword_accept_states.get(state_id))
         else:
-            key = (False, None)
-        initial_partition_map.setdefault(key, set()).add(state_id)
+            key = (False, None, None)
+        initial_partition_map.setdefault(key, []).append(state_id)
     
-    P = {frozenset(group) for group in initial_partition_map.values() if group}
-    if not P:
+    if not initial_partition_map:
         return unminimized_dfa
-        
-    W = set(P)
-
-    while W:
-        A = W.pop()
-        for char_code in unminimized_dfa.alphabet:
-            X = set()
-            for s_prime in unminimized_dfa.states:
-                next_state_for_s_prime = unminimized_dfa.transitions.get((s_prime, char_code), None)
-                if next_state_for_s_prime is not None and next_state_for_s_prime in A:
-                    X.add(s_prime)
-            
-            if not X: continue
-
-            new_P_for_iteration = set() 
-            P_changed_in_iteration = False
-            temp_P_list = list(P) 
-            for Y in temp_P_list:
-                Y_intersect_X = Y.intersection(X)
-                Y_minus_X = Y.difference(X)
-
-                if Y_intersect_X and Y_minus_X:
-                    new_P_for_iteration.add(frozenset(Y_intersect_X))
-                    new_P_for_iteration.add(frozenset(Y_minus_X))
-                    P_changed_in_iteration = True
-                    
-                    if Y in W:
-                        W.remove(Y)
-                        W.add(frozenset(Y_intersect_X))
-                        W.add(frozenset(Y_minus_X))
-                    else:
-                        if len(Y_intersect_X) <= len(Y_minus_X):
-                            W.add(frozenset(Y_intersect_X))
-                        else:
-                            W.add(frozenset(Y_minus_X))
-                else:
-                    new_P_for_iteration.add(Y)
-            if P_changed_in_iteration:
-                P = new_P_for_iteration
-    
-    min_dfa = DFA()
-    min_dfa.alphabet = unminimized_dfa.alphabet
-    partition_map = {} 
-    new_state_id_counter = 0
-    
-    final_partitions_sorted_list_of_tuples = sorted([tuple(sorted(list(p))) for p in P])
-    final_partitions_sorted = [frozenset(p_tuple) for p_tuple in final_partitions_sorted_list_of_tuples]
 
+    blocks = _refine_partition(sorted(unminimized_dfa.states), unminimized_dfa.alphabet,
+                               unminimized_dfa.transitions, list(initial_partition_map.values()))
 
-    for part_fset in final_partitions_sorted:
-        if part_fset not in partition_map:
-            partition_map[part_fset] = new_state_id_counter
-            min_dfa.states.add(new_state_id_counter)
-            
-            representative_old_state = next(iter(part_fset)) 
-            if representative_old_state in unminimized_dfa.accept_states:
-                pattern_name = unminimized_dfa.accept_states[representative_old_state]
-                min_dfa.set_accept_state(new_state_id_counter, pattern_name)
+    # Numeração determinística: os blocos (disjuntos) em ordem do menor estado,
+    # que é também a ordem das tuplas ordenadas dos seus estados, e o menor
+    # estado de cada bloco é o seu representante.
+    representatives = sorted(min(block) for block in blocks)
+    block_by_representative = {min(block): block for block in blocks}
+    new_state_of = {}
+    for new_state_id, representative in enumerate(representatives):
+        for state_id in block_by_representative[representative]:
+            new_state_of[state_id] = new_state_id
 
-            if unminimized_dfa.start_state_id is not None and unminimized_dfa.start_state_id in part_fset:
-                min_dfa.start_state_id = new_state_id_counter
-            
-            new_state_id_counter += 1
-
-    for part_fset in final_partitions_sorted: 
-        new_from_state_id = partition_map[part_fset]
-        representative_old_state = next(iter(part_fset))
-        for char_code in min_dfa.alphabet:
-            old_to_state_id = unminimized_dfa.transitions.get((representative_old_state, char_code), None)
-            if old_to_state_id is not None:
-                for target_part_fset in final_partitions_sorted: 
-                    if old_to_state_id in target_part_fset:
-                        new_to_state_id = partition_map[target_part_fset]
-                        min_dfa.add_transition(new_from_state_id, char_code, new_to_state_id)
-                        break
+    min_dfa = DFA()
+    min_dfa.alphabet = unminimized_dfa.alphabet
+    min_dfa.states = set(range(len(representatives)))
+    for new_state_id, representative in enumerate(representatives):
+        if representative in unminimized_dfa.accept_states:
+            min_dfa.set_accept_state(new_state_id, unminimized_dfa.accept_states[representative])
+            if representative in unminimized_dfa.keyword_accept_states:
+                min_dfa.keyword_accept_states[new_state_id] = unminimized_dfa.keyword_accept_states[representative]
+
+    if unminimized_dfa.start_state_id is not None and unminimized_dfa.start_state_id in new_state_of:
+        min_dfa.start_state_id = new_state_of[unminimized_dfa.start_state_id]
+    for mode, old_start_state in unminimized_dfa.mode_start_states.items():
+        if old_start_state in new_state_of:
+            min_dfa.mode_start_states[mode] = new_state_of[old_start_state]
+
+    # Uma passada pelas transições: só as que saem de representantes
+    alphabet = min_dfa.alphabet
+    for (from_id, symbol), to_id in unminimized_dfa.transitions.items():
+        new_from_state_id = new_state_of.get(from_id)
+        if (new_from_state_id is not None and representatives[new_from_state_id] == from_id
+                and to_id in new_state_of and symbol in alphabet):
+            min_dfa.add_transition(new_from_state_id, symbol, new_state_of[to_id])
     return min_dfa
 
-def construct_unminimized_dfa_from_nfa(combined_nfa_start, combined_nfa_accept_map, combined_alphabet, pattern_order):
+def construct_unminimized_dfa_from_nfa(combined_nfa_start, combined_nfa_accept_map, combined_alphabet, pattern_order,
+                                       mode_nfa_starts=None):
+    '''
+    Construção de subconjuntos. Com 'mode_nfa_starts' (modo -> estado inicial
+    do NFA, ver combine_nfas_by_mode), cada modo ganha seu estado inicial no
+    mesmo AFD (mode_start_states): os subconjuntos alcançados a partir de
+    modos diferentes são compartilhados, e o AFD é construído uma vez só.
+    '''
     dfa = DFA()
     # O alfabeto do DFA é derivado do alfabeto combinado dos NFAs.
     # Se combined_alphabet já tem os caracteres reais (ex: '.', não '\.'), está correto.
     # _finalize_nfa_properties deve garantir isso para cada NFA individual, e combine_nfas os une.
-    dfa.alphabet = combined_alphabet if combined_alphabet is not None else set()
+    # Os rótulos do NFA podem ser intervalos sobrepostos (ex: 'a-z' e 'i'); o alfabeto
+    # do DFA são os intervalos disjuntos em que eles se dividem, e a transição por um
+    # deles segue todos os rótulos do NFA que o contêm.
+    nfa_labels = combined_alphabet if combined_alphabet is not None else set()
+    dfa_symbols, symbols_by_label = split_labels(nfa_labels)
+    dfa.alphabet = set(dfa_symbols)
+    labels_by_symbol = {}
+    for label in sorted(nfa_labels):
+        for symbol in symbols_by_label[label]:
+            labels_by_symbol.setdefault(symbol, []).append(label)
 
     initial_nfa_set_for_closure = {combined_nfa_start} if combined_nfa_start else set()
-    q0_nfa_fset_nfa_states = epsilon_closure(initial_nfa_set_for_closure)
-    q0_nfa_fset_ids = frozenset(s.id for s in q0_nfa_fset_nfa_states)
-
-
-    if not q0_nfa_fset_ids : 
+    if not initial_nfa_set_for_closure and not mode_nfa_starts:
         dfa.start_state_id = dfa._get_dfa_state_id(frozenset())
-        if combined_nfa_start in combined_nfa_accept_map and not combined_alphabet and len(initial_nfa_set_for_closure)==1 and combined_nfa_start in q0_nfa_fset_nfa_states:
-            pattern_name_for_epsilon = combined_nfa_accept_map[combined_nfa_start]
-            dfa.set_accept_state(dfa.start_state_id, pattern_name_for_epsilon)
         return dfa
 
-    dfa.start_state_id = dfa._get_dfa_state_id(q0_nfa_fset_ids)
-    
-    dfa_q_map = {q0_nfa_fset_ids: dfa.start_state_id} 
-    worklist = [q0_nfa_fset_nfa_states] 
-
-    while worklist:
-        current_nfa_fset_from_worklist_states = worklist.pop(0)
-        current_nfa_fset_from_worklist_ids = frozenset(s.id for s in current_nfa_fset_from_worklist_states)
-        current_dfa_id = dfa_q_map[current_nfa_fset_from_worklist_ids]
-
-        current_best_pattern = None
-        highest_priority_index = float('inf')
-        for nfa_s_in_subset in current_nfa_fset_from_worklist_states:
-            if nfa_s_in_subset in combined_nfa_accept_map:
-                pattern_name = combined_nfa_accept_map[nfa_s_in_subset]
-                try:
-                    priority = pattern_order.index(pattern_name)
-                    if priority < highest_priority_index:
-                        highest_priority_index = priority
-                        current_best_pattern = pattern_name
-                except ValueError: 
-                    if current_best_pattern is None:
-                        current_best_pattern = pattern_name
-        if current_best_pattern:
-            dfa.set_accept_state(current_dfa_id, current_best_pattern)
-
-        for symbol in sorted(list(dfa.alphabet)): # 'symbol' aqui é o char real do alfabeto
-            move_res_fset_states = move(current_nfa_fset_from_worklist_states, symbol)
-            if not move_res_fset_states: continue
-            
-            target_nfa_fset_after_closure_states = epsilon_closure(move_res_fset_states)
-            if not target_nfa_fset_after_closure_states: continue
+    # Estados do NFA numerados por bit: os de aceitação primeiro, em ordem de
+    # prioridade (ordem dos padrões), então o padrão de um subconjunto é o do
+    # seu bit de aceitação mais baixo. Conjuntos de estados são inteiros.
+    start_states = list(initial_nfa_set_for_closure) + list((mode_nfa_starts or {}).values())
+    reachable_states = _reachable_nfa_states(start_states)
+    priority_of = {}
+    for priority, pattern_name in enumerate(pattern_order):
+        priority_of.setdefault(pattern_name, priority)
+    accepting_states = sorted((state for state in reachable_states if state in combined_nfa_accept_map),
+                              key=lambda state: (priority_of.get(combined_nfa_accept_map[state], len(pattern_order)), state.id))
+    nfa_states = accepting_states + [state for state in reachable_states if state not in combined_nfa_accept_map]
+    # Indexado pelo id do estado, para não pagar o __hash__ de NFAState
+    bit_of = {state.id: bit for bit, state in enumerate(nfa_states)}
+    accepting_mask = (1 << len(accepting_states)) - 1
+    pattern_by_bit = [combined_nfa_accept_map[state] for state in accepting_states]
+    closure_masks = _epsilon_closure_masks(nfa_states, bit_of)
+
+    # Por estado do NFA: símbolo do AFD -> máscara dos destinos já fechados por ε
+    symbol_position = {symbol: position for position, symbol in enumerate(dfa_symbols)}
+    successor_masks = []
+    # Estados com alguma transição por símbolo; só eles contribuem para os destinos
+    moving_mask = 0
+    for bit, state in enumerate(nfa_states):
+        successors = {}
+        for label, targets in state.transitions.items():
+            if label == EPSILON or label not in symbols_by_label:
+                continue
+            targets_mask = 0
+            for target in targets:
+                targets_mask |= closure_masks[bit_of[target.id]]
+            for symbol in symbols_by_label[label]:
+                successors[symbol] = successors.get(symbol, 0) | targets_mask
+        successor_masks.append(successors)
+        if successors:
+            moving_mask |= 1 << bit
+
+    nfa_ids = [state.id for state in nfa_states]
+
+    def state_id_for(mask):
+        return dfa._get_dfa_state_id([nfa_ids[bit] for bit in _mask_bits(mask)])
+
+    dfa_q_map = {}
+    worklist = deque()
+    q0_mask = closure_masks[bit_of[combined_nfa_start.id]] if combined_nfa_start else 0
+    if q0_mask:
+        dfa.start_state_id = dfa_q_map[q0_mask] = state_id_for(q0_mask)
+        worklist.append(q0_mask)
+    else:
+        dfa.start_state_id = dfa._get_dfa_state_id(frozenset())
 
-            target_nfa_fset_after_closure_ids = frozenset(s.id for s in target_nfa_fset_after_closure_states)
+    for mode, mode_nfa_start in (mode_nfa_starts or {}).items():
+        mode_mask = closure_masks[bit_of[mode_nfa_start.id]]
+        if mode_mask not in dfa_q_map:
+            dfa_q_map[mode_mask] = state_id_for(mode_mask)
+            worklist.append(mode_mask)
+        dfa.mode_start_states[mode] = dfa_q_map[mode_mask]
 
-            if target_nfa_fset_after_closure_ids not in dfa_q_map:
-                target_dfa_id = dfa._get_dfa_state_id(target_nfa_fset_after_closure_ids)
-                dfa_q_map[target_nfa_fset_after_closure_ids] = target_dfa_id
-                worklist.append(target_nfa_fset_after_closure_states)
-            else:
-                target_dfa_id = dfa_q_map[target_nfa_fset_after_closure_ids]
+    while worklist:
+        current_mask = worklist.popleft()
+        current_dfa_id = dfa_q_map[current_mask]
+
+        accepting_bits = current_mask & accepting_mask
+        if accepting_bits:
+            best_pattern = pattern_by_bit[(accepting_bits & -accepting_bits).bit_length() - 1]
+            if best_pattern:
+                dfa.set_accept_state(current_dfa_id, best_pattern)
+
+        targets_by_symbol = {}
+        for bit in _mask_bits(current_mask & moving_mask):
+            for symbol, successor_mask in successor_masks[bit].items():
+                targets_by_symbol[symbol] = targets_by_symbol.get(symbol, 0) | successor_mask
+        # Símbolos em ordem de código, como no alfabeto: define a numeração dos estados novos
+        for symbol in sorted(targets_by_symbol, key=symbol_position.__getitem__):
+            target_mask = targets_by_symbol[symbol]
+            target_dfa_id = dfa_q_map.get(target_mask)
+            if target_dfa_id is None:
+                target_dfa_id = dfa_q_map[target_mask] = state_id_for(target_mask)
+                worklist.append(target_mask)
             dfa.add_transition(current_dfa_id, symbol, target_dfa_id)
-    
+
     return dfa
 
+def _mask_bits(mask):
+    '''
+    Índices dos bits ligados de 'mask', em ordem crescente.
+    '''
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+def _reachable_nfa_states(start_states):
+    '''
+    Estados do NFA alcançáveis a partir de 'start_states' (por qualquer
+    transição), em ordem de busca em largura.
+    '''
+    ordered = list({state.id: state for state in start_states}.values())
+    seen = {state.id for state in ordered}
+    index = 0
+    while index < len(ordered):
+        for targets in ordered[index].transitions.values():
+            for target in targets:
+                if target.id not in seen:
+                    seen.add(target.id)
+                    ordered.append(target)
+        index += 1
+    return ordered
+
+def _epsilon_closure_masks(nfa_states, bit_of):
+    '''
+    Fecho-ε de cada estado do NFA como máscara de bits (ver bit_of).
+    '''
+    epsilon_targets = [[bit_of[target.id] for target in state.transitions.get(EPSILON, ())] for state in nfa_states]
+    closure_masks = [0] * len(nfa_states)
+    # Componentes em ordem topológica reversa: os fechos dos sucessores já estão prontos
+    for component in _strongly_connected_components(epsilon_targets):
+        mask = 0
+        for bit in component:
+            mask |= 1 << bit
+        for bit in component:
+            for next_bit in epsilon_targets[bit]:
+                mask |= closure_masks[next_bit]
+        for bit in component:
+            closure_masks[bit] = mask
+    return closure_masks
+
 def combine_nfas(nfas_map_param):
     overall_start = NFAState()
     accept_map = {}
@@ -404,4 +650,159 @@ def combine_nfas(nfas_map_param):
         accept_map[nfa_component.accept_state] = pattern_name
         if nfa_component.alphabet: # Alphabeto do NFA componente já deve ter chars reais
             alphabet.update(nfa_component.alphabet)
-    return overall_start, accept_map, alphabet
\ No newline at end of file
+    return overall_start, accept_map, alphabet
+
+def combine_nfas_by_mode(nfas_map_param, mode_patterns):
+    '''
+    Como combine_nfas, mas com um estado inicial por condição de início (modo),
+    ligado por ε só aos NFAs dos padrões ativos naquele modo ('mode_patterns':
+    modo -> padrões). Retorna (modo -> estado inicial, mapa de aceitação,
+    alfabeto); o estado inicial de INITIAL é o estado inicial do AFD.
+    '''
+    _, accept_map, alphabet = combine_nfas(nfas_map_param)
+    mode_starts = {}
+    for mode, pattern_names in mode_patterns.items():
+        mode_start = NFAState()
+        for pattern_name in pattern_names:
+            nfa_component = nfas_map_param.get(pattern_name)
+            if nfa_component and nfa_component.start_state and nfa_component.accept_state:
+                mode_start.add_transition(EPSILON, nfa_component.start_state)
+        mode_starts[mode] = mode_start
+    return mode_starts, accept_map, alphabet
+
+def fold_reserved_words(dfa, reserved_words, patterns_to_ignore=None, mode_reserved_words=None):
+    '''
+    Incorpora as palavras reservadas ao AFD: produto do AFD com uma trie das
+    palavras (comparadas sem diferenciar maiúsculas, como lexema.lower()).
+    Um estado (q, nó) é de aceitação de palavra reservada quando q aceita um
+    padrão não ignorado e o nó termina uma palavra; esses estados ficam em
+    keyword_accept_states com o tipo reservado, e accept_states continua com o
+    padrão original. Assim o lexer resolve palavras reservadas pelo estado
+    final, sem copiar e converter cada lexema.
+
+    Com condições de início, 'mode_reserved_words' (modo -> palavras) dá as
+    palavras válidas em cada modo: cada modo parte da raiz da sua própria trie,
+    então uma palavra reservada de INITIAL não é reconhecida dentro de strings.
+    Um AFD que já tem keyword_accept_states (ex: carregado de um arquivo
+    gravado por save_dfa) é retornado como está.
+    '''
+    patterns_to_ignore = patterns_to_ignore if patterns_to_ignore else set()
+    if not reserved_words or dfa.start_state_id is None or dfa.keyword_accept_states:
+        return dfa
+
+    # Trie das palavras: nó -> {caractere: nó}; o nó 0 é a raiz da trie com todas
+    # as palavras, e cada conjunto de palavras de um modo tem a sua raiz
+    trie_edges = []
+    trie_words = {}
+
+    def add_trie(words):
+        root = len(trie_edges)
+        trie_edges.append({})
+        for word, token_type in words.items():
+            node = root
+            for char in word.lower():
+                next_node = trie_edges[node].get(char)
+                if next_node is None:
+                    next_node = len(trie_edges)
+                    trie_edges.append({})
+                    trie_edges[node][char] = next_node
+                node = next_node
+            trie_words[node] = token_type
+        return root
+
+    add_trie(reserved_words)
+    roots_by_words = {}
+    mode_trie_roots = {}
+    for mode, words in (mode_reserved_words or {}).items():
+        words_key = tuple(sorted(words.items()))
+        if words_key not in roots_by_words:
+            roots_by_words[words_key] = add_trie(words)
+        mode_trie_roots[mode] = roots_by_words[words_key]
+
+    # Intervalos do alfabeto são cortados nos caracteres que podem avançar a trie
+    # (os que viram um caractere das palavras com lower()), e cada um deles vira
+    # um símbolo próprio; nenhum caractere dos pedaços restantes avança a trie
+    keyword_chars = {char for word in reserved_words for char in word.lower()}
+    cut_codes = {code for code in range(ASCII_LIMIT) if chr(code).lower()[0] in keyword_chars}
+    cut_codes.update(ord(char) for char in keyword_chars)
+    if any(is_range_symbol(symbol) and symbol_range(symbol)[1] >= ASCII_LIMIT for symbol in dfa.alphabet):
+        lowercase_sources = _lowercase_sources()
+        for char in keyword_chars:
+            cut_codes.update(lowercase_sources.get(char, ()))
+    cut_codes = sorted(cut_codes)
+
+    def split_symbol(symbol):
+        if not is_range_symbol(symbol):
+            return [symbol]
+        low, high = symbol_range(symbol)
+        pieces = []
+        for code in cut_codes[bisect_left(cut_codes, low):bisect_right(cut_codes, high)]:
+            if code > low:
+                pieces.append(range_symbol(low, code - 1))
+            pieces.append(chr(code))
+            low = code + 1
+        if low <= high:
+            pieces.append(range_symbol(low, high))
+        return pieces
+
+    def advance_trie(node, symbol):
+        if is_range_symbol(symbol):
+            return None
+        for char in symbol.lower():
+            node = trie_edges[node].get(char)
+            if node is None:
+                return None
+        return node
+
+    pieces_of = {symbol: split_symbol(symbol) for symbol in dfa.alphabet}
+    symbols_by_state = {}
+    for (from_id, symbol), to_id in dfa.transitions.items():
+        symbols_by_state.setdefault(from_id, []).extend((piece, to_id) for piece in pieces_of[symbol])
+
+    folded_dfa = DFA()
+    folded_dfa.alphabet = {piece for pieces in pieces_of.values() for piece in pieces}
+    folded_ids = {}
+
+    def folded_id_of(pair):
+        if pair not in folded_ids:
+            folded_ids[pair] = len(folded_ids)
+            folded_dfa.states.add(folded_ids[pair])
+            worklist.append(pair)
+        return folded_ids[pair]
+
+    worklist = deque()
+    folded_dfa.start_state_id = folded_id_of((dfa.start_state_id, mode_trie_roots.get(INITIAL_MODE, 0)))
+    for mode, mode_start_state in dfa.mode_start_states.items():
+        folded_dfa.mode_start_states[mode] = folded_id_of((mode_start_state, mode_trie_roots.get(mode, 0)))
+    while worklist:
+        pair = worklist.popleft()
+        dfa_state, trie_node = pair
+        folded_id = folded_ids[pair]
+        pattern_name = dfa.accept_states.get(dfa_state)
+        if pattern_name is not None:
+            folded_dfa.set_accept_state(folded_id, pattern_name)
+            if trie_node in trie_words and pattern_name not in patterns_to_ignore:
+                folded_dfa.keyword_accept_states[folded_id] = trie_words[trie_node]
+        for symbol, to_state in sorted(symbols_by_state.get(dfa_state, ())):
+            next_node = advance_trie(trie_node, symbol) if trie_node is not None else None
+            folded_dfa.add_transition(folded_id, symbol, folded_id_of((to_state, next_node)))
+    return folded_dfa
+
+
+_lowercase_sources_cache = None
+
+def _lowercase_sources():
+    '''
+    Caracteres c com c.lower() != c, agrupados pelo primeiro caractere de
+    c.lower() (ex: 'K' e o sinal de Kelvin em 'k'). Construído uma vez.
+    '''
+    global _lowercase_sources_cache
+    if _lowercase_sources_cache is None:
+        sources = {}
+        for code in range(sys.maxunicode + 1):
+            char = chr(code)
+            lowered = char.lower()
+            if lowered != char:
+                sources.setdefault(lowered[0], []).append(code)
+        _lowercase_sources_cache = sources
+    return _lowercase_sources_cache
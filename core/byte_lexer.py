@@ -0,0 +1,175 @@
+import mmap
+import os
+from array import array
+from contextlib import contextmanager
+
+BYTE_ALPHABET_SIZE = 256
+# Último código de cada tamanho de codificação UTF-8 (1, 2, 3 e 4 bytes)
+UTF8_LENGTH_LIMITS = (0x7F, 0x7FF, 0xFFFF)
+SURROGATE_LOW = 0xD800
+SURROGATE_HIGH = 0xDFFF
+
+
+class ByteDFA:
+    '''
+    Compilação do AFD para consumir bytes UTF-8 em vez de caracteres.
+
+    Cada intervalo de caracteres de uma transição do CompiledDFA é expandido
+    nas sequências de intervalos de bytes UTF-8 que o codificam (ver
+    utf8_byte_ranges): os bytes iniciais passam por estados intermediários
+    (nunca de aceitação) e o último byte leva ao destino original. Os estados
+    intermediários formam uma trie por estado, e nós com as mesmas saídas são
+    compartilhados (inclusive entre estados), então classes grandes não geram
+    um estado por caractere. Como UTF-8 é livre de prefixo, os tokens sempre
+    terminam em fronteira de caractere.
+
+    As linhas da tabela têm 256 colunas e os destinos são guardados já
+    multiplicados por 256, então o laço faz apenas rows[estado + byte].
+    '''
+    def __init__(self, compiled_dfa, accept_labels=None, non_accepting=None):
+        num_classes = compiled_dfa.num_classes
+        # Rótulo de aceitação por estado (por padrão, o nome do padrão); os estados
+        # intermediários recebem o rótulo 'non_accepting'
+        accepts = list(accept_labels) if accept_labels is not None else list(compiled_dfa.accepts)
+        edges = [{} for _ in range(compiled_dfa.num_states)]
+        shared_nodes = {}
+
+        def add_node(trie):
+            # Sub-tries viram estados intermediários; destinos (int) ficam como estão
+            node_edges = {byte: child if isinstance(child, int) else add_node(child)
+                          for byte, child in trie.items()}
+            key = tuple(sorted(node_edges.items()))
+            node = shared_nodes.get(key)
+            if node is None:
+                node = len(accepts)
+                accepts.append(non_accepting)
+                edges.append(node_edges)
+                shared_nodes[key] = node
+            return node
+
+        def insert(trie, sequence, target):
+            low, high = sequence[0]
+            for byte in range(low, high + 1):
+                if len(sequence) == 1:
+                    trie[byte] = target
+                else:
+                    insert(trie.setdefault(byte, {}), sequence[1:], target)
+
+        for state in range(compiled_dfa.num_states):
+            trie = {}
+            for class_id in range(1, num_classes):
+                target = compiled_dfa.rows[state * num_classes + class_id]
+                if target < 0:
+                    continue
+                for low, high in compiled_dfa.class_ranges[class_id]:
+                    for sequence in utf8_byte_ranges(low, high):
+                        insert(trie, sequence, target)
+            edges[state] = {byte: child if isinstance(child, int) else add_node(child)
+                            for byte, child in trie.items()}
+
+        self.num_states = len(accepts)
+        self.accepts = accepts
+        self.start = compiled_dfa.start * BYTE_ALPHABET_SIZE
+        rows = array('i', [-1]) * (self.num_states * BYTE_ALPHABET_SIZE)
+        for node, node_edges in enumerate(edges):
+            row_offset = node * BYTE_ALPHABET_SIZE
+            for byte, target in node_edges.items():
+                rows[row_offset + byte] = target * BYTE_ALPHABET_SIZE
+        self.rows = rows
+
+
+def utf8_byte_ranges(low, high):
+    '''
+    Sequências de intervalos de bytes cuja união codifica, em UTF-8,
+    exatamente os caracteres de códigos [low, high] (surrogates, que não têm
+    codificação, são omitidos). Cada sequência é uma lista de (byte_min,
+    byte_max), um por byte da codificação.
+    Ex: (0x61, 0x7A) -> [[(0x61, 0x7A)]]
+    Ex: (0x7F, 0x80) -> [[(0x7F, 0x7F)], [(0xC2, 0xC2), (0x80, 0x80)]]
+    '''
+    sequences = []
+    pending = [(low, high)]
+    while pending:
+        low, high = pending.pop()
+        if low <= SURROGATE_HIGH and high >= SURROGATE_LOW:
+            if low < SURROGATE_LOW:
+                pending.append((low, SURROGATE_LOW - 1))
+            if high > SURROGATE_HIGH:
+                pending.append((SURROGATE_HIGH + 1, high))
+            continue
+        # Intervalos que mudam o tamanho da codificação são divididos
+        limit = next((limit for limit in UTF8_LENGTH_LIMITS if low <= limit < high), None)
+        if limit is not None:
+            pending.append((low, limit))
+            pending.append((limit + 1, high))
+            continue
+        # E também os que não cobrem bytes de continuação inteiros (6 bits cada)
+        split = None
+        for continuation_bytes in range(1, 4):
+            mask = (1 << (6 * continuation_bytes)) - 1
+            if low & ~mask != high & ~mask:
+                if low & mask:
+                    split = low | mask
+                elif high & mask != mask:
+                    split = (high & ~mask) - 1
+                if split is not None:
+                    break
+        if split is not None:
+            pending.append((low, split))
+            pending.append((split + 1, high))
+            continue
+        sequences.append(list(zip(chr(low).encode('utf-8'), chr(high).encode('utf-8'))))
+    return sorted(sequences)
+
+
+def utf8_sequence_length(lead_byte):
+    '''
+    Tamanho da sequência UTF-8 iniciada por 'lead_byte'. Bytes de continuação
+    ou inválidos contam como sequências de 1 byte.
+    '''
+    if lead_byte < 0xC0:
+        return 1
+    if lead_byte < 0xE0:
+        return 2
+    if lead_byte < 0xF0:
+        return 3
+    if lead_byte < 0xF8:
+        return 4
+    return 1
+
+
+def utf8_character_length(buffer, pos):
+    '''
+    Tamanho do caractere UTF-8 que começa em buffer[pos]: o byte inicial e os
+    bytes de continuação que o seguem, até o tamanho que ele anuncia. Uma
+    sequência truncada ou inválida para no primeiro byte que não é de
+    continuação, para não engolir o caractere seguinte.
+    '''
+    end = min(pos + utf8_sequence_length(buffer[pos]), len(buffer))
+    length = 1
+    while pos + length < end and 0x80 <= buffer[pos + length] < 0xC0:
+        length += 1
+    return length
+
+
+def decode_lexeme(buffer, offset, length):
+    '''
+    Decodifica sob demanda o lexema de um token (offset, length, tipo)
+    produzido por Lexer.tokenize_bytes.
+    '''
+    return bytes(buffer[offset:offset + length]).decode('utf-8', errors='replace')
+
+
+@contextmanager
+def mapped_file(path):
+    '''
+    Mapeia o arquivo em memória somente leitura para ser analisado por
+    Lexer.tokenize_bytes sem ler e decodificar o conteúdo inteiro.
+    Arquivos vazios (que mmap não aceita) viram um buffer vazio.
+    '''
+    with open(path, 'rb') as f_in:
+        if os.fstat(f_in.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
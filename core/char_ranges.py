@@ -0,0 +1,185 @@
+import re
+from bisect import bisect_left, bisect_right
+
+# Intervalos de caracteres como rótulos de transição.
+#
+# Uma classe como [a-z] não é mais expandida em (a|b|...|z): ela vira um único
+# token de classe ('[a-z]') na ER pré-processada, uma aresta por intervalo no
+# NFA e uma posição só na árvore sintática. O alfabeto dos AFDs é formado por
+# intervalos disjuntos ('a-e', 'f', 'g-z', ...), obtidos cortando os intervalos
+# de todos os rótulos nas suas fronteiras, então o tamanho do alfabeto depende
+# do número de fronteiras, e não do número de caracteres das classes.
+
+RANGE_SEPARATOR = '-'
+CLASS_TOKEN_OPEN = '['
+CLASS_TOKEN_CLOSE = ']'
+# Caracteres escapados com '\' dentro de um token de classe normalizado
+CLASS_TOKEN_ESCAPED = '\\[]-'
+
+
+def range_symbol(low, high):
+    '''
+    Símbolo do alfabeto para o intervalo de códigos [low, high]: o próprio
+    caractere se o intervalo é unitário, 'a-z' (três caracteres) senão.
+    '''
+    if low == high:
+        return chr(low)
+    return chr(low) + RANGE_SEPARATOR + chr(high)
+
+
+def is_range_symbol(symbol):
+    return len(symbol) == 3 and symbol[1] == RANGE_SEPARATOR
+
+
+def symbol_range(symbol):
+    '''
+    Intervalo de códigos (low, high) de um símbolo do alfabeto.
+    '''
+    if is_range_symbol(symbol):
+        return ord(symbol[0]), ord(symbol[2])
+    return ord(symbol), ord(symbol)
+
+
+def merge_ranges(ranges):
+    '''
+    Ordena e une intervalos sobrepostos ou adjacentes.
+    Ex: [(100, 120), (97, 99), (48, 57)] -> [(48, 57), (97, 120)]
+    '''
+    merged = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1] + 1:
+            if high > merged[-1][1]:
+                merged[-1] = (merged[-1][0], high)
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def _escape_class_char(code):
+    char = chr(code)
+    return '\\' + char if char in CLASS_TOKEN_ESCAPED else char
+
+
+def class_token(ranges):
+    '''
+    Token de classe normalizado para a lista de intervalos de códigos.
+    Ex: [(97, 122), (95, 95)] -> '[_a-z]'
+    '''
+    parts = []
+    for low, high in merge_ranges(ranges):
+        if low == high:
+            parts.append(_escape_class_char(low))
+        else:
+            parts.append(_escape_class_char(low) + RANGE_SEPARATOR + _escape_class_char(high))
+    return CLASS_TOKEN_OPEN + "".join(parts) + CLASS_TOKEN_CLOSE
+
+
+def is_class_token(token):
+    return len(token) > 2 and token[0] == CLASS_TOKEN_OPEN and token[-1] == CLASS_TOKEN_CLOSE
+
+
+def class_token_end(text, start):
+    '''
+    Posição logo após o ']' que fecha o token de classe iniciado em text[start].
+    '''
+    i = start + 1
+    while i < len(text):
+        if text[i] == '\\':
+            i += 2
+            continue
+        if text[i] == CLASS_TOKEN_CLOSE:
+            return i + 1
+        i += 1
+    raise ValueError(f"Unterminated character class token in '{text[start:]}'")
+
+
+def class_token_ranges(token):
+    '''
+    Intervalos de códigos de um token de classe produzido por class_token.
+    '''
+    chars = []
+    i = 1
+    content_end = len(token) - 1
+    while i < content_end:
+        if token[i] == '\\':
+            chars.append((token[i + 1], True))
+            i += 2
+        else:
+            chars.append((token[i], False))
+            i += 1
+    ranges = []
+    k = 0
+    while k < len(chars):
+        char, _ = chars[k]
+        if k + 2 < len(chars) and chars[k + 1] == (RANGE_SEPARATOR, False):
+            ranges.append((ord(char), ord(chars[k + 2][0])))
+            k += 3
+        else:
+            ranges.append((ord(char), ord(char)))
+            k += 1
+    return ranges
+
+
+def label_ranges(label):
+    '''
+    Intervalos de códigos de um rótulo de transição ou de posição: token de
+    classe, símbolo de intervalo ou caractere.
+    '''
+    if is_class_token(label):
+        return class_token_ranges(label)
+    return [symbol_range(label)]
+
+
+def elementary_ranges(ranges):
+    '''
+    Corta os intervalos nas fronteiras de todos eles: o resultado são
+    intervalos disjuntos e ordenados, e cada intervalo de entrada é a união
+    exata de alguns deles (ver covered_pieces).
+    '''
+    boundaries = sorted({low for low, _ in ranges} | {high + 1 for _, high in ranges})
+    covered = merge_ranges(ranges)
+    pieces = []
+    for low, next_low in zip(boundaries, boundaries[1:]):
+        index = bisect_right(covered, (low, float('inf'))) - 1
+        if index >= 0 and covered[index][1] >= low:
+            pieces.append((low, next_low - 1))
+    return pieces
+
+
+def covered_pieces(pieces, piece_lows, low, high):
+    '''
+    Peças de elementary_ranges contidas no intervalo [low, high], que deve ser
+    um dos intervalos usados para cortá-las ('piece_lows' são os inícios).
+    '''
+    return pieces[bisect_left(piece_lows, low):bisect_right(piece_lows, high)]
+
+
+def split_labels(labels):
+    '''
+    Alfabeto de símbolos disjuntos para um conjunto de rótulos possivelmente
+    sobrepostos (ex: 'a-z' e 'i'). Retorna os símbolos, em ordem de código, e
+    rótulo -> lista dos símbolos que ele cobre.
+    '''
+    ranges_by_label = {label: label_ranges(label) for label in labels}
+    pieces = elementary_ranges([r for ranges in ranges_by_label.values() for r in ranges])
+    piece_lows = [low for low, _ in pieces]
+    symbols_by_label = {}
+    for label, ranges in ranges_by_label.items():
+        symbols_by_label[label] = [range_symbol(low, high)
+                                   for range_low, range_high in ranges
+                                   for low, high in covered_pieces(pieces, piece_lows, range_low, range_high)]
+    return [range_symbol(low, high) for low, high in pieces], symbols_by_label
+
+
+def regex_char_class(ranges, negate=False):
+    '''
+    Classe de caracteres do módulo re equivalente aos intervalos de códigos
+    (ou ao seu complemento, com 'negate').
+    '''
+    parts = []
+    for low, high in merge_ranges(ranges):
+        if low == high:
+            parts.append(re.escape(chr(low)))
+        else:
+            parts.append(re.escape(chr(low)) + '-' + re.escape(chr(high)))
+    return ('[^' if negate else '[') + "".join(parts) + ']'
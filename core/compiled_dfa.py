@@ -0,0 +1,171 @@
+import re
+from array import array
+from bisect import bisect_right
+
+from .config import INITIAL_MODE
+from .char_ranges import is_range_symbol, symbol_range, range_symbol, merge_ranges, regex_char_class
+
+ASCII_LIMIT = 128
+DEAD_STATE = -1
+
+
+class RangeClassTable(dict):
+    '''
+    Caractere não ASCII -> classe. Os intervalos das classes ficam em listas
+    ordenadas e a classe de um caractere ainda não visto é achada por busca
+    binária e guardada no próprio dicionário, então o laço do lexer continua
+    fazendo um único acesso (table[char]) e classes grandes (ex: [一-龥]) não
+    precisam de uma entrada por caractere. Fora dos intervalos, a classe é 0.
+    '''
+    def __init__(self, ranges):
+        super().__init__()
+        ranges = sorted(ranges)
+        self.lows = [low for low, _, _ in ranges]
+        self.highs = [high for _, high, _ in ranges]
+        self.classes = [class_id for _, _, class_id in ranges]
+
+    def __missing__(self, char):
+        code = ord(char)
+        index = bisect_right(self.lows, code) - 1
+        class_id = self.classes[index] if index >= 0 and code <= self.highs[index] else 0
+        self[char] = class_id
+        return class_id
+
+
+class CompiledDFA:
+    '''
+    Forma de execução de um AFD (normalmente o minimizado), usada pelo
+    laço interno do Lexer no lugar do dicionário (estado, símbolo) -> estado.
+
+    Os estados são renumerados densamente (0..n-1) e os símbolos do alfabeto
+    são agrupados em classes de equivalência: dois caracteres pertencem à mesma
+    classe quando levam a exatamente os mesmos destinos a partir de todos os
+    estados. A classe 0 é reservada para caracteres fora do alfabeto.
+
+    A tabela de transições é um único array('i') plano, indexado por
+    estado * num_classes + classe, com DEAD_STATE onde não há transição.
+    Os símbolos do alfabeto podem ser intervalos ('a-z', ver char_ranges), e
+    class_ranges guarda os intervalos de códigos de cada classe. Caracteres
+    ASCII resolvem sua classe por indexação direta em ascii_classes; os demais
+    por char_classes[char] (ver RangeClassTable).
+    '''
+    def __init__(self, dfa):
+        state_ids = sorted(dfa.states)
+        index_of = {state_id: index for index, state_id in enumerate(state_ids)}
+
+        # Sem estado inicial válido, adiciona um estado morto para que o laço
+        # do lexer não precise tratar esse caso separadamente.
+        if dfa.start_state_id not in index_of:
+            index_of[dfa.start_state_id] = len(state_ids)
+            state_ids.append(dfa.start_state_id)
+
+        self.state_ids = state_ids
+        self.num_states = len(state_ids)
+        self.start = index_of[dfa.start_state_id]
+        # Estado inicial de cada condição de início (modo); sem modos, só INITIAL
+        self.mode_starts = {mode: index_of[state_id] for mode, state_id in dfa.mode_start_states.items()}
+        self.mode_starts.setdefault(INITIAL_MODE, self.start)
+        self.accepts = [dfa.accept_states.get(state_id) for state_id in state_ids]
+        # Tipo reservado dos estados que aceitam uma palavra reservada (ver fold_reserved_words)
+        self.keywords = [dfa.keyword_accept_states.get(state_id) for state_id in state_ids]
+
+        # Agrupa os símbolos pela coluna de destinos que produzem
+        columns = {}
+        for symbol in sorted(dfa.alphabet, key=symbol_range):
+            if len(symbol) != 1 and not is_range_symbol(symbol):
+                continue
+            column = tuple(index_of.get(dfa.transitions.get((state_id, symbol)), DEAD_STATE)
+                           for state_id in state_ids)
+            columns.setdefault(column, []).append(symbol)
+
+        self.num_classes = len(columns) + 1
+        self.class_symbols = [[]]
+        self.class_ranges = [[]]
+        rows = array('i', [DEAD_STATE]) * (self.num_states * self.num_classes)
+        for class_id, (column, symbols) in enumerate(columns.items(), start=1):
+            self.class_symbols.append(symbols)
+            self.class_ranges.append(merge_ranges(symbol_range(symbol) for symbol in symbols))
+            for state_index, target in enumerate(column):
+                rows[state_index * self.num_classes + class_id] = target
+        self.rows = rows
+        self._build_class_lookups()
+
+    @classmethod
+    def from_tables(cls, num_states, num_classes, start, rows, accepts, keywords, ranges, mode_starts):
+        '''
+        CompiledDFA direto das tabelas já densas de um AFD salvo (ver
+        dfa_serialization): 'rows' é um buffer int32 (array ou memoryview do
+        mmap, copiado de uma vez), 'ranges' os intervalos (low, high, classe)
+        e 'accepts'/'keywords' os nomes por estado. Não passa pelos
+        dicionários do DFA nem reagrupa as classes; as palavras reservadas já
+        vêm incorporadas nos estados (keywords).
+        '''
+        compiled = cls.__new__(cls)
+        compiled.state_ids = list(range(num_states))
+        compiled.num_states = num_states
+        compiled.start = start
+        compiled.mode_starts = dict(mode_starts)
+        compiled.mode_starts.setdefault(INITIAL_MODE, start)
+        compiled.accepts = list(accepts)
+        compiled.keywords = list(keywords)
+        compiled.num_classes = num_classes
+        compiled.class_ranges = [[] for _ in range(num_classes)]
+        for low, high, class_id in sorted(ranges):
+            compiled.class_ranges[class_id].append((low, high))
+        compiled.class_symbols = [[range_symbol(low, high) for low, high in class_ranges]
+                                  for class_ranges in compiled.class_ranges]
+        compiled.rows = array('i')
+        with memoryview(rows) as rows_view, rows_view.cast('B') as rows_bytes:
+            compiled.rows.frombytes(rows_bytes)
+        if len(compiled.rows) != num_states * num_classes:
+            raise ValueError(f"Transition table has {len(compiled.rows)} entries, "
+                             f"expected {num_states * num_classes}")
+        compiled._build_class_lookups()
+        return compiled
+
+    def _build_class_lookups(self):
+        '''
+        Consulta de classe por caractere (ascii_classes e char_classes) e
+        varredores dos laços, a partir de class_ranges e rows.
+        '''
+        self.ascii_classes = array('i', [0]) * ASCII_LIMIT
+        non_ascii_ranges = []
+        for class_id in range(1, self.num_classes):
+            for low, high in self.class_ranges[class_id]:
+                for code in range(low, min(high, ASCII_LIMIT - 1) + 1):
+                    self.ascii_classes[code] = class_id
+                if high >= ASCII_LIMIT:
+                    non_ascii_ranges.append((max(low, ASCII_LIMIT), high, class_id))
+        self.char_classes = RangeClassTable(non_ascii_ranges)
+
+        # Estados com laço sobre si mesmos (espaços, corpo de comentários e de
+        # strings, identificadores): o lexer atravessa a sequência inteira de
+        # caracteres do laço com um único match de regex, em vez de um por um
+        rows = self.rows
+        self.self_loop_scanners = []
+        for state in range(self.num_states):
+            loop_ranges = [char_range
+                           for class_id in range(1, self.num_classes)
+                           if rows[state * self.num_classes + class_id] == state
+                           for char_range in self.class_ranges[class_id]]
+            self.self_loop_scanners.append(
+                re.compile(regex_char_class(loop_ranges) + "*").match if loop_ranges else None)
+
+    def ranges_leaving(self, state):
+        '''
+        Intervalos de códigos (ordenados e disjuntos) dos caracteres com
+        transição a partir de 'state'.
+        '''
+        row_offset = state * self.num_classes
+        return merge_ranges(char_range
+                            for class_id in range(1, self.num_classes) if self.rows[row_offset + class_id] != DEAD_STATE
+                            for char_range in self.class_ranges[class_id])
+
+    def char_class(self, char):
+        code = ord(char)
+        if code < ASCII_LIMIT:
+            return self.ascii_classes[code]
+        return self.char_classes[char]
+
+    def next_state(self, state, char):
+        return self.rows[state * self.num_classes + self.char_class(char)]
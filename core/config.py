@@ -1,2 +1,5 @@
 EPSILON = '&'
-CONCAT_OP = '.'
\ No newline at end of file
+CONCAT_OP = '.'
+# Condição de início (modo) padrão do lexer e o curinga '<*>' (todos os modos)
+INITIAL_MODE = 'INITIAL'
+ALL_MODES = '*'
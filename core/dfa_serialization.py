@@ -0,0 +1,434 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+from .automata import DFA, fold_reserved_words
+from .char_ranges import range_symbol
+from .compiled_dfa import CompiledDFA, DEAD_STATE
+from .config import INITIAL_MODE
+from .lexer_core import (Lexer, attribute_converters_from_directives, mode_patterns_from_directives,
+                         mode_reserved_words, mode_switches_from_directives)
+
+# Formato versionado de AFD, carregável de volta num Lexer.
+#
+# Ao contrário do Anexo II (get_dfa_anexo_ii_format), guarda os nomes dos
+# padrões dos estados de aceitação, os tipos reservados, os estados iniciais
+# dos modos, as palavras reservadas, os padrões ignorados e, na ordem dos
+# padrões, as diretivas de cada um (modos, %begin, %attr), sem as quais um AFD
+# com modos não seria analisado corretamente. As transições são
+# gravadas na forma do CompiledDFA: estados densos (0..n-1), classes de
+# caracteres dadas por intervalos de códigos (classe 0 = fora do alfabeto) e
+# uma linha de destinos por estado, com DEAD_STATE onde não há transição.
+#
+# Há duas formas com o mesmo conteúdo: texto (uma linha por registro, no
+# formato '<registro> <array JSON>') e binária, em que as tabelas são arrays
+# int32 contíguos, usados direto do mmap do arquivo (MappedDFA), sem cópia.
+
+# Versão 3: as palavras reservadas vão incorporadas ao AFD (tipos reservados por estado)
+DFA_FORMAT_VERSION = 3
+DFA_TEXT_MAGIC = "LXDFA"
+DFA_BINARY_MAGIC = b"LXDB"
+# magic, versão, little-endian, estados, classes, estado inicial, intervalos,
+# modos, palavras reservadas, ignorados, padrões, strings, bytes do texto das strings
+DFA_BINARY_HEADER_FORMAT = "<4sBBxxqqqqqqqqqq"
+DFA_TEXT_SUFFIX = ".lxdfa"
+DFA_BINARY_SUFFIX = ".lxdfb"
+
+
+class DFATables:
+    '''
+    Conteúdo serializado de um AFD: linhas densas de transição por classe,
+    nomes de aceitação e tipos reservados por estado (None quando não há),
+    intervalos (low, high, classe) ordenados, modo -> estado inicial, palavras
+    reservadas, padrões ignorados, a ordem dos padrões e as diretivas de cada
+    um (como em parse_re_file_data).
+    '''
+    def __init__(self, num_states, num_classes, start, rows, accepts, keywords, ranges,
+                 mode_starts, reserved_words, patterns_to_ignore, pattern_order=None, pattern_directives=None):
+        self.num_states = num_states
+        self.num_classes = num_classes
+        self.start = start
+        self.rows = rows
+        self.accepts = accepts
+        self.keywords = keywords
+        self.ranges = ranges
+        self.mode_starts = mode_starts
+        self.reserved_words = reserved_words
+        self.patterns_to_ignore = patterns_to_ignore
+        self.pattern_order = pattern_order if pattern_order is not None else []
+        self.pattern_directives = pattern_directives if pattern_directives is not None else {}
+
+    @classmethod
+    def from_dfa(cls, dfa, reserved_words=None, patterns_to_ignore=None, pattern_order=None,
+                 pattern_directives=None):
+        '''
+        Sem 'pattern_order', os padrões são os nomes de aceitação e das
+        diretivas, em ordem alfabética. Um AFD com modos além de INITIAL exige
+        as diretivas de modo da especificação: sem elas o arquivo carregado
+        não saberia quando trocar de modo.
+        '''
+        pattern_directives = {name: dict(directives) for name, directives in (pattern_directives or {}).items()}
+        if (set(dfa.mode_start_states) - {INITIAL_MODE}
+                and not any("modes" in directives or "begin" in directives
+                            for directives in pattern_directives.values())):
+            raise ValueError(f"DFA has lexer modes ({', '.join(sorted(dfa.mode_start_states))}) but no mode "
+                             f"directives were given; pass the pattern_directives of its specification")
+        if pattern_order is None:
+            pattern_order = sorted(set(dfa.accept_states.values()) | set(pattern_directives))
+        # As palavras reservadas vão incorporadas ao AFD gravado (keywords), como
+        # no Lexer, para que load_lexer monte o CompiledDFA direto das tabelas
+        dfa = fold_reserved_words(dfa, reserved_words, patterns_to_ignore,
+                                  mode_reserved_words(reserved_words or {},
+                                                      mode_patterns_from_directives(pattern_order,
+                                                                                    pattern_directives)))
+        compiled = CompiledDFA(dfa)
+        ranges = sorted((low, high, class_id)
+                        for class_id in range(1, compiled.num_classes)
+                        for low, high in compiled.class_ranges[class_id])
+        return cls(compiled.num_states, compiled.num_classes, compiled.start, compiled.rows,
+                   compiled.accepts, compiled.keywords, ranges,
+                   {mode: compiled.mode_starts[mode] for mode in dfa.mode_start_states},
+                   dict(reserved_words or {}), set(patterns_to_ignore or ()),
+                   list(pattern_order), pattern_directives)
+
+    def compiled_dfa(self):
+        return CompiledDFA.from_tables(self.num_states, self.num_classes, self.start, self.rows, self.accepts,
+                                       self.keywords, self.ranges, self.mode_starts)
+
+    def to_dfa(self):
+        '''
+        AFD equivalente (estados 0..n-1, um símbolo de alfabeto por intervalo
+        de classe), pronto para o Lexer.
+        '''
+        dfa = DFA()
+        dfa.states = set(range(self.num_states))
+        dfa.start_state_id = self.start
+        dfa.mode_start_states = dict(self.mode_starts)
+        dfa.accept_states = {state: name for state, name in enumerate(self.accepts) if name is not None}
+        dfa.keyword_accept_states = {state: name for state, name in enumerate(self.keywords) if name is not None}
+        rows = self.rows
+        num_classes = self.num_classes
+        for low, high, class_id in self.ranges:
+            symbol = range_symbol(low, high)
+            dfa.alphabet.add(symbol)
+            for state in range(self.num_states):
+                target = rows[state * num_classes + class_id]
+                if target != DEAD_STATE:
+                    dfa.transitions[(state, symbol)] = target
+        return dfa
+
+
+def dfa_to_text(dfa, reserved_words=None, patterns_to_ignore=None, pattern_order=None, pattern_directives=None):
+    tables = DFATables.from_dfa(dfa, reserved_words, patterns_to_ignore, pattern_order, pattern_directives)
+    num_classes = tables.num_classes
+    lines = [f"{DFA_TEXT_MAGIC} {DFA_FORMAT_VERSION}",
+             f"states {json.dumps([tables.num_states, num_classes, tables.start])}"]
+    for low, high, class_id in tables.ranges:
+        lines.append(f"range {json.dumps([low, high, class_id])}")
+    for mode, state in sorted(tables.mode_starts.items()):
+        lines.append(f"mode {json.dumps([mode, state], ensure_ascii=False)}")
+    for state in range(tables.num_states):
+        if tables.accepts[state] is not None:
+            lines.append(f"accept {json.dumps([state, tables.accepts[state]], ensure_ascii=False)}")
+        if tables.keywords[state] is not None:
+            lines.append(f"keyword {json.dumps([state, tables.keywords[state]], ensure_ascii=False)}")
+    for word, token_type in sorted(tables.reserved_words.items()):
+        lines.append(f"reserved {json.dumps([word, token_type], ensure_ascii=False)}")
+    for name in sorted(tables.patterns_to_ignore):
+        lines.append(f"ignore {json.dumps([name], ensure_ascii=False)}")
+    for name in tables.pattern_order:
+        directives = tables.pattern_directives.get(name, {})
+        lines.append(f"pattern {json.dumps([name, directives], ensure_ascii=False, sort_keys=True)}")
+    for state in range(tables.num_states):
+        lines.append(f"row {json.dumps([state] + tables.rows[state * num_classes:(state + 1) * num_classes].tolist())}")
+    return "\n".join(lines) + "\n"
+
+
+def dfa_tables_from_text(text):
+    lines = text.splitlines()
+    if not lines or lines[0].split() != [DFA_TEXT_MAGIC, str(DFA_FORMAT_VERSION)]:
+        header = lines[0] if lines else ""
+        if header.startswith(DFA_TEXT_MAGIC):
+            raise ValueError(f"Unsupported DFA text format version in '{header}'")
+        raise ValueError("Not a DFA text file")
+    tables = None
+    for line_num, line in enumerate(lines[1:], start=2):
+        if not line:
+            continue
+        record, _, payload = line.partition(" ")
+        try:
+            values = json.loads(payload)
+        except ValueError as e:
+            raise ValueError(f"Malformed DFA record on line {line_num}: {e}")
+        if record == "states":
+            num_states, num_classes, start = values
+            tables = DFATables(num_states, num_classes, start, array('i', [DEAD_STATE]) * (num_states * num_classes),
+                               [None] * num_states, [None] * num_states, [], {}, {}, set())
+        elif tables is None:
+            raise ValueError(f"DFA record '{record}' on line {line_num} before 'states'")
+        elif record == "range":
+            tables.ranges.append(tuple(values))
+        elif record == "mode":
+            tables.mode_starts[values[0]] = values[1]
+        elif record == "accept":
+            tables.accepts[values[0]] = values[1]
+        elif record == "keyword":
+            tables.keywords[values[0]] = values[1]
+        elif record == "reserved":
+            tables.reserved_words[values[0]] = values[1]
+        elif record == "ignore":
+            tables.patterns_to_ignore.add(values[0])
+        elif record == "pattern":
+            tables.pattern_order.append(values[0])
+            if values[1]:
+                tables.pattern_directives[values[0]] = values[1]
+        elif record == "row":
+            state = values[0]
+            tables.rows[state * tables.num_classes:(state + 1) * tables.num_classes] = array('i', values[1:])
+        else:
+            raise ValueError(f"Unknown DFA record '{record}' on line {line_num}")
+    if tables is None:
+        raise ValueError("DFA text file has no 'states' record")
+    tables.ranges.sort()
+    return tables
+
+
+def save_dfa_binary(filepath, dfa, reserved_words=None, patterns_to_ignore=None, pattern_order=None,
+                    pattern_directives=None):
+    '''
+    Grava a forma binária: cabeçalho fixo, as seções int32 (linhas, aceitação
+    e tipo reservado por estado, intervalos, modos, palavras reservadas,
+    ignorados, padrões, tamanhos das strings) e o texto das strings em UTF-8.
+    Nomes são índices na tabela de strings (-1 = nenhum); as diretivas de cada
+    padrão são uma string JSON.
+    '''
+    tables = DFATables.from_dfa(dfa, reserved_words, patterns_to_ignore, pattern_order, pattern_directives)
+    strings = []
+    string_index = {}
+
+    def index_of(text):
+        if text is None:
+            return -1
+        if text not in string_index:
+            string_index[text] = len(strings)
+            strings.append(text)
+        return string_index[text]
+
+    sections = array('i', tables.rows)
+    sections.extend(index_of(name) for name in tables.accepts)
+    sections.extend(index_of(name) for name in tables.keywords)
+    for low, high, class_id in tables.ranges:
+        sections.extend((low, high, class_id))
+    for mode, state in sorted(tables.mode_starts.items()):
+        sections.extend((index_of(mode), state))
+    for word, token_type in sorted(tables.reserved_words.items()):
+        sections.extend((index_of(word), index_of(token_type)))
+    sections.extend(index_of(name) for name in sorted(tables.patterns_to_ignore))
+    for name in tables.pattern_order:
+        directives = tables.pattern_directives.get(name, {})
+        sections.extend((index_of(name), index_of(json.dumps(directives, ensure_ascii=False, sort_keys=True))))
+    sections.extend(len(text) for text in strings)
+
+    text_bytes = "".join(strings).encode('utf-8', 'surrogatepass')
+    header = struct.pack(DFA_BINARY_HEADER_FORMAT, DFA_BINARY_MAGIC, DFA_FORMAT_VERSION, sys.byteorder == 'little',
+                         tables.num_states, tables.num_classes, tables.start, len(tables.ranges),
+                         len(tables.mode_starts), len(tables.reserved_words), len(tables.patterns_to_ignore),
+                         len(tables.pattern_order), len(strings), len(text_bytes))
+    with open(filepath, 'wb') as f_out:
+        f_out.write(header)
+        f_out.write(sections.tobytes())
+        f_out.write(text_bytes)
+
+
+class MappedDFA:
+    '''
+    AFD binário mapeado em memória. 'rows', 'accept_ids', 'keyword_ids' e
+    'ranges' são memoryviews int32 sobre o próprio mmap (cópias só quando a
+    ordem de bytes do arquivo difere da máquina); só a tabela de strings é
+    decodificada. next_state consulta a tabela sem construir o AFD, e
+    to_dfa/tables o reconstroem para o Lexer. Use com 'with' ou chame close().
+    '''
+    def __init__(self, filepath):
+        with open(filepath, 'rb') as f_in:
+            self._mmap = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._map(filepath)
+        except Exception:
+            self.close()
+            raise
+
+    def _map(self, filepath):
+        view = memoryview(self._mmap)
+        self._views = [view]
+        header_size = struct.calcsize(DFA_BINARY_HEADER_FORMAT)
+        if len(view) < header_size:
+            raise ValueError(f"DFA file '{filepath}' is truncated")
+        (magic, version, little_endian, self.num_states, self.num_classes, self.start, num_ranges,
+         num_modes, num_reserved, num_ignored, num_patterns, num_strings,
+         text_size) = struct.unpack_from(DFA_BINARY_HEADER_FORMAT, view)
+        if magic != DFA_BINARY_MAGIC:
+            raise ValueError(f"'{filepath}' is not a binary DFA file")
+        if version != DFA_FORMAT_VERSION:
+            raise ValueError(f"Unsupported DFA format version {version} in '{filepath}'")
+        swap = bool(little_endian) != (sys.byteorder == 'little')
+
+        pos = header_size
+        section_views = []
+        for count in (self.num_states * self.num_classes, self.num_states, self.num_states, 3 * num_ranges,
+                      2 * num_modes, 2 * num_reserved, num_ignored, 2 * num_patterns, num_strings):
+            size = count * 4
+            if pos + size > len(view):
+                raise ValueError(f"DFA file '{filepath}' is truncated")
+            if swap:
+                values = array('i')
+                values.frombytes(view[pos:pos + size])
+                values.byteswap()
+                section = memoryview(values)
+            else:
+                section = view[pos:pos + size].cast('i')
+            self._views.append(section)
+            section_views.append(section)
+            pos += size
+        (self.rows, self.accept_ids, self.keyword_ids, self.ranges, modes, reserved, ignored, patterns,
+         lengths) = section_views
+        if pos + text_size != len(view):
+            raise ValueError(f"DFA file '{filepath}' is corrupted")
+
+        text = bytes(view[pos:pos + text_size]).decode('utf-8', 'surrogatepass')
+        self.strings = []
+        offset = 0
+        for length in lengths:
+            self.strings.append(text[offset:offset + length])
+            offset += length
+        strings = self.strings
+        self.mode_starts = {strings[modes[i]]: modes[i + 1] for i in range(0, len(modes), 2)}
+        self.reserved_words = {strings[reserved[i]]: strings[reserved[i + 1]] for i in range(0, len(reserved), 2)}
+        self.patterns_to_ignore = {strings[index] for index in ignored}
+        self.pattern_order = [strings[patterns[i]] for i in range(0, len(patterns), 2)]
+        self.pattern_directives = {}
+        for i in range(0, len(patterns), 2):
+            directives = json.loads(strings[patterns[i + 1]])
+            if directives:
+                self.pattern_directives[strings[patterns[i]]] = directives
+        self._range_lows = self.ranges[0::3]
+
+    def accept_name(self, state):
+        index = self.accept_ids[state]
+        return self.strings[index] if index >= 0 else None
+
+    def class_of(self, code):
+        index = bisect_right(self._range_lows, code) - 1
+        if index >= 0 and code <= self.ranges[3 * index + 1]:
+            return self.ranges[3 * index + 2]
+        return 0
+
+    def next_state(self, state, char):
+        return self.rows[state * self.num_classes + self.class_of(ord(char))]
+
+    def tables(self):
+        strings = self.strings
+        return DFATables(self.num_states, self.num_classes, self.start, self.rows,
+                         [strings[index] if index >= 0 else None for index in self.accept_ids],
+                         [strings[index] if index >= 0 else None for index in self.keyword_ids],
+                         [tuple(self.ranges[i:i + 3]) for i in range(0, len(self.ranges), 3)],
+                         dict(self.mode_starts), dict(self.reserved_words), set(self.patterns_to_ignore),
+                         list(self.pattern_order), {name: dict(directives)
+                                                    for name, directives in self.pattern_directives.items()})
+
+    def to_dfa(self):
+        return self.tables().to_dfa()
+
+    def compiled_dfa(self):
+        '''
+        CompiledDFA pronto para o Lexer, montado direto das seções mapeadas (a
+        tabela de transições é copiada do mmap de uma vez), sem reconstruir o
+        AFD nem seus dicionários.
+        '''
+        strings = self.strings
+        ranges = self.ranges.tolist()
+        return CompiledDFA.from_tables(self.num_states, self.num_classes, self.start, self.rows,
+                                       [strings[index] if index >= 0 else None for index in self.accept_ids],
+                                       [strings[index] if index >= 0 else None for index in self.keyword_ids],
+                                       zip(ranges[0::3], ranges[1::3], ranges[2::3]), self.mode_starts)
+
+    def close(self):
+        for view in reversed(getattr(self, "_views", [])):
+            view.release()
+        self._views = []
+        self._range_lows = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+def save_dfa(filepath, dfa, reserved_words=None, patterns_to_ignore=None, pattern_order=None,
+             pattern_directives=None):
+    '''
+    Grava na forma binária se o caminho termina em DFA_BINARY_SUFFIX, em texto senão.
+    '''
+    if filepath.endswith(DFA_BINARY_SUFFIX):
+        save_dfa_binary(filepath, dfa, reserved_words, patterns_to_ignore, pattern_order, pattern_directives)
+        return
+    with open(filepath, 'w', encoding='utf-8', newline='\n') as f_out:
+        f_out.write(dfa_to_text(dfa, reserved_words, patterns_to_ignore, pattern_order, pattern_directives))
+
+
+def load_dfa(filepath):
+    '''
+    Carrega um AFD salvo por save_dfa (texto ou binário, reconhecido pelo
+    conteúdo). Retorna (AFD, palavras reservadas, padrões ignorados, ordem
+    dos padrões, diretivas por padrão), as duas últimas como em
+    parse_re_file_data. O AFD já tem as palavras reservadas incorporadas
+    (keyword_accept_states), como gravado por save_dfa.
+    '''
+    with open(filepath, 'rb') as f_in:
+        magic = f_in.read(len(DFA_BINARY_MAGIC))
+    if magic == DFA_BINARY_MAGIC:
+        with MappedDFA(filepath) as mapped:
+            tables = mapped.tables()
+            tables.rows = array('i', tables.rows)
+    else:
+        with open(filepath, 'r', encoding='utf-8') as f_in:
+            tables = dfa_tables_from_text(f_in.read())
+    return (tables.to_dfa(), tables.reserved_words, tables.patterns_to_ignore, tables.pattern_order,
+            tables.pattern_directives)
+
+
+def load_compiled_dfa(filepath):
+    '''
+    Como load_dfa, mas com o CompiledDFA no lugar do AFD.
+    '''
+    with open(filepath, 'rb') as f_in:
+        magic = f_in.read(len(DFA_BINARY_MAGIC))
+    if magic == DFA_BINARY_MAGIC:
+        with MappedDFA(filepath) as mapped:
+            return (mapped.compiled_dfa(), dict(mapped.reserved_words), set(mapped.patterns_to_ignore),
+                    list(mapped.pattern_order), mapped.pattern_directives)
+    with open(filepath, 'r', encoding='utf-8') as f_in:
+        tables = dfa_tables_from_text(f_in.read())
+    return (tables.compiled_dfa(), tables.reserved_words, tables.patterns_to_ignore, tables.pattern_order,
+            tables.pattern_directives)
+
+
+def load_lexer(filepath, symbol_table_instance=None, **lexer_options):
+    '''
+    Lexer de um AFD salvo por save_dfa, com os modos, trocas de modo (%begin)
+    e conversores de atributo (%attr) das diretivas gravadas. 'lexer_options'
+    vai para o construtor (ex: linear_time, coalesce_errors). O CompiledDFA é
+    montado direto das tabelas gravadas (ver CompiledDFA.from_tables), sem
+    passar pelo AFD de load_dfa.
+    '''
+    compiled_dfa, reserved_words, patterns_to_ignore, pattern_order, pattern_directives = load_compiled_dfa(filepath)
+    return Lexer(compiled_dfa, reserved_words, patterns_to_ignore, symbol_table_instance,
+                 attribute_converters=attribute_converters_from_directives(pattern_directives),
+                 mode_patterns=mode_patterns_from_directives(pattern_order, pattern_directives),
+                 mode_switches=mode_switches_from_directives(pattern_directives), **lexer_options)
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+
+from .dfa_serialization import DFA_BINARY_SUFFIX, save_dfa_binary, load_dfa
+
+# Cache em disco dos lexers compilados, endereçado pelo conteúdo.
+#
+# A chave é o SHA-256 da saída normalizada de parse_re_file_data (definições na
+# ordem dos padrões, palavras reservadas, padrões ignorados e diretivas) junto
+# com o método de construção, então dois .re que só diferem em comentários,
+# linhas vazias ou espaços caem na mesma entrada. Cada entrada é um AFD binário
+# de dfa_serialization (save_dfa_binary), com o AFD minimizado, as palavras
+# reservadas, os padrões ignorados, a ordem dos padrões e as diretivas; o
+# tamanho total do diretório é limitado e, quando passa do limite, as entradas
+# usadas há mais tempo (mtime) são apagadas.
+
+# Entra na chave: muda quando o conteúdo das entradas muda
+LEXER_CACHE_VERSION = 2
+LEXER_CACHE_SUFFIX = DFA_BINARY_SUFFIX
+# Na raiz do projeto, e não no diretório corrente, para que o cache seja o mesmo
+# qualquer que seja o diretório de onde a aplicação é iniciada
+DEFAULT_LEXER_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lexer_cache")
+DEFAULT_LEXER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def lexer_cache_key(definitions, pattern_order, reserved_words, patterns_to_ignore, pattern_directives, method):
+    '''
+    Chave da entrada de cache para a saída de parse_re_file_data e o método de
+    construção ("thompson" ou "tree_direct_dfa").
+    '''
+    normalized = {
+        "version": LEXER_CACHE_VERSION,
+        "method": method,
+        "definitions": [[name, definitions[name]] for name in pattern_order],
+        "reserved_words": sorted(reserved_words.items()),
+        "ignore": sorted(patterns_to_ignore),
+        "directives": pattern_directives,
+    }
+    text = json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class LexerCache:
+    '''
+    Diretório de entradas '<chave>.lxdfb' com tamanho total limitado a
+    'max_bytes'. Uma leitura bem-sucedida atualiza o mtime da entrada, que é a
+    ordem de uso considerada na remoção (LRU); entradas ilegíveis são apagadas
+    e tratadas como ausentes.
+    '''
+    def __init__(self, cache_dir=DEFAULT_LEXER_CACHE_DIR, max_bytes=DEFAULT_LEXER_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key + LEXER_CACHE_SUFFIX)
+
+    def get(self, key):
+        '''
+        Entrada como em load_dfa (AFD minimizado, palavras reservadas, padrões
+        ignorados, ordem dos padrões, diretivas), ou None se ela não existe.
+        '''
+        filepath = self.entry_path(key)
+        try:
+            entry = load_dfa(filepath)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, UnicodeDecodeError, IndexError):
+            self._remove(filepath)
+            return None
+        try:
+            os.utime(filepath)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, dfa, reserved_words, patterns_to_ignore, pattern_order, pattern_directives):
+        '''
+        Grava a entrada (num arquivo temporário renomeado no fim, para que uma
+        leitura concorrente nunca veja um arquivo pela metade) e aplica o
+        limite de tamanho.
+        '''
+        os.makedirs(self.cache_dir, exist_ok=True)
+        filepath = self.entry_path(key)
+        temp_path = f"{filepath}.{os.getpid()}.tmp"
+        try:
+            save_dfa_binary(temp_path, dfa, reserved_words, patterns_to_ignore, pattern_order, pattern_directives)
+            os.replace(temp_path, filepath)
+        finally:
+            self._remove(temp_path)
+        self.evict(keep=filepath)
+
+    def evict(self, keep=None):
+        '''
+        Apaga as entradas usadas há mais tempo até o total caber em max_bytes;
+        'keep' (a entrada recém-gravada) nunca é apagada.
+        '''
+        entries = []
+        total_size = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(LEXER_CACHE_SUFFIX):
+                continue
+            filepath = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, filepath, stat.st_size))
+            total_size += stat.st_size
+        entries.sort()
+        for _, filepath, size in entries:
+            if total_size <= self.max_bytes:
+                break
+            if filepath == keep:
+                continue
+            self._remove(filepath)
+            total_size -= size
+
+    def clear(self):
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.endswith(LEXER_CACHE_SUFFIX):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    @staticmethod
+    def _remove(filepath):
+        try:
+            os.remove(filepath)
+        except OSError:
+            pass
@@ -0,0 +1,394 @@
+import inspect
+
+from .automata import fold_reserved_words
+from .char_ranges import merge_ranges, regex_char_class
+from .compiled_dfa import CompiledDFA
+from .config import INITIAL_MODE
+from .lexer_core import (SymbolTable, DEFAULT_INTERNED_TYPES, SYMBOL_TABLE_MAGIC,
+                         SYMBOL_TABLE_VERSION, SYMBOL_TABLE_HEADER_FORMAT)
+from .token_arrays import DEFAULT_ATTRIBUTE_CONVERTERS, number_attribute, resolve_attribute_converter
+
+# Acima disso a seleção do estado vira uma árvore de comparações binárias
+STATE_DISPATCH_CHAIN_LIMIT = 4
+# Estados com mais destinos que isso usam um dicionário literal caractere -> destino
+DICT_DISPATCH_MIN_TARGETS = 4
+# Sequências de caracteres consecutivos a partir desse tamanho viram intervalos
+MIN_RANGE_LENGTH = 3
+# Intervalos maiores que isso não entram no dicionário NEXT_n: são testados
+# por comparação quando o caractere não está no dicionário
+MAX_DICT_RANGE_LENGTH = 64
+# Máximo de blocos de estado embutidos um dentro do outro (ver _inlined_states),
+# abaixo do limite de indentação do Python
+MAX_INLINE_DEPTH = 16
+
+
+def _char_test(ranges, var="c"):
+    '''
+    Expressão Python que testa se 'var' pertence aos intervalos de códigos
+    'ranges', usando comparações de intervalo e um literal de string para os
+    avulsos.
+    '''
+    tests = []
+    singles = []
+    for low, high in merge_ranges(ranges):
+        if high - low + 1 >= MIN_RANGE_LENGTH:
+            tests.append(f"{chr(low)!r} <= {var} <= {chr(high)!r}")
+        else:
+            singles.extend(chr(code) for code in range(low, high + 1))
+    if len(singles) == 1:
+        tests.append(f"{var} == {singles[0]!r}")
+    elif singles:
+        tests.append(f"{var} in {''.join(singles)!r}")
+    return " or ".join(tests)
+
+
+def _state_targets(compiled_dfa, state):
+    '''
+    Destino -> intervalos de códigos que levam a ele a partir de 'state'.
+    '''
+    targets = {}
+    for class_id in range(1, compiled_dfa.num_classes):
+        target = compiled_dfa.rows[state * compiled_dfa.num_classes + class_id]
+        if target >= 0:
+            targets.setdefault(target, []).extend(compiled_dfa.class_ranges[class_id])
+    return {target: merge_ranges(ranges) for target, ranges in targets.items()}
+
+
+def _large_ranges(targets):
+    '''
+    Destino -> intervalos grandes demais para o dicionário NEXT_n.
+    '''
+    large = {}
+    for target, ranges in targets.items():
+        for low, high in ranges:
+            if high - low + 1 > MAX_DICT_RANGE_LENGTH:
+                large.setdefault(target, []).append((low, high))
+    return large
+
+
+def _inlined_states(compiled_dfa, table_names):
+    '''
+    Estados cujo bloco é embutido no ramo do único estado que leva a eles,
+    lendo o próximo caractere ali mesmo, sem voltar à seleção do estado
+    corrente (_state_dispatch). São os caminhos em forma de árvore do AFD,
+    como as tries das palavras reservadas e dos operadores, que em
+    especificações grandes têm centenas de estados: sem isso, cada caractere
+    de uma palavra reservada pagaria a busca binária sobre todos eles.
+
+    Não são embutidos o estado inicial, estados com laço sobre si mesmos (o
+    laço volta à seleção), destinos de estados com dicionário NEXT_n e
+    estados que ficariam a mais de MAX_INLINE_DEPTH níveis de um estado
+    selecionado.
+    '''
+    targets_by_state = [_state_targets(compiled_dfa, state) for state in range(compiled_dfa.num_states)]
+    predecessors = {}
+    for state, targets in enumerate(targets_by_state):
+        for target in targets:
+            if target != state:
+                predecessors.setdefault(target, set()).add(state)
+    candidates = {target for target, sources in predecessors.items()
+                  if len(sources) == 1 and target != compiled_dfa.start and target not in targets_by_state[target]
+                  and not sources & table_names.keys()}
+
+    inlined = set()
+    pending = [(state, 0) for state in range(compiled_dfa.num_states) if state not in candidates]
+    while pending:
+        state, depth = pending.pop()
+        for target in targets_by_state[state]:
+            if target in candidates:
+                if depth < MAX_INLINE_DEPTH:
+                    inlined.add(target)
+                    pending.append((target, depth + 1))
+                else:
+                    pending.append((target, 0))
+    return inlined
+
+
+def _state_block(compiled_dfa, state, indent, table_names, inlined=frozenset()):
+    '''
+    Código do passo do AFD para um estado: testes de caractere por destino,
+    com laço apertado para o auto-laço e atualização do último aceite (o
+    estado de aceitação, de onde saem o padrão e a palavra reservada).
+    Estados com muitos destinos (tipicamente o inicial) usam um dicionário
+    literal caractere -> destino em vez de uma cadeia longa de testes.
+    Os destinos em 'inlined' têm o bloco embutido no ramo da transição.
+    '''
+    pad = " " * indent
+    targets = _state_targets(compiled_dfa, state)
+    lines = []
+
+    if state in table_names:
+        lines.append(f"{pad}next_state = {table_names[state]}.get(c)")
+        lines.append(f"{pad}if next_state is None:")
+        large = _large_ranges(targets)
+        keyword = "if"
+        for target in sorted(large):
+            lines.append(f"{pad}    {keyword} {_char_test(large[target])}:")
+            lines.append(f"{pad}        next_state = {target}")
+            keyword = "elif"
+        if large:
+            lines.append(f"{pad}    else:")
+            lines.append(f"{pad}        break")
+        else:
+            lines.append(f"{pad}    break")
+        lines.append(f"{pad}state = next_state")
+        lines.append(f"{pad}if ACCEPTS[state] is not None:")
+        lines.append(f"{pad}    last_end = i + 1")
+        lines.append(f"{pad}    last_accept = state")
+        return lines
+
+    keyword = "if"
+    # O auto-laço vem primeiro: é o caminho mais quente (espaços, corpos de identificadores, ...).
+    # Depois, os testes mais baratos: numa trie de palavras reservadas, o próximo
+    # caractere da palavra é testado antes da classe inteira dos identificadores
+    for target in sorted(targets, key=lambda t: (t != state, len(targets[t]), t)):
+        test = _char_test(targets[target])
+        lines.append(f"{pad}{keyword} {test}:")
+        accepted_pattern = compiled_dfa.accepts[target]
+        if target == state:
+            lines.append(f"{pad}    i += 1")
+            lines.append(f"{pad}    while i < n:")
+            lines.append(f"{pad}        c = src[i]")
+            lines.append(f"{pad}        if not ({test}):")
+            lines.append(f"{pad}            break")
+            lines.append(f"{pad}        i += 1")
+            if accepted_pattern is not None:
+                lines.append(f"{pad}    last_end = i")
+                lines.append(f"{pad}    last_accept = {target}")
+            lines.append(f"{pad}    continue")
+        else:
+            if accepted_pattern is not None:
+                lines.append(f"{pad}    last_end = i + 1")
+                lines.append(f"{pad}    last_accept = {target}")
+            if target in inlined:
+                lines.append(f"{pad}    i += 1")
+                lines.append(f"{pad}    if i == n:")
+                lines.append(f"{pad}        break")
+                lines.append(f"{pad}    c = src[i]")
+                lines.extend(_state_block(compiled_dfa, target, indent + 4, table_names, inlined))
+            else:
+                lines.append(f"{pad}    state = {target}")
+        keyword = "elif"
+    if lines:
+        lines.append(f"{pad}else:")
+        lines.append(f"{pad}    break")
+    else:
+        lines.append(f"{pad}break")
+    return lines
+
+
+def _state_dispatch(compiled_dfa, states, indent, table_names, inlined):
+    '''
+    Seleção do bloco do estado corrente: cadeia de if/elif para poucos
+    estados, busca binária sobre o número do estado para muitos.
+    '''
+    pad = " " * indent
+    lines = []
+    if len(states) == 1:
+        return _state_block(compiled_dfa, states[0], indent, table_names, inlined)
+    if len(states) <= STATE_DISPATCH_CHAIN_LIMIT:
+        for position, state in enumerate(states):
+            if position == 0:
+                lines.append(f"{pad}if state == {state}:")
+            elif position < len(states) - 1:
+                lines.append(f"{pad}elif state == {state}:")
+            else:
+                lines.append(f"{pad}else:")
+            lines.extend(_state_block(compiled_dfa, state, indent + 4, table_names, inlined))
+        return lines
+    middle = len(states) // 2
+    lines.append(f"{pad}if state < {states[middle]}:")
+    lines.extend(_state_dispatch(compiled_dfa, states[:middle], indent + 4, table_names, inlined))
+    lines.append(f"{pad}else:")
+    lines.extend(_state_dispatch(compiled_dfa, states[middle:], indent + 4, table_names, inlined))
+    return lines
+
+
+def _converter_sources(converters_by_type):
+    '''
+    Código das funções conversoras usadas, para embutir no módulo gerado.
+    Só funções de módulo (sem lambdas) podem ser embutidas, e devem depender
+    apenas de number_attribute, que é sempre incluída.
+    '''
+    functions = {"number_attribute": number_attribute}
+    for token_type, converter in converters_by_type.items():
+        name = converter.__name__
+        if name == "<lambda>":
+            raise ValueError(f"Attribute converter for '{token_type}' must be a named function to be embedded")
+        if functions.setdefault(name, converter) is not converter:
+            raise ValueError(f"Two different attribute converters are named '{name}'")
+    lines = []
+    for function in functions.values():
+        lines.extend(["", ""])
+        lines.extend(inspect.getsource(function).splitlines())
+    return lines
+
+
+def _converters_literal(converters_by_type):
+    items = ", ".join(f"{token_type!r}: {converter.__name__}" for token_type, converter in sorted(converters_by_type.items()))
+    return "{" + items + "}"
+
+
+def generate_lexer_module(dfa, reserved_words=None, patterns_to_ignore=None, attribute_converters=None,
+                          coalesce_errors=False):
+    '''
+    Gera o código-fonte de um módulo Python independente com um analisador
+    léxico especializado para 'dfa' (normalmente o AFD minimizado). Os estados
+    viram blocos de código e os testes de classe de caractere viram literais,
+    então importar o módulo não constrói nenhum NFA/AFD. O módulo expõe
+    tokenize(source_code, symbol_table=None), com a mesma saída de
+    Lexer.tokenize (ou de Lexer(..., coalesce_errors=True) com
+    'coalesce_errors'); os conversores de atributo são embutidos e rodam em lote.
+
+    O módulo usa o maximal munch padrão, sem o modo linear_time do Lexer, e
+    não suporta condições de início: um AFD com modos além de INITIAL é
+    recusado com ValueError. Em especificações grandes, os caminhos em árvore
+    (como as palavras reservadas em minúsculas) são embutidos e não pagam a
+    seleção do estado a cada caractere; estados alcançados por vários
+    caminhos (ex: palavras reservadas escritas em maiúsculas) continuam
+    passando pela busca binária e podem ficar mais lentos que a tabela do Lexer.
+    '''
+    if set(dfa.mode_start_states) - {INITIAL_MODE}:
+        raise ValueError("Generated lexer modules do not support lexer modes (start conditions)")
+    explicit_converters = {token_type: resolve_attribute_converter(converter)
+                           for token_type, converter in (attribute_converters or {}).items()}
+    default_converters = {token_type: resolve_attribute_converter(converter)
+                          for token_type, converter in DEFAULT_ATTRIBUTE_CONVERTERS.items()}
+    reserved_words = dict(reserved_words) if reserved_words else {}
+    patterns_to_ignore = set(patterns_to_ignore) if patterns_to_ignore else set()
+    compiled_dfa = CompiledDFA(fold_reserved_words(dfa, reserved_words, patterns_to_ignore))
+    start_state = compiled_dfa.start
+
+    lines = [
+        "# Módulo gerado automaticamente por core/lexer_codegen.py a partir de um AFD minimizado.",
+        "# Não edite: gere novamente a partir das definições regulares.",
+        "",
+    ]
+    if coalesce_errors:
+        lines.append("import re")
+    lines.extend([
+        "import struct",
+        "import sys",
+        "from array import array",
+        "",
+        f"DEFAULT_INTERNED_TYPES = {DEFAULT_INTERNED_TYPES!r}",
+        f"SYMBOL_TABLE_MAGIC = {SYMBOL_TABLE_MAGIC!r}",
+        f"SYMBOL_TABLE_VERSION = {SYMBOL_TABLE_VERSION!r}",
+        f"SYMBOL_TABLE_HEADER_FORMAT = {SYMBOL_TABLE_HEADER_FORMAT!r}",
+        f"PATTERNS_TO_IGNORE = frozenset({sorted(patterns_to_ignore)!r})",
+        f"ACCEPTS = {tuple(compiled_dfa.accepts)!r}",
+        f"KEYWORDS = {tuple(compiled_dfa.keywords)!r}",
+    ])
+    if coalesce_errors:
+        # Como em Lexer(coalesce_errors=True): o erro vai até o próximo caractere
+        # capaz de iniciar um token
+        start_ranges = compiled_dfa.ranges_leaving(start_state)
+        skip_pattern = regex_char_class(start_ranges, negate=True) + "*" if start_ranges else "(?s:.*)"
+        lines.append(f"SKIP_TO_TOKEN_START = re.compile({skip_pattern!r}).match")
+    table_names = {}
+    for state in range(compiled_dfa.num_states):
+        targets = _state_targets(compiled_dfa, state)
+        if len(targets) > DICT_DISPATCH_MIN_TARGETS:
+            table_names[state] = f"NEXT_{state}"
+            next_by_char = {chr(code): target
+                            for target, ranges in targets.items()
+                            for low, high in ranges if high - low + 1 <= MAX_DICT_RANGE_LENGTH
+                            for code in range(low, high + 1)}
+            lines.append(f"NEXT_{state} = {dict(sorted(next_by_char.items()))!r}")
+    lines.extend(_converter_sources({**default_converters, **explicit_converters}))
+    lines.extend([
+        "",
+        "",
+        f"CONVERTERS = {_converters_literal(explicit_converters)}",
+        f"DEFAULT_CONVERTERS = {_converters_literal(default_converters)}",
+        "",
+        "",
+    ])
+    lines.extend(inspect.getsource(SymbolTable).splitlines())
+
+    # O estado inicial é testado antes da seleção dos demais: todo token passa por ele.
+    # Os estados embutidos nunca são o estado corrente no início de um passo
+    inlined = _inlined_states(compiled_dfa, table_names)
+    other_states = [state for state in range(compiled_dfa.num_states)
+                    if state != start_state and state not in inlined]
+    lines.extend([
+        "",
+        "",
+        "def tokenize(source_code, symbol_table=None):",
+        "    if symbol_table is None:",
+        "        symbol_table = SymbolTable()",
+        "    interned_types = symbol_table.interned_types",
+        "    converters = {token_type: converter for token_type, converter in DEFAULT_CONVERTERS.items()",
+        "                  if token_type not in interned_types}",
+        "    converters.update(CONVERTERS)",
+        "    pending_conversions = {}",
+        "    tokens_output_list = []",
+        "    src = source_code",
+        "    n = len(src)",
+        "    pos = 0",
+        "    while pos < n:",
+        f"        state = {start_state}",
+        "        i = pos",
+    ])
+    if compiled_dfa.accepts[start_state] is not None:
+        lines.append("        last_end = pos")
+        lines.append(f"        last_accept = {start_state}")
+    else:
+        lines.append("        last_end = -1")
+        lines.append("        last_accept = -1")
+    lines.append("        while i < n:")
+    lines.append("            c = src[i]")
+    if other_states:
+        lines.append(f"            if state == {start_state}:")
+        lines.extend(_state_block(compiled_dfa, start_state, 16, table_names, inlined))
+        lines.append("            else:")
+        lines.extend(_state_dispatch(compiled_dfa, other_states, 16, table_names, inlined))
+    else:
+        lines.extend(_state_block(compiled_dfa, start_state, 12, table_names, inlined))
+    lines.append("            i += 1")
+    lines.extend([
+        "        if last_accept < 0:",
+        "            error_end = SKIP_TO_TOKEN_START(src, pos + 1).end()" if coalesce_errors else
+        "            error_end = pos + 1",
+        "            failing_text = src[pos:error_end]",
+        "            tokens_output_list.append((failing_text, 'ERRO!', failing_text))",
+        "            pos = error_end",
+        "            continue",
+        "        last_pattern = ACCEPTS[last_accept]",
+        "        if last_pattern in PATTERNS_TO_IGNORE:",
+        "            pos = last_end if last_end > pos else pos + 1",
+        "            continue",
+        "        if last_end == pos:",
+        "            tokens_output_list.append((src[pos:pos+1], 'ERRO!', f'Zero-length match by {last_pattern} at pos {pos}'))",
+        "            pos += 1",
+        "            continue",
+        "        lexeme = src[pos:last_end]",
+        "        keyword = KEYWORDS[last_accept]",
+        "        if keyword is not None:",
+        "            tokens_output_list.append((lexeme, keyword, None))",
+        "        elif last_pattern in converters:",
+        "            token_indexes, lexemes = pending_conversions.setdefault(last_pattern, ([], []))",
+        "            token_indexes.append(len(tokens_output_list))",
+        "            lexemes.append(lexeme)",
+        "            tokens_output_list.append(None)",
+        "        elif last_pattern in interned_types:",
+        "            tokens_output_list.append((lexeme, last_pattern, symbol_table.add_symbol(lexeme, last_pattern)))",
+        "        else:",
+        "            tokens_output_list.append((lexeme, last_pattern, lexeme))",
+        "        pos = last_end",
+        "    # Conversão em lote dos atributos, uma chamada por tipo de token",
+        "    for token_type, (token_indexes, lexemes) in pending_conversions.items():",
+        "        for token_index, lexeme, attribute in zip(token_indexes, lexemes, converters[token_type](lexemes)):",
+        "            tokens_output_list[token_index] = (lexeme, token_type, attribute)",
+        "    return tokens_output_list, symbol_table",
+        "",
+    ])
+    return "\n".join(lines)
+
+
+def write_lexer_module(filepath, dfa, reserved_words=None, patterns_to_ignore=None, attribute_converters=None,
+                       coalesce_errors=False):
+    source = generate_lexer_module(dfa, reserved_words, patterns_to_ignore, attribute_converters, coalesce_errors)
+    with open(filepath, 'w', encoding='utf-8') as f_out:
+        f_out.write(source)
+    return filepath
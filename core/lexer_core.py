@@ -1,7 +1,68 @@
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import accumulate, compress
+from operator import not_
+
+from .automata import fold_reserved_words
+from .config import INITIAL_MODE, ALL_MODES
+from .compiled_dfa import CompiledDFA
+from .byte_lexer import ByteDFA, BYTE_ALPHABET_SIZE, utf8_character_length, utf8_byte_ranges
+from .char_ranges import regex_char_class
+from .token_arrays import (TokenArrays, ERROR_TOKEN_TYPE, ERROR_TYPE_ID, ATTRIBUTE_ERROR,
+                           ATTRIBUTE_LEXEME, ATTRIBUTE_SYMBOL, ATTRIBUTE_CONVERTED, ATTRIBUTE_NONE,
+                           DEFAULT_ATTRIBUTE_CONVERTERS, resolve_attribute_converter)
+
+DEFAULT_STREAM_CHUNK_SIZE = 64 * 1024
+DEFAULT_PARALLEL_CHUNK_SIZE = 1024 * 1024
+# Documentos por tarefa enviada ao pool em Lexer.tokenize_many
+DEFAULT_BATCH_SIZE = 256
+# Diretiva '%attr=<conversor>' de uma definição regular (ver token_arrays.ATTRIBUTE_CONVERTERS)
+ATTR_DIRECTIVE_PATTERN = re.compile(r"\s%attr=(\w+)")
+# Prefixo '<MODO1,MODO2>' (ou '<*>') de uma definição e diretiva '%begin=<modo>'
+MODE_PREFIX_PATTERN = re.compile(r"<\s*(\*|\w+(?:\s*,\s*\w+)*)\s*>")
+BEGIN_DIRECTIVE_PATTERN = re.compile(r"\s%begin=(\w+)")
+# Tipos de token cujos lexemas são internados na tabela de símbolos
+DEFAULT_INTERNED_TYPES = ("ID",)
+
+# Formato binário de SymbolTable.save/load: magic, versão, ordem de bytes,
+# entradas, tipos e tamanhos (em bytes) dos nomes, dos tipos internados e da arena
+SYMBOL_TABLE_MAGIC = b"LXST"
+SYMBOL_TABLE_VERSION = 1
+SYMBOL_TABLE_HEADER_FORMAT = "<4sBBxxqqqqq"
+
+
 class SymbolTable:
-    def __init__(self):
-        self.table = []
+    '''
+    Tabela de símbolos compacta. Os lexemas internados ficam concatenados numa
+    única string (a arena) e cada entrada é só (offset, tamanho, id do tipo) em
+    arrays tipados, sem um dicionário por entrada.
+
+    Só são internados os tipos de token em 'interned_types' (por padrão, ID);
+    operadores, pontuação e palavras reservadas não entram na tabela. A tabela
+    não é limpa por Lexer.tokenize, então várias análises (ex: os arquivos de um
+    projeto) constroem uma única tabela; save/load a gravam num formato binário
+    que é carregado sem reprocessar entrada por entrada.
+    '''
+    def __init__(self, interned_types=DEFAULT_INTERNED_TYPES):
+        self.interned_types = frozenset(interned_types)
+        self.offsets = array('q')
+        self.lengths = array('q')
+        self.type_ids = array('i')
+        self.type_names = []
+        self.type_name_to_id = {}
         self.lexeme_to_index = {}
+        self._arena = ""
+        # Lexemas internados depois da última consolidação da arena
+        self._pending_lexemes = []
+        self._arena_length = 0
+
+    def __len__(self):
+        return len(self.offsets)
 
     def add_symbol(self, lexeme, token_type):
         """
@@ -9,41 +70,146 @@ class SymbolTable:
         If the lexeme already exists, its existing index is returned.
         Assumes the lexer resolves a lexeme to a single definitive token_type.
         """
-        if lexeme not in self.lexeme_to_index:
-            index = len(self.table)
-            entry = {"lexeme": lexeme, "token_type": token_type}
-            self.table.append(entry)
-            self.lexeme_to_index[lexeme] = index
+        index = self.lexeme_to_index.get(lexeme)
+        if index is not None:
             return index
-        return self.lexeme_to_index[lexeme]
+        index = len(self.offsets)
+        type_id = self.type_name_to_id.get(token_type)
+        if type_id is None:
+            type_id = len(self.type_names)
+            self.type_names.append(token_type)
+            self.type_name_to_id[token_type] = type_id
+        self.offsets.append(self._arena_length)
+        self.lengths.append(len(lexeme))
+        self.type_ids.append(type_id)
+        self._pending_lexemes.append(lexeme)
+        self._arena_length += len(lexeme)
+        self.lexeme_to_index[lexeme] = index
+        return index
+
+    def arena(self):
+        if self._pending_lexemes:
+            self._arena += "".join(self._pending_lexemes)
+            self._pending_lexemes.clear()
+        return self._arena
+
+    def lexeme(self, index):
+        offset = self.offsets[index]
+        return self.arena()[offset:offset + self.lengths[index]]
+
+    def token_type(self, index):
+        return self.type_names[self.type_ids[index]]
 
     def get_symbol_entry(self, index):
-        if 0 <= index < len(self.table):
-            return self.table[index]
+        if 0 <= index < len(self.offsets):
+            return {"lexeme": self.lexeme(index), "token_type": self.token_type(index)}
         return None
 
     def get_index(self, lexeme):
         return self.lexeme_to_index.get(lexeme)
 
     def clear(self):
-        self.table.clear()
+        del self.offsets[:]
+        del self.lengths[:]
+        del self.type_ids[:]
+        self.type_names.clear()
+        self.type_name_to_id.clear()
         self.lexeme_to_index.clear()
+        self._arena = ""
+        self._pending_lexemes.clear()
+        self._arena_length = 0
+
+    def save(self, filepath):
+        '''
+        Grava a tabela: cabeçalho fixo, nomes dos tipos, arrays em bytes e a
+        arena em UTF-8 (os offsets são em caracteres da arena decodificada).
+        '''
+        arena_bytes = self.arena().encode('utf-8')
+        names_bytes = "\n".join(self.type_names).encode('utf-8')
+        interned_bytes = "\n".join(sorted(self.interned_types)).encode('utf-8')
+        header = struct.pack(SYMBOL_TABLE_HEADER_FORMAT, SYMBOL_TABLE_MAGIC, SYMBOL_TABLE_VERSION,
+                             sys.byteorder == 'little', len(self.offsets), len(self.type_names),
+                             len(names_bytes), len(interned_bytes), len(arena_bytes))
+        with open(filepath, 'wb') as f_out:
+            f_out.write(header)
+            f_out.write(names_bytes)
+            f_out.write(interned_bytes)
+            f_out.write(self.offsets.tobytes())
+            f_out.write(self.lengths.tobytes())
+            f_out.write(self.type_ids.tobytes())
+            f_out.write(arena_bytes)
+
+    @classmethod
+    def load(cls, filepath):
+        with open(filepath, 'rb') as f_in:
+            data = f_in.read()
+        header_size = struct.calcsize(SYMBOL_TABLE_HEADER_FORMAT)
+        if len(data) < header_size:
+            raise ValueError(f"Symbol table file '{filepath}' is truncated")
+        (magic, version, little_endian, num_entries, num_types,
+         names_size, interned_size, arena_size) = struct.unpack_from(SYMBOL_TABLE_HEADER_FORMAT, data)
+        if magic != SYMBOL_TABLE_MAGIC:
+            raise ValueError(f"'{filepath}' is not a symbol table file")
+        if version != SYMBOL_TABLE_VERSION:
+            raise ValueError(f"Unsupported symbol table version {version} in '{filepath}'")
+
+        view = memoryview(data)
+        pos = header_size
+        names_text = bytes(view[pos:pos + names_size]).decode('utf-8')
+        pos += names_size
+        interned_text = bytes(view[pos:pos + interned_size]).decode('utf-8')
+        pos += interned_size
+
+        symbol_table = cls(interned_text.split("\n") if interned_text else ())
+        for field, typecode in (("offsets", 'q'), ("lengths", 'q'), ("type_ids", 'i')):
+            values = array(typecode)
+            field_size = num_entries * values.itemsize
+            values.frombytes(view[pos:pos + field_size])
+            if bool(little_endian) != (sys.byteorder == 'little'):
+                values.byteswap()
+            setattr(symbol_table, field, values)
+            pos += field_size
+        symbol_table._arena = bytes(view[pos:pos + arena_size]).decode('utf-8')
+        # A arena é a concatenação dos lexemas na ordem das entradas
+        type_ids = symbol_table.type_ids
+        if (pos + arena_size != len(data) or len(symbol_table._arena) != sum(symbol_table.lengths)
+                or list(symbol_table.offsets) != list(accumulate(symbol_table.lengths, initial=0))[:-1]
+                or type_ids and (min(type_ids) < 0 or max(type_ids) >= num_types)):
+            raise ValueError(f"Symbol table file '{filepath}' is corrupted")
+        symbol_table._arena_length = len(symbol_table._arena)
+
+        symbol_table.type_names = names_text.split("\n") if num_types else []
+        symbol_table.type_name_to_id = {name: type_id for type_id, name in enumerate(symbol_table.type_names)}
+        arena = symbol_table._arena
+        symbol_table.lexeme_to_index = {arena[offset:offset + length]: index for index, (offset, length)
+                                        in enumerate(zip(symbol_table.offsets, symbol_table.lengths))}
+        return symbol_table
 
     def __str__(self):
-        if not self.table:
+        if not self.offsets:
             return "Tabela de Símbolos (Dinâmica) vazia."
         header = f"{'Índice':<7} | {'Lexema':<20} | {'Tipo':<15}\n" + "-"*47
         rows = [header]
-        for i, entry in enumerate(self.table):
-            rows.append(f"{i:<7} | {entry['lexeme']:<20} | {entry['token_type']:<15}")
+        for i in range(len(self.offsets)):
+            rows.append(f"{i:<7} | {self.lexeme(i):<20} | {self.token_type(i):<15}")
         return "\n".join(rows)
 
 
 def parse_re_file_data(re_file_content):
+    '''
+    Lê as definições regulares. Retorna (definições, ordem dos padrões, palavras
+    reservadas, padrões ignorados, diretivas por padrão); as diretivas vêm de
+    '%attr=<conversor>' na linha da definição, ex: {"NUM": {"attr": "number"}},
+    e das condições de início no estilo do flex: o prefixo '<MODO,...>' limita
+    o padrão a esses modos ({"modes": [...]}) e '%begin=<modo>' troca de modo
+    quando ele casa ({"begin": "<modo>"}).
+    Ex: <STR>STR_END: " %begin=INITIAL
+    '''
     definitions = {}
     pattern_order = []
     reserved_words_defs = {}
     patterns_to_ignore = set()
+    pattern_directives = {}
 
     for line_num, line in enumerate(re_file_content.splitlines()):
         line = line.strip()
@@ -56,6 +222,24 @@ def parse_re_file_data(re_file_content):
             line = line.replace(directive_ignore, "").strip()
             should_ignore = True
 
+        modes = None
+        mode_prefix = MODE_PREFIX_PATTERN.match(line)
+        if mode_prefix:
+            line = line[mode_prefix.end():].strip()
+            modes = [mode.strip() for mode in mode_prefix.group(1).split(",")]
+
+        begin_mode = None
+        directive_begin = BEGIN_DIRECTIVE_PATTERN.search(line)
+        if directive_begin:
+            line = (line[:directive_begin.start()] + line[directive_begin.end():]).strip()
+            begin_mode = directive_begin.group(1)
+
+        attribute_converter = None
+        directive_attr = ATTR_DIRECTIVE_PATTERN.search(line)
+        if directive_attr:
+            line = (line[:directive_attr.start()] + line[directive_attr.end():]).strip()
+            attribute_converter = directive_attr.group(1)
+
         if ':' not in line:
             print(f"Warning: Malformed line {line_num+1} (no ':'): '{line}'. Skipping.")
             continue
@@ -77,113 +261,1071 @@ def parse_re_file_data(re_file_content):
 
         if should_ignore:
             patterns_to_ignore.add(name)
+        if attribute_converter:
+            pattern_directives.setdefault(name, {})["attr"] = attribute_converter
+        if modes:
+            pattern_directives.setdefault(name, {})["modes"] = modes
+        if begin_mode:
+            pattern_directives.setdefault(name, {})["begin"] = begin_mode
 
         is_likely_reserved = name.isupper() and name.lower() == regex
         if is_likely_reserved:
             reserved_words_defs[regex] = name
 
-    return definitions, pattern_order, reserved_words_defs, patterns_to_ignore
+    return definitions, pattern_order, reserved_words_defs, patterns_to_ignore, pattern_directives
+
+
+def attribute_converters_from_directives(pattern_directives):
+    return {name: directives["attr"] for name, directives in pattern_directives.items() if "attr" in directives}
+
+
+def mode_patterns_from_directives(pattern_order, pattern_directives):
+    '''
+    Condições de início (modos) -> padrões ativos nelas, na ordem de prioridade.
+    Como as condições exclusivas do flex: padrões sem prefixo ficam só no modo
+    INITIAL e '<*>' vale para todos os modos. Retorna None quando o .re não usa
+    modos (o AFD tem então um único estado inicial).
+    '''
+    if not any("modes" in directives or "begin" in directives for directives in pattern_directives.values()):
+        return None
+    modes = [INITIAL_MODE]
+    for name in pattern_order:
+        directives = pattern_directives.get(name, {})
+        for mode in directives.get("modes", []) + [directives.get("begin", INITIAL_MODE)]:
+            if mode != ALL_MODES and mode not in modes:
+                modes.append(mode)
+
+    mode_patterns = {}
+    for mode in modes:
+        mode_patterns[mode] = []
+        for name in pattern_order:
+            pattern_modes = pattern_directives.get(name, {}).get("modes", [INITIAL_MODE])
+            if mode in pattern_modes or ALL_MODES in pattern_modes:
+                mode_patterns[mode].append(name)
+        if not mode_patterns[mode]:
+            raise ValueError(f"Lexer mode '{mode}' has no patterns")
+    return mode_patterns
+
+
+def mode_switches_from_directives(pattern_directives):
+    return {name: directives["begin"] for name, directives in pattern_directives.items() if "begin" in directives}
+
+
+def mode_reserved_words(reserved_words, mode_patterns):
+    '''
+    Modo -> palavras reservadas válidas nele: as dos padrões ativos no modo
+    (palavras sem padrão de mesmo nome valem em todos os modos).
+    '''
+    if not mode_patterns:
+        return None
+    all_pattern_names = {name for pattern_names in mode_patterns.values() for name in pattern_names}
+    return {mode: {word: token_type for word, token_type in reserved_words.items()
+                   if token_type in pattern_names or token_type not in all_pattern_names}
+            for mode, pattern_names in mode_patterns.items()}
 
 
 class Lexer:
-    def __init__(self, dfa, reserved_words=None, patterns_to_ignore=None, symbol_table_instance=None):
+    def __init__(self, dfa, reserved_words=None, patterns_to_ignore=None, symbol_table_instance=None,
+                 linear_time=False, attribute_converters=None, coalesce_errors=False, mode_patterns=None,
+                 mode_switches=None):
         self.dfa = dfa
         self.reserved_words = reserved_words if reserved_words else {}
         self.patterns_to_ignore = patterns_to_ignore if patterns_to_ignore else set()
-        self.symbol_table = symbol_table_instance if symbol_table_instance else SymbolTable()
+        # Tipo de token -> conversor de atributo em lote (nome registrado ou função)
+        self.attribute_converters = attribute_converters if attribute_converters else {}
+        self.symbol_table = symbol_table_instance if symbol_table_instance is not None else SymbolTable()
+        # Condições de início (ver mode_patterns_from_directives): modo -> padrões
+        # ativos nele, que limitam as palavras reservadas do modo, e padrão -> modo
+        # em que a análise continua depois que ele casa (diretiva %begin)
+        self.mode_patterns = mode_patterns
+        self.mode_switches = mode_switches if mode_switches else {}
+        # Tabela de transições compilada uma única vez, usada no laço interno, com
+        # as palavras reservadas incorporadas como estados de aceitação próprios.
+        # Um CompiledDFA (ex: o de load_lexer) já vem com elas e é usado como está
+        if isinstance(dfa, CompiledDFA):
+            self.compiled_dfa = dfa
+        else:
+            self.compiled_dfa = CompiledDFA(fold_reserved_words(dfa, self.reserved_words, self.patterns_to_ignore,
+                                                                mode_reserved_words(self.reserved_words,
+                                                                                    self.mode_patterns)))
+        # Modo de maximal munch com tempo linear garantido (memoização de pares que falham)
+        self.linear_time = linear_time
+        # Recuperação de erros em bloco: uma sequência de caracteres não reconhecidos
+        # vira um único token de erro, que vai até o próximo caractere capaz de
+        # iniciar um token (os que têm transição a partir do estado inicial do modo)
+        self.coalesce_errors = coalesce_errors
+        self._skip_to_token_start_by_state = {}
+        self._skip_to_token_start_bytes_by_state = {}
+        if coalesce_errors:
+            for start_state in set(self.compiled_dfa.mode_starts.values()):
+                start_ranges = self.compiled_dfa.ranges_leaving(start_state)
+                self._skip_to_token_start_by_state[start_state] = re.compile(
+                    regex_char_class(start_ranges, negate=True) + "*" if start_ranges else "(?s:.*)").match
+                # Em tokenize_bytes, pelos bytes iniciais da codificação UTF-8 desses caracteres
+                start_bytes = sorted({byte
+                                      for low, high in start_ranges
+                                      for sequence in utf8_byte_ranges(low, high)
+                                      for byte in range(sequence[0][0], sequence[0][1] + 1)})
+                self._skip_to_token_start_bytes_by_state[start_state] = re.compile(
+                    b"[^" + b"".join(re.escape(bytes([byte])) for byte in start_bytes) + b"]*"
+                    if start_bytes else b"(?s:.*)").match
+        self._skip_to_token_start = self._skip_to_token_start_by_state.get(self.compiled_dfa.start)
+        self._skip_to_token_start_bytes = self._skip_to_token_start_bytes_by_state.get(self.compiled_dfa.start)
+        # Versão em bytes do AFD, construída só quando tokenize_bytes é usado
+        self._byte_dfa = None
+        self._build_token_types()
+
+    def _build_token_types(self):
+        '''
+        Numera os tipos de token da saída colunar: erro (id 0), os padrões que
+        aparecem em estados de aceitação e os tipos das palavras reservadas,
+        estes com id próprio porque seu atributo é sempre nulo. Cada estado do
+        AFD compilado recebe o id do tipo que aceita (-1 se não aceita), já
+        resolvido para palavra reservada quando for o caso.
+
+        O atributo de um padrão vem do conversor declarado para ele (que tem
+        precedência), do índice na tabela de símbolos se o tipo é internado, do
+        conversor padrão do tipo (ex: NUM) ou, por fim, do próprio lexema.
+        '''
+        self.token_type_names = [ERROR_TOKEN_TYPE]
+        self.attribute_kinds = [ATTRIBUTE_ERROR]
+        self._ignored_types = [False]
+        self._type_converters = {}
+        self._pattern_type_ids = {}
+        for pattern_name in self.compiled_dfa.accepts:
+            if pattern_name is None or pattern_name in self._pattern_type_ids:
+                continue
+            self._pattern_type_ids[pattern_name] = len(self.token_type_names)
+            self.token_type_names.append(pattern_name)
+            self._ignored_types.append(pattern_name in self.patterns_to_ignore)
+            converter = self.attribute_converters.get(pattern_name)
+            if converter is None and pattern_name not in self.symbol_table.interned_types:
+                converter = DEFAULT_ATTRIBUTE_CONVERTERS.get(pattern_name)
+            if converter is not None:
+                self._type_converters[self._pattern_type_ids[pattern_name]] = resolve_attribute_converter(converter)
+                self.attribute_kinds.append(ATTRIBUTE_CONVERTED)
+            elif pattern_name in self.symbol_table.interned_types:
+                self.attribute_kinds.append(ATTRIBUTE_SYMBOL)
+            else:
+                self.attribute_kinds.append(ATTRIBUTE_LEXEME)
+
+        reserved_type_ids = {}
+        for token_type in sorted(set(self.reserved_words.values())):
+            reserved_type_ids[token_type] = len(self.token_type_names)
+            self.token_type_names.append(token_type)
+            self._ignored_types.append(False)
+            self.attribute_kinds.append(ATTRIBUTE_NONE)
+
+        self._accept_type_ids = array('i', [-1]) * self.compiled_dfa.num_states
+        for state, pattern_name in enumerate(self.compiled_dfa.accepts):
+            keyword_type = self.compiled_dfa.keywords[state]
+            if keyword_type is not None:
+                self._accept_type_ids[state] = reserved_type_ids[keyword_type]
+            elif pattern_name is not None:
+                self._accept_type_ids[state] = self._pattern_type_ids[pattern_name]
+
+        # Estado inicial em que a análise continua depois de um token de cada tipo
+        # (padrões com %begin, e as palavras reservadas deles); -1 mantém o modo
+        self._mode_switch_states = array('i', [-1]) * len(self.token_type_names)
+        for type_id, type_name in enumerate(self.token_type_names):
+            mode = self.mode_switches.get(type_name)
+            if mode is None:
+                continue
+            if mode not in self.compiled_dfa.mode_starts:
+                raise ValueError(f"Unknown lexer mode '{mode}' in %begin of '{type_name}'")
+            self._mode_switch_states[type_id] = self.compiled_dfa.mode_starts[mode]
 
     def tokenize(self, source_code):
-        self.symbol_table.clear()
+        '''
+        Lista de tuplas (lexema, tipo, atributo) e a tabela de símbolos, com os
+        mesmos tokens de tokenize_columnar. As tuplas são montadas direto no
+        laço de análise, sem passar pelas colunas; só os atributos dos tipos com
+        conversor são calculados no fim, numa chamada por tipo.
+        '''
         tokens_output_list = []
+        token_arrays = TokenArrays(source_code, self.token_type_names, self.attribute_kinds, self._type_converters)
+        self._scan_documents(token_arrays, source_code, (len(source_code),), (self.symbol_table,), tokens_output_list)
+        return tokens_output_list, self.symbol_table
+
+    def tokenize_columnar(self, source_code, symbol_table=None):
+        '''
+        Analisa 'source_code' preenchendo arrays paralelos (TokenArrays) com
+        início, tamanho, id do tipo e slot de atributo de cada token, sem criar
+        tuplas nem atributos por token. Os símbolos vão para 'symbol_table'
+        quando informada, ou para a tabela do lexer.
+        '''
+        if symbol_table is None:
+            symbol_table = self.symbol_table
+        token_arrays = TokenArrays(source_code, self.token_type_names, self.attribute_kinds, self._type_converters)
+        self._scan_documents(token_arrays, source_code, (len(source_code),), (symbol_table,))
+        return token_arrays, symbol_table
+
+    def _scan_documents(self, token_arrays, source_code, document_ends, symbol_tables, tokens_output_list=None):
+        '''
+        Laço de análise de tokenize_columnar. 'source_code' pode ser a
+        concatenação de vários documentos, que terminam nas posições de
+        'document_ends': nenhuma varredura passa do fim do seu documento, e os
+        símbolos de cada um vão para a tabela correspondente em 'symbol_tables'.
+        Retorna, por documento, o número de tokens em 'token_arrays' ao fim dele.
+
+        Com 'tokens_output_list' (caminho de tokenize), os tokens são
+        acrescentados a ela como tuplas (lexema, tipo, atributo) em vez de irem
+        para as colunas de 'token_arrays', que fica vazio. Os dois formatos só
+        se separam na emissão de um token reconhecido; os erros passam por
+        append_error, escolhida uma vez antes do laço. (Montar as tuplas a
+        partir das colunas, com TokenArrays.to_tuples, custa cerca de 25% a
+        mais que a análise colunar, contra ~0% deste caminho direto; ver
+        check_tuple_overhead em benchmarks.py.)
+        '''
+        append_start = token_arrays.starts.append
+        append_length = token_arrays.lengths.append
+        append_type_id = token_arrays.type_ids.append
+        append_attribute = token_arrays.attributes.append
+        append_reach = token_arrays.reaches.append
+        ignored_types = self._ignored_types
+        attribute_kinds = self.attribute_kinds
+        token_type_names = self.token_type_names
+
+        rows = self.compiled_dfa.rows
+        num_classes = self.compiled_dfa.num_classes
+        ascii_classes = self.compiled_dfa.ascii_classes
+        char_classes = self.compiled_dfa.char_classes
+        accept_type_ids = self._accept_type_ids
+        num_states = self.compiled_dfa.num_states
+        self_loop_scanners = self.compiled_dfa.self_loop_scanners
+        mode_switch_states = self._mode_switch_states
+        skip_to_token_start_by_state = self._skip_to_token_start_by_state
+        # Pares (estado, posição) que sabidamente não levam a aceite, no modo linear
+        failed_pairs = set() if self.linear_time else None
+
+        emit_tuples = tokens_output_list is not None
+        if emit_tuples:
+            append_token = tokens_output_list.append
+            # Tokens de tipos com conversor: índice na lista e id do tipo, para
+            # preencher os atributos em lote depois da análise
+            converted_indexes = array('q')
+            converted_type_ids = array('i')
+
+            def append_error(start, end, zero_length_type_id, reach):
+                if zero_length_type_id >= 0:
+                    append_token((source_code[start:end], ERROR_TOKEN_TYPE,
+                                  f"Zero-length match by {token_type_names[zero_length_type_id]} at pos {start}"))
+                else:
+                    lexeme = source_code[start:end]
+                    append_token((lexeme, ERROR_TOKEN_TYPE, lexeme))
+        else:
+            def append_error(start, end, zero_length_type_id, reach):
+                append_start(start)
+                append_length(end - start)
+                append_type_id(ERROR_TYPE_ID)
+                append_attribute(zero_length_type_id)
+                append_reach(reach)
 
         pos = 0
-        source_len = len(source_code)
+        # Maior posição examinada por alguma varredura até aqui (ver tokenize_incremental)
+        reach = 0
 
-        while pos < source_len:
-            current_dfa_state = self.dfa.start_state_id
-            start_pos_for_token = pos
+        document_token_ends = array('q')
+        for source_len, symbol_table in zip(document_ends, symbol_tables):
+            add_symbol = symbol_table.add_symbol
+            # Todo documento começa no modo INITIAL
+            start_state = self.compiled_dfa.start
+            skip_to_token_start = self._skip_to_token_start
+            while pos < source_len:
+                current_dfa_state = start_state
+                start_pos_for_token = pos
 
-            last_match_end_pos = -1
-            last_match_lexeme = ""
-            base_pattern_name_from_dfa = None
+                last_match_end_pos = -1
+                matched_type_id = -1
 
-            temp_read_pos = pos
+                temp_read_pos = pos
 
-            # Consome entrada e avança sobre os estados do automato
-            # Quando chega a um estado de aceitação, anota que passou por ele
-            while temp_read_pos < source_len:
-                char_to_read = source_code[temp_read_pos]
+                # Consome entrada e avança sobre os estados do automato
+                # Quando chega a um estado de aceitação, anota só a posição e o tipo
+                # (já resolvido para palavra reservada pelo próprio estado); o lexema
+                # só é fatiado para os tipos internados na tabela de símbolos
+                if failed_pairs is None:
+                    while temp_read_pos < source_len:
+                        char_to_read = source_code[temp_read_pos]
 
-                if current_dfa_state in self.dfa.accept_states:
-                    last_match_end_pos = temp_read_pos
-                    last_match_lexeme = source_code[start_pos_for_token : temp_read_pos]
-                    base_pattern_name_from_dfa = self.dfa.accept_states[current_dfa_state]
+                        accepted_type_id = accept_type_ids[current_dfa_state]
+                        if accepted_type_id >= 0:
+                            last_match_end_pos = temp_read_pos
+                            matched_type_id = accepted_type_id
 
-                if (current_dfa_state, char_to_read) in self.dfa.transitions:
-                    current_dfa_state = self.dfa.transitions[(current_dfa_state, char_to_read)]
-                    temp_read_pos += 1
+                        # Classe do caractere: indexação direta para ASCII, dicionário para o resto
+                        char_code = ord(char_to_read)
+                        char_class = ascii_classes[char_code] if char_code < 128 else char_classes[char_to_read]
+                        next_dfa_state = rows[current_dfa_state * num_classes + char_class]
+                        if next_dfa_state < 0:
+                            break
+                        if next_dfa_state == current_dfa_state:
+                            # Laço do estado sobre si mesmo: pula a sequência inteira de uma vez
+                            temp_read_pos = self_loop_scanners[current_dfa_state](source_code, temp_read_pos + 1,
+                                                                                  source_len).end()
+                            continue
+                        current_dfa_state = next_dfa_state
+                        temp_read_pos += 1
                 else:
-                    break
-            
-            if temp_read_pos > start_pos_for_token and current_dfa_state in self.dfa.accept_states:
-                last_match_end_pos = temp_read_pos
-                last_match_lexeme = source_code[start_pos_for_token : temp_read_pos]
-                base_pattern_name_from_dfa = self.dfa.accept_states[current_dfa_state]
+                    # Modo linear (tabulação de Reps): um par (estado, posição) visitado depois
+                    # do último aceite de uma varredura não alcança aceite nenhum, e como o AFD é
+                    # determinístico isso vale para qualquer início de token. Esses pares são
+                    # memorizados e encerram varreduras futuras, então cada par é percorrido
+                    # no máximo uma vez depois do último aceite.
+                    visited_pairs = []
+                    first_failing_pair = 0
+                    while temp_read_pos < source_len:
+                        pair = temp_read_pos * num_states + current_dfa_state
+                        if pair in failed_pairs:
+                            break
+                        visited_pairs.append(pair)
+                        char_to_read = source_code[temp_read_pos]
+
+                        accepted_type_id = accept_type_ids[current_dfa_state]
+                        if accepted_type_id >= 0:
+                            last_match_end_pos = temp_read_pos
+                            matched_type_id = accepted_type_id
+                            first_failing_pair = len(visited_pairs)
+
+                        char_code = ord(char_to_read)
+                        char_class = ascii_classes[char_code] if char_code < 128 else char_classes[char_to_read]
+                        next_dfa_state = rows[current_dfa_state * num_classes + char_class]
+                        if next_dfa_state < 0:
+                            break
+                        current_dfa_state = next_dfa_state
+                        temp_read_pos += 1
+                    if temp_read_pos == source_len and accept_type_ids[current_dfa_state] >= 0:
+                        first_failing_pair = len(visited_pairs)
+                    failed_pairs.update(visited_pairs[first_failing_pair:])
+
+                if temp_read_pos > start_pos_for_token and accept_type_ids[current_dfa_state] >= 0:
+                    last_match_end_pos = temp_read_pos
+                    matched_type_id = accept_type_ids[current_dfa_state]
+                if temp_read_pos > reach:
+                    reach = temp_read_pos
             
-            # Se chegou num estado de aceitação
-            if base_pattern_name_from_dfa:
-                # Se é um token vazio, acusa erro
-                if not last_match_lexeme and last_match_end_pos == start_pos_for_token:
-                    if base_pattern_name_from_dfa not in self.patterns_to_ignore:
-                        error_char_display = source_code[start_pos_for_token : start_pos_for_token+1] if start_pos_for_token < source_len else "<EOF>"
-                        tokens_output_list.append((error_char_display, "ERRO!", f"Zero-length match by {base_pattern_name_from_dfa} at pos {start_pos_for_token}"))
-                        pos = start_pos_for_token + 1
+                # Se chegou num estado de aceitação
+                if matched_type_id >= 0:
+                    # Se é um token vazio, acusa erro
+                    if last_match_end_pos == start_pos_for_token:
+                        if not ignored_types[matched_type_id]:
+                            append_error(start_pos_for_token, start_pos_for_token + 1, matched_type_id, reach)
+                            pos = start_pos_for_token + 1
+                            continue
+
+                    # Se é um padrão a ser ignorado, ignora
+                    if ignored_types[matched_type_id]:
+                        pos = last_match_end_pos
+                        if last_match_end_pos == start_pos_for_token:
+                            pos +=1
+                        elif mode_switch_states[matched_type_id] >= 0:
+                            start_state = mode_switch_states[matched_type_id]
+                            skip_to_token_start = skip_to_token_start_by_state.get(start_state)
                         continue
 
-                # Se é um padrão a ser ignorado, ignora
-                if base_pattern_name_from_dfa in self.patterns_to_ignore:
+                    # Só os tipos internados vão para a tabela de símbolos; o atributo
+                    # dos demais é derivado do lexema sob demanda
+                    if emit_tuples:
+                        lexeme = source_code[start_pos_for_token:last_match_end_pos]
+                        attribute_kind = attribute_kinds[matched_type_id]
+                        if attribute_kind == ATTRIBUTE_LEXEME:
+                            append_token((lexeme, token_type_names[matched_type_id], lexeme))
+                        elif attribute_kind == ATTRIBUTE_SYMBOL:
+                            append_token((lexeme, token_type_names[matched_type_id],
+                                          add_symbol(lexeme, token_type_names[matched_type_id])))
+                        else:
+                            if attribute_kind == ATTRIBUTE_CONVERTED:
+                                converted_indexes.append(len(tokens_output_list))
+                                converted_type_ids.append(matched_type_id)
+                            append_token((lexeme, token_type_names[matched_type_id], None))
+                    else:
+                        append_start(start_pos_for_token)
+                        append_length(last_match_end_pos - start_pos_for_token)
+                        append_type_id(matched_type_id)
+                        if attribute_kinds[matched_type_id] == ATTRIBUTE_SYMBOL:
+                            append_attribute(add_symbol(source_code[start_pos_for_token:last_match_end_pos],
+                                                        token_type_names[matched_type_id]))
+                        else:
+                            append_attribute(-1)
+                        append_reach(reach)
+
                     pos = last_match_end_pos
-                    if last_match_end_pos == start_pos_for_token:
-                        pos +=1
+                    # Padrão com %begin: o próximo token começa no estado inicial do novo modo
+                    if mode_switch_states[matched_type_id] >= 0:
+                        start_state = mode_switch_states[matched_type_id]
+                        skip_to_token_start = skip_to_token_start_by_state.get(start_state)
+                # Se não chegou num estado de aceitação, anota que aconteceu um erro e continua análise
+                else:
+                    if start_pos_for_token < source_len:
+                        error_end = pos + 1
+                        if skip_to_token_start is not None:
+                            error_end = skip_to_token_start(source_code, error_end, source_len).end()
+                            if error_end > reach:
+                                reach = error_end
+                        append_error(start_pos_for_token, error_end, -1, reach)
+                        pos = error_end
+                    else: 
+                        break
+            document_token_ends.append(len(tokens_output_list) if emit_tuples else len(token_arrays))
+
+        if emit_tuples and converted_indexes:
+            # Uma chamada por conversor, sobre os lexemas de todos os tokens do tipo
+            indexes_by_type = {}
+            for token_index, type_id in zip(converted_indexes, converted_type_ids):
+                indexes_by_type.setdefault(type_id, []).append(token_index)
+            for type_id, token_indexes in indexes_by_type.items():
+                values = self._type_converters[type_id]([tokens_output_list[index][0] for index in token_indexes])
+                for token_index, value in zip(token_indexes, values):
+                    lexeme, token_type, _ = tokens_output_list[token_index]
+                    tokens_output_list[token_index] = (lexeme, token_type, value)
+        return document_token_ends
+
+    def tokenize_incremental(self, previous_tokens, edit_offset, deleted_length, inserted_text, source_code):
+        '''
+        Reanálise após uma edição: 'previous_tokens' é a saída de tokenize_columnar
+        (ou de uma chamada anterior deste método) para o texto antigo, e a edição
+        trocou 'deleted_length' caracteres a partir de 'edit_offset' por
+        'inserted_text', resultando em 'source_code'.
+
+        Os tokens cujas varreduras terminaram antes da edição são reaproveitados
+        (reaches guarda, por token, a maior posição examinada até ele). A análise
+        recomeça no fim do último deles e para assim que um casamento começa na
+        mesma posição, já deslocada, de um token antigo depois da edição: dali em
+        diante o texto é o mesmo, então o resto da saída antiga é reaproveitado
+        com os inícios deslocados. A tabela de símbolos não é limpa: os índices
+        dos tokens reaproveitados continuam válidos, mas podem sobrar entradas de
+        lexemas que não aparecem mais no texto.
+
+        'previous_tokens' é atualizado no lugar (TokenArrays.splice) e
+        devolvido: só os tokens reanalisados são trocados, e o deslocamento dos
+        seguintes fica pendente em vez de reescrever o resto dos arrays.
+
+        Não suporta trocas de modo (%begin): o modo em que cada token antigo
+        começou não é guardado.
+        '''
+        if self.mode_switches:
+            raise ValueError("tokenize_incremental does not support lexer modes (%begin)")
+        old_source_len = len(previous_tokens.source_code)
+        if not (0 <= edit_offset <= old_source_len and 0 <= deleted_length <= old_source_len - edit_offset):
+            raise ValueError(f"Edit ({edit_offset}, {deleted_length}) is outside the previous source of length {old_source_len}")
+        if len(source_code) != old_source_len - deleted_length + len(inserted_text):
+            raise ValueError("New source length does not match the previous source and the edit")
+
+        delta = len(inserted_text) - deleted_length
+        # Tokens antigos intactos: todas as varreduras até eles pararam antes da edição
+        kept = previous_tokens.bisect_reaches(edit_offset)
+        # Tokens reanalisados, que substituem os antigos até a sincronização
+        token_arrays = TokenArrays(source_code, self.token_type_names, self.attribute_kinds, self._type_converters)
+
+        pos = previous_tokens.start(kept - 1) + previous_tokens.lengths[kept - 1] if kept else 0
+        reach = previous_tokens.reach(kept - 1) if kept else 0
+        edit_end = edit_offset + len(inserted_text)
+        source_len = len(source_code)
+        resync_index = len(previous_tokens)
+        while pos < source_len:
+            if pos >= edit_end:
+                # Sincronizou se um token antigo começava na mesma posição do texto antigo
+                old_index = previous_tokens.bisect_starts(pos - delta, kept)
+                if old_index < len(previous_tokens) and previous_tokens.start(old_index) == pos - delta:
+                    resync_index = old_index
+                    break
+            match_end, matched_type_id, scan_end = self._longest_match(source_code, pos)
+            if matched_type_id < 0:
+                match_end = self._error_end(source_code, pos)
+                scan_end = max(scan_end, match_end)
+            if scan_end > reach:
+                reach = scan_end
+            pos = self._append_match(token_arrays, source_code, pos, match_end, matched_type_id, reach)
+
+        # O máximo acumulado dos alcances seguintes precisa cobrir as varreduras refeitas
+        previous_tokens.splice(kept, resync_index, token_arrays, delta, reach)
+        return previous_tokens, self.symbol_table
+
+    def tokenize_stream(self, source, chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
+        '''
+        Versão geradora de tokenize para entradas grandes: 'source' pode ser um
+        arquivo aberto em modo texto (lido em blocos de 'chunk_size') ou qualquer
+        iterável de pedaços de texto. Os tokens são produzidos à medida que são
+        reconhecidos, no mesmo formato (lexema, tipo, atributo) de tokenize.
+
+        Do buffer só é mantida a cauda ainda não consumida, a partir do início do
+        token corrente: é o que o maximal munch precisa para recuar até o último
+        estado de aceitação. Assim a memória depende do maior token (mais o
+        tamanho de um bloco), e não do tamanho da entrada. Um token que atravessa
+        vários blocos não é copiado a cada bloco: os blocos que ele ocupa ficam
+        numa lista e são juntados uma única vez, quando a varredura termina.
+        Os laços de um estado sobre si mesmo e o modo linear_time funcionam como
+        em tokenize.
+        '''
+        if hasattr(source, 'read'):
+            chunks = iter(lambda: source.read(chunk_size), '')
+        else:
+            chunks = iter(source)
+
+        rows = self.compiled_dfa.rows
+        num_classes = self.compiled_dfa.num_classes
+        num_states = self.compiled_dfa.num_states
+        ascii_classes = self.compiled_dfa.ascii_classes
+        char_classes = self.compiled_dfa.char_classes
+        self_loop_scanners = self.compiled_dfa.self_loop_scanners
+        accept_type_ids = self._accept_type_ids
+        start_state = self.compiled_dfa.start
+        mode_switch_states = self._mode_switch_states
+        # Pares (posição absoluta, estado) que não levam a aceite, no modo linear
+        failed_pairs = set() if self.linear_time else None
+
+        buffer = ""
+        buffer_offset = 0 # Posição absoluta de buffer[0] na entrada
+        # Blocos anteriores ocupados pelo token corrente, o primeiro deles a partir
+        # do início do token; as posições do token continuam relativas ao buffer
+        # atual (negativas nesses blocos) até que sejam juntados
+        pending_chunks = []
+        pos = 0
+        at_eof = False
+
+        while True:
+            if pos >= len(buffer):
+                if at_eof:
+                    break
+                chunk = next(chunks, None)
+                if chunk is None:
+                    at_eof = True
                     continue
+                buffer_offset += len(buffer)
+                buffer = chunk
+                pos = 0
+                if failed_pairs:
+                    # Nenhuma varredura volta a posições anteriores ao token corrente
+                    first_pair = buffer_offset * num_states
+                    failed_pairs = {pair for pair in failed_pairs if pair >= first_pair}
+                continue
+
+            start_pos_for_token = pos
+            current_dfa_state = start_state
+            temp_read_pos = pos
+            last_match_end_pos = -1
+            matched_type_id = -1
+            visited_pairs = []
+            first_failing_pair = 0
 
-                final_token_type = base_pattern_name_from_dfa
-                
-                # --- INÍCIO DA MODIFICAÇÃO PARA O TRABALHO 2 ---
-                # A lógica do atributo do token agora depende do tipo.
-                is_reserved = last_match_lexeme.lower() in self.reserved_words
-                final_attribute = None
-
-                # Adiciona à tabela de símbolos primeiro para obter o índice
-                symbol_index = self.symbol_table.add_symbol(last_match_lexeme, final_token_type)
-
-                if is_reserved:
-                    # O tipo do token é o da palavra reservada, atributo é nulo
-                    final_token_type = self.reserved_words[last_match_lexeme.lower()]
-                    final_attribute = None
-                elif final_token_type == "ID":
-                    # O atributo para ID é seu índice na tabela de símbolos
-                    final_attribute = symbol_index
-                elif final_token_type == "NUM":
-                    # O atributo para NUM é seu valor numérico
-                    try:
-                        final_attribute = float(last_match_lexeme) if '.' in last_match_lexeme else int(last_match_lexeme)
-                    except ValueError:
-                        final_attribute = last_match_lexeme # Fallback
+            # O estado da varredura (estado do AFD, posição, última aceitação)
+            # sobrevive à troca de bloco, então um token que atravessa a
+            # fronteira entre blocos não é reprocessado desde o início.
+            while True:
+                buffer_len = len(buffer)
+                if failed_pairs is None:
+                    while temp_read_pos < buffer_len:
+                        accepted_type_id = accept_type_ids[current_dfa_state]
+                        if accepted_type_id >= 0:
+                            last_match_end_pos = temp_read_pos
+                            matched_type_id = accepted_type_id
+
+                        char_to_read = buffer[temp_read_pos]
+                        char_code = ord(char_to_read)
+                        char_class = ascii_classes[char_code] if char_code < 128 else char_classes[char_to_read]
+                        next_dfa_state = rows[current_dfa_state * num_classes + char_class]
+                        if next_dfa_state < 0:
+                            break
+                        if next_dfa_state == current_dfa_state:
+                            temp_read_pos = self_loop_scanners[current_dfa_state](buffer, temp_read_pos + 1).end()
+                            continue
+                        current_dfa_state = next_dfa_state
+                        temp_read_pos += 1
                 else:
-                    # Para outros literais, o atributo pode ser o próprio lexema ou nulo
-                    final_attribute = last_match_lexeme
+                    # Modo linear, como em _scan_documents, com pares em posições absolutas
+                    while temp_read_pos < buffer_len:
+                        pair = (buffer_offset + temp_read_pos) * num_states + current_dfa_state
+                        if pair in failed_pairs:
+                            break
+                        visited_pairs.append(pair)
+                        accepted_type_id = accept_type_ids[current_dfa_state]
+                        if accepted_type_id >= 0:
+                            last_match_end_pos = temp_read_pos
+                            matched_type_id = accepted_type_id
+                            first_failing_pair = len(visited_pairs)
+
+                        char_to_read = buffer[temp_read_pos]
+                        char_code = ord(char_to_read)
+                        char_class = ascii_classes[char_code] if char_code < 128 else char_classes[char_to_read]
+                        next_dfa_state = rows[current_dfa_state * num_classes + char_class]
+                        if next_dfa_state < 0:
+                            break
+                        current_dfa_state = next_dfa_state
+                        temp_read_pos += 1
+
+                # Parou antes do fim do buffer: a varredura falhou
+                if temp_read_pos < buffer_len:
+                    break
+                # Consumiu o buffer sem falhar: o token pode continuar no próximo bloco
+                if not at_eof:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        at_eof = True
+                    else:
+                        pending_chunks.append(buffer[start_pos_for_token:] if start_pos_for_token > 0 else buffer)
+                        buffer_offset += buffer_len
+                        start_pos_for_token -= buffer_len
+                        temp_read_pos -= buffer_len
+                        last_match_end_pos -= buffer_len
+                        buffer = chunk
+                        continue
+                if temp_read_pos > start_pos_for_token and accept_type_ids[current_dfa_state] >= 0:
+                    last_match_end_pos = temp_read_pos
+                    matched_type_id = accept_type_ids[current_dfa_state]
+                    first_failing_pair = len(visited_pairs)
+                break
+            if visited_pairs:
+                failed_pairs.update(visited_pairs[first_failing_pair:])
 
-                tokens_output_list.append((last_match_lexeme, final_token_type, final_attribute))
-                # --- FIM DA MODIFICAÇÃO ---
+            if pending_chunks:
+                pending_chunks.append(buffer)
+                joined_length = len(buffer)
+                buffer = "".join(pending_chunks)
+                pending_chunks = []
+                joined_length = len(buffer) - joined_length
+                buffer_offset -= joined_length
+                start_pos_for_token += joined_length
+                last_match_end_pos += joined_length
 
+            if matched_type_id < 0:
+                last_match_end_pos = self._error_end(buffer, start_pos_for_token, start_state=start_state)
+                # Uma sequência de erro que chega ao fim do buffer pode continuar no próximo bloco
+                skip_to_token_start = self._skip_to_token_start_by_state.get(start_state)
+                while skip_to_token_start is not None and last_match_end_pos == len(buffer) and not at_eof:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        at_eof = True
+                        break
+                    pending_chunks.append(buffer[start_pos_for_token:] if start_pos_for_token > 0 else buffer)
+                    buffer_offset += len(buffer)
+                    start_pos_for_token -= len(buffer)
+                    buffer = chunk
+                    last_match_end_pos = skip_to_token_start(buffer, 0).end()
+                if pending_chunks:
+                    pending_chunks.append(buffer)
+                    joined_length = len(buffer)
+                    buffer = "".join(pending_chunks)
+                    pending_chunks = []
+                    joined_length = len(buffer) - joined_length
+                    buffer_offset -= joined_length
+                    start_pos_for_token += joined_length
+                    last_match_end_pos += joined_length
+
+            token = self._token_for_match(buffer, start_pos_for_token, last_match_end_pos,
+                                          matched_type_id, buffer_offset + start_pos_for_token)
+            if last_match_end_pos > start_pos_for_token:
                 pos = last_match_end_pos
-            # Se não chegou num estado de aceitação, anota que aconteceu um erro e continua análise
+                if matched_type_id >= 0 and mode_switch_states[matched_type_id] >= 0:
+                    start_state = mode_switch_states[matched_type_id]
             else:
-                if start_pos_for_token < source_len:
-                    actual_failing_char = source_code[start_pos_for_token]
-                    tokens_output_list.append((actual_failing_char, "ERRO!", actual_failing_char))
-                    pos += 1
-                else: 
+                pos = start_pos_for_token + 1
+            if token is not None:
+                yield token
+
+    def tokenize_bytes(self, buffer):
+        '''
+        Analisa diretamente um buffer de bytes UTF-8 (bytes, memoryview ou um
+        mmap aberto com mapped_file), sem decodificar a entrada para str.
+        Retorna uma lista de tokens (offset, tamanho, tipo), com offset e
+        tamanho em bytes; o lexema só é decodificado quando alguém pede,
+        via decode_lexeme. Erros cobrem um caractere UTF-8 inteiro (com
+        coalesce_errors, a sequência inteira de caracteres não reconhecidos);
+        uma sequência UTF-8 truncada ou inválida vira um erro só com os bytes
+        dela, sem engolir o caractere seguinte.
+        '''
+        if self._byte_dfa is None:
+            self._byte_dfa = ByteDFA(self.compiled_dfa, self._accept_type_ids, -1)
+        rows = self._byte_dfa.rows
+        accept_type_ids = self._byte_dfa.accepts
+        start_state = self._byte_dfa.start
+        ignored_types = self._ignored_types
+        token_type_names = self.token_type_names
+        mode_switch_states = self._mode_switch_states
+        skip_to_token_start_by_state = self._skip_to_token_start_bytes_by_state
+        skip_to_token_start = self._skip_to_token_start_bytes
+
+        tokens_output_list = []
+        pos = 0
+        buffer_len = len(buffer)
+
+        while pos < buffer_len:
+            current_state = start_state
+            read_pos = pos
+            last_match_end_pos = -1
+            matched_type_id = -1
+
+            while read_pos < buffer_len:
+                accepted_type_id = accept_type_ids[current_state >> 8]
+                if accepted_type_id >= 0:
+                    last_match_end_pos = read_pos
+                    matched_type_id = accepted_type_id
+                next_state = rows[current_state + buffer[read_pos]]
+                if next_state < 0:
                     break
-        return tokens_output_list, self.symbol_table
\ No newline at end of file
+                current_state = next_state
+                read_pos += 1
+            else:
+                if accept_type_ids[current_state >> 8] >= 0:
+                    last_match_end_pos = read_pos
+                    matched_type_id = accept_type_ids[current_state >> 8]
+
+            if matched_type_id < 0 or last_match_end_pos == pos:
+                error_length = utf8_character_length(buffer, pos)
+                if matched_type_id < 0 and skip_to_token_start is not None:
+                    error_length = skip_to_token_start(buffer, pos + error_length).end() - pos
+                if matched_type_id < 0 or not ignored_types[matched_type_id]:
+                    tokens_output_list.append((pos, error_length, "ERRO!"))
+                pos += error_length
+                continue
+
+            if not ignored_types[matched_type_id]:
+                tokens_output_list.append((pos, last_match_end_pos - pos, token_type_names[matched_type_id]))
+            pos = last_match_end_pos
+            # Os estados do CompiledDFA mantêm a numeração no ByteDFA (multiplicada por 256)
+            if mode_switch_states[matched_type_id] >= 0:
+                start_state = mode_switch_states[matched_type_id] * BYTE_ALPHABET_SIZE
+                skip_to_token_start = skip_to_token_start_by_state.get(mode_switch_states[matched_type_id])
+        return tokens_output_list
+
+    def tokenize_parallel(self, source_code, max_workers=None, chunk_size=DEFAULT_PARALLEL_CHUNK_SIZE):
+        '''
+        Mesma saída de tokenize (tokens e tabela de símbolos), mas dividindo a
+        entrada em blocos analisados em paralelo num ProcessPoolExecutor.
+
+        Cada bloco é analisado especulativamente a partir do estado inicial,
+        como se um token começasse no início do bloco, e a análise para no
+        primeiro token cuja varredura alcança o fim do bloco (ele pode continuar
+        no próximo). Na costura, a análise sequencial avança a partir do fim do
+        bloco anterior até cair numa posição em que o fluxo especulativo também
+        iniciou um token: a partir daí os dois fluxos são idênticos, porque o
+        maximal munch a partir de uma posição só depende do texto à frente.
+
+        As tabelas de símbolos locais de cada bloco são incorporadas à tabela
+        do lexer na ordem da entrada, só para os tokens aproveitados, de modo
+        que os índices dos atributos de ID coincidem com os da execução
+        sequencial.
+
+        Não suporta trocas de modo (%begin): o modo no início de um bloco só é
+        conhecido depois de analisar os anteriores.
+        '''
+        if self.mode_switches:
+            raise ValueError("tokenize_parallel does not support lexer modes (%begin)")
+        source_len = len(source_code)
+        if source_len <= chunk_size:
+            return self.tokenize(source_code)
+
+        chunk_bases = list(range(0, source_len, chunk_size))
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                 initializer=_init_parallel_worker,
+                                 initargs=self._worker_config()) as executor:
+            chunk_results = executor.map(_tokenize_chunk,
+                                         [source_code[base:base + chunk_size] for base in chunk_bases],
+                                         chunk_bases,
+                                         [base + chunk_size >= source_len for base in chunk_bases])
+
+            tokens_output_list = []
+            pos = 0
+            for base, chunk_result in zip(chunk_bases, chunk_results):
+                chunk_tokens, match_starts, match_token_indexes, symbol_indexes, local_symbols, stop_pos = chunk_result
+
+                # Avança sequencialmente até sincronizar com o fluxo especulativo
+                synced_match = -1
+                while pos < base + stop_pos:
+                    if pos >= base:
+                        k = bisect_left(match_starts, pos - base)
+                        if k < len(match_starts) and match_starts[k] == pos - base:
+                            synced_match = k
+                            break
+                    pos = self._tokenize_one(source_code, pos, tokens_output_list)
+                if synced_match < 0:
+                    continue
+
+                # Aproveita os tokens do bloco a partir da sincronização,
+                # remapeando os índices locais da tabela de símbolos
+                global_index_of = [-1] * len(local_symbols)
+                for token_index in range(match_token_indexes[synced_match], len(chunk_tokens)):
+                    local_index = symbol_indexes[token_index]
+                    token = chunk_tokens[token_index]
+                    if local_index >= 0:
+                        global_index = global_index_of[local_index]
+                        if global_index < 0:
+                            global_index = self.symbol_table.add_symbol(*local_symbols[local_index])
+                            global_index_of[local_index] = global_index
+                        token = (token[0], token[1], global_index)
+                    tokens_output_list.append(token)
+                pos = base + stop_pos
+
+        while pos < source_len:
+            pos = self._tokenize_one(source_code, pos, tokens_output_list)
+        return tokens_output_list, self.symbol_table
+
+    def tokenize_many(self, sources, executor=None, max_workers=None, batch_size=DEFAULT_BATCH_SIZE,
+                      columnar=False):
+        '''
+        Analisa vários documentos (em geral pequenos) com a mesma especificação.
+        Retorna uma lista com (tokens, tabela de símbolos) por documento, na
+        ordem de 'sources'; os tokens são tuplas como em tokenize ou, com
+        'columnar', TokenArrays como em tokenize_columnar.
+
+        Cada documento tem a sua própria tabela de símbolos (com os tipos
+        internados do lexer), então os índices dos atributos de ID são locais ao
+        documento, e a tabela do lexer não é alterada. O AFD compilado, os tipos
+        de token e os conversores são os mesmos para todo o lote.
+
+        'executor' pode ser None (sequencial), "thread" ou "process"; nos pools
+        os documentos são enviados em lotes de 'batch_size', para diluir o custo
+        de cada tarefa (no pool de processos o lexer é reconstruído uma vez por
+        processo trabalhador).
+        '''
+        if executor is None:
+            return self._tokenize_documents(sources, columnar)
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor '{executor}'. Use None, 'thread' or 'process'.")
+
+        sources = list(sources)
+        batches = [sources[base:base + batch_size] for base in range(0, len(sources), batch_size)]
+        if len(batches) <= 1:
+            return self._tokenize_documents(sources, columnar)
+
+        if executor == "thread":
+            pool = ThreadPoolExecutor(max_workers=max_workers)
+            tokenize_batch = self._tokenize_documents
+        else:
+            pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                       initializer=_init_parallel_worker,
+                                       initargs=self._worker_config())
+            tokenize_batch = _tokenize_documents_batch
+        results = []
+        with pool:
+            for batch_result in pool.map(tokenize_batch, batches, [columnar] * len(batches)):
+                results.extend(batch_result)
+        return results
+
+    def _worker_config(self):
+        '''
+        Argumentos de _init_parallel_worker que reconstroem este lexer, com a
+        configuração completa do construtor, nos processos trabalhadores dos
+        pools de tokenize_parallel e tokenize_many. Os conversores de atributo
+        vão já resolvidos, para não depender de registros feitos só neste processo.
+        '''
+        return (self.dfa, self.reserved_words, self.patterns_to_ignore, self.symbol_table.interned_types,
+                {name: resolve_attribute_converter(converter) for name, converter in self.attribute_converters.items()},
+                self.coalesce_errors, self.linear_time, self.mode_patterns, self.mode_switches)
+
+    def _tokenize_documents(self, sources, columnar):
+        '''
+        Analisa o lote num único passe sobre a concatenação dos documentos, com
+        um só TokenArrays de trabalho, e os conversores de atributo rodam uma
+        vez para o lote inteiro; o resultado é então fatiado por documento.
+        '''
+        sources = list(sources)
+        document_bases = list(accumulate(map(len, sources), initial=0))
+        batch_text = "".join(sources)
+        symbol_tables = [SymbolTable(self.symbol_table.interned_types) for _ in sources]
+        batch_arrays = TokenArrays(batch_text, self.token_type_names, self.attribute_kinds, self._type_converters)
+        document_token_ends = self._scan_documents(batch_arrays, batch_text, document_bases[1:], symbol_tables)
+
+        if columnar:
+            results = []
+            first_token = 0
+            for source_code, base, last_token, symbol_table in zip(sources, document_bases,
+                                                                  document_token_ends, symbol_tables):
+                token_arrays = TokenArrays(source_code, self.token_type_names, self.attribute_kinds,
+                                           self._type_converters)
+                shift = (-base).__add__
+                token_arrays.starts = array('q', map(shift, batch_arrays.starts[first_token:last_token]))
+                token_arrays.lengths = batch_arrays.lengths[first_token:last_token]
+                token_arrays.type_ids = batch_arrays.type_ids[first_token:last_token]
+                token_arrays.attributes = batch_arrays.attributes[first_token:last_token]
+                token_arrays.reaches = array('q', map(shift, batch_arrays.reaches[first_token:last_token]))
+                results.append((token_arrays, symbol_table))
+                first_token = last_token
+            return results
+
+        batch_tokens = batch_arrays.to_tuples()
+        # Mensagens de casamento vazio citam a posição no lote; refeitas
+        # com a posição relativa ao documento
+        type_ids = batch_arrays.type_ids
+        for index in compress(range(len(type_ids)), map(not_, type_ids)):
+            if batch_arrays.attributes[index] >= 0:
+                start = batch_arrays.starts[index]
+                base = document_bases[bisect_right(document_bases, start) - 1]
+                lexeme, token_type, _ = batch_tokens[index]
+                batch_tokens[index] = (lexeme, token_type, batch_arrays._attribute_value(
+                    lexeme, ERROR_TYPE_ID, batch_arrays.attributes[index], start - base))
+        results = []
+        first_token = 0
+        for last_token, symbol_table in zip(document_token_ends, symbol_tables):
+            results.append((batch_tokens[first_token:last_token], symbol_table))
+            first_token = last_token
+        return results
+
+    def _longest_match(self, source_code, pos):
+        '''
+        Maximal munch a partir de 'pos'. Retorna (fim do último casamento,
+        id do tipo casado ou -1, posição onde a varredura parou); a varredura
+        para em len(source_code) somente se alcançou o fim sem falhar.
+        '''
+        rows = self.compiled_dfa.rows
+        num_classes = self.compiled_dfa.num_classes
+        ascii_classes = self.compiled_dfa.ascii_classes
+        accept_type_ids = self._accept_type_ids
+        current_dfa_state = self.compiled_dfa.start
+        source_len = len(source_code)
+
+        last_match_end_pos = -1
+        matched_type_id = -1
+        temp_read_pos = pos
+        while temp_read_pos < source_len:
+            accepted_type_id = accept_type_ids[current_dfa_state]
+            if accepted_type_id >= 0:
+                last_match_end_pos = temp_read_pos
+                matched_type_id = accepted_type_id
+            char_to_read = source_code[temp_read_pos]
+            char_code = ord(char_to_read)
+            char_class = ascii_classes[char_code] if char_code < 128 else self.compiled_dfa.char_classes[char_to_read]
+            next_dfa_state = rows[current_dfa_state * num_classes + char_class]
+            if next_dfa_state < 0:
+                break
+            if next_dfa_state == current_dfa_state:
+                temp_read_pos = self.compiled_dfa.self_loop_scanners[current_dfa_state](
+                    source_code, temp_read_pos + 1, source_len).end()
+                continue
+            current_dfa_state = next_dfa_state
+            temp_read_pos += 1
+        else:
+            if temp_read_pos > pos and accept_type_ids[current_dfa_state] >= 0:
+                last_match_end_pos = temp_read_pos
+                matched_type_id = accept_type_ids[current_dfa_state]
+        return last_match_end_pos, matched_type_id, temp_read_pos
+
+    def _tokenize_one(self, source_code, pos, tokens_output_list):
+        '''
+        Reconhece um único token em 'pos', acrescentando-o à lista (se não for
+        ignorado), e retorna a posição onde o próximo token começa.
+        '''
+        match_end, matched_type_id, _ = self._longest_match(source_code, pos)
+        if matched_type_id < 0:
+            match_end = self._error_end(source_code, pos)
+        token = self._token_for_match(source_code, pos, match_end, matched_type_id, pos)
+        if token is not None:
+            tokens_output_list.append(token)
+        return match_end if match_end > pos else pos + 1
+
+    def _error_end(self, source_code, start, end_limit=None, start_state=None):
+        '''
+        Fim do token de erro que começa em 'start' (onde nenhum padrão casou):
+        o próprio caractere ou, com coalesce_errors, a sequência até o próximo
+        caractere que pode iniciar um token (ou até 'end_limit') no modo cujo
+        estado inicial é 'start_state' (por padrão, INITIAL).
+        '''
+        skip_to_token_start = self._skip_to_token_start_by_state.get(
+            self.compiled_dfa.start if start_state is None else start_state)
+        if skip_to_token_start is None:
+            return start + 1
+        if end_limit is None:
+            end_limit = len(source_code)
+        return skip_to_token_start(source_code, start + 1, end_limit).end()
+
+    def _append_match(self, token_arrays, source_code, start, end, type_id, reach):
+        '''
+        Versão colunar de _token_for_match: acrescenta o token do casamento
+        source_code[start:end] a 'token_arrays' (se não for ignorado) e retorna
+        a posição onde o próximo casamento começa.
+        '''
+        if type_id < 0:
+            token_arrays.append(start, end - start, ERROR_TYPE_ID, -1, reach)
+            return end
+        if self._ignored_types[type_id]:
+            return end if end > start else start + 1
+        if end == start:
+            token_arrays.append(start, 1, ERROR_TYPE_ID, type_id, reach)
+            return start + 1
+
+        symbol_index = -1
+        if self.attribute_kinds[type_id] == ATTRIBUTE_SYMBOL:
+            symbol_index = self.symbol_table.add_symbol(source_code[start:end], self.token_type_names[type_id])
+        token_arrays.append(start, end - start, type_id, symbol_index, reach)
+        return end
+
+    def _token_for_match(self, source_code, start, end, type_id, absolute_start):
+        '''
+        Monta o token (lexema, tipo, atributo) para o casamento source_code[start:end]
+        do tipo 'type_id', ou None se o padrão deve ser ignorado.
+        Sem tipo (-1), source_code[start:end] (ver _error_end) vira um token de erro.
+        '''
+        if type_id < 0:
+            error_text = source_code[start:end]
+            return (error_text, "ERRO!", error_text)
+        if self._ignored_types[type_id]:
+            return None
+        final_token_type = self.token_type_names[type_id]
+        if end == start:
+            return (source_code[start:start+1], "ERRO!", f"Zero-length match by {final_token_type} at pos {absolute_start}")
+
+        lexeme = source_code[start:end]
+        attribute_kind = self.attribute_kinds[type_id]
+        if attribute_kind == ATTRIBUTE_NONE:
+            return (lexeme, final_token_type, None)
+        if attribute_kind == ATTRIBUTE_SYMBOL:
+            return (lexeme, final_token_type, self.symbol_table.add_symbol(lexeme, final_token_type))
+        if attribute_kind == ATTRIBUTE_CONVERTED:
+            return (lexeme, final_token_type, self._type_converters[type_id]([lexeme])[0])
+        return (lexeme, final_token_type, lexeme)
+
+
+_parallel_worker_lexer = None
+
+def _init_parallel_worker(dfa, reserved_words, patterns_to_ignore, interned_types, attribute_converters,
+                          coalesce_errors=False, linear_time=False, mode_patterns=None, mode_switches=None):
+    global _parallel_worker_lexer
+    _parallel_worker_lexer = Lexer(dfa, reserved_words, patterns_to_ignore, SymbolTable(interned_types),
+                                   linear_time=linear_time, attribute_converters=attribute_converters,
+                                   coalesce_errors=coalesce_errors, mode_patterns=mode_patterns,
+                                   mode_switches=mode_switches)
+
+def _tokenize_documents_batch(sources, columnar):
+    '''
+    Lote de documentos de Lexer.tokenize_many, executado no processo trabalhador.
+    '''
+    return _parallel_worker_lexer._tokenize_documents(sources, columnar)
+
+def _tokenize_chunk(chunk_text, chunk_base, is_last_chunk):
+    '''
+    Análise especulativa de um bloco para Lexer.tokenize_parallel, executada
+    no processo trabalhador. Retorna os tokens (atributos de ID com índices da
+    tabela local), o início de cada casamento (inclusive ignorados) com o índice
+    do primeiro token a partir dele, o índice local de cada token na tabela de
+    símbolos, as entradas da tabela local e a posição onde a especulação parou.
+    '''
+    lexer = _parallel_worker_lexer
+    lexer.symbol_table.clear()
+    chunk_len = len(chunk_text)
+    chunk_tokens = []
+    match_starts = array('q')
+    match_token_indexes = array('q')
+    symbol_indexes = array('q')
+
+    pos = 0
+    while pos < chunk_len:
+        match_end, matched_type_id, scan_end = lexer._longest_match(chunk_text, pos)
+        if matched_type_id < 0:
+            match_end = lexer._error_end(chunk_text, pos)
+            scan_end = max(scan_end, match_end)
+        # A varredura chegou ao fim do bloco: o token pode continuar no próximo
+        if scan_end == chunk_len and not is_last_chunk:
+            break
+        match_starts.append(pos)
+        match_token_indexes.append(len(chunk_tokens))
+        token = lexer._token_for_match(chunk_text, pos, match_end, matched_type_id, chunk_base + pos)
+        if token is not None:
+            if matched_type_id >= 0 and match_end > pos and lexer.attribute_kinds[matched_type_id] == ATTRIBUTE_SYMBOL:
+                symbol_indexes.append(token[2])
+            else:
+                symbol_indexes.append(-1)
+            chunk_tokens.append(token)
+        pos = match_end if match_end > pos else pos + 1
+
+    local_symbols = [(lexer.symbol_table.lexeme(index), lexer.symbol_table.token_type(index))
+                     for index in range(len(lexer.symbol_table))]
+    return chunk_tokens, match_starts, match_token_indexes, symbol_indexes, local_symbols, pos
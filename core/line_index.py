@@ -0,0 +1,61 @@
+from array import array
+from bisect import bisect_right
+
+
+class LineIndex:
+    '''
+    Índice das quebras de linha de um texto, para converter offsets em
+    (linha, coluna) só quando alguém pede (mensagens de erro, interface).
+
+    O laço do lexer não conta linhas: os tokens guardam apenas o offset de
+    início. O índice (início de cada linha, em ordem) é montado de uma vez na
+    primeira consulta, com str.find, e cada conversão é uma busca binária.
+    Linhas e colunas começam em 1; a coluna conta caracteres.
+    '''
+    def __init__(self, source_code):
+        self.source_code = source_code
+        self._line_starts = None
+
+    @property
+    def line_starts(self):
+        if self._line_starts is None:
+            line_starts = array('q', [0])
+            find = self.source_code.find
+            newline = find('\n')
+            while newline >= 0:
+                line_starts.append(newline + 1)
+                newline = find('\n', newline + 1)
+            self._line_starts = line_starts
+        return self._line_starts
+
+    def __len__(self):
+        return len(self.line_starts)
+
+    def line_column(self, offset):
+        '''
+        (linha, coluna) do caractere em 'offset'. O offset len(source_code)
+        (fim da entrada) também é aceito.
+        '''
+        line_starts = self.line_starts
+        line = bisect_right(line_starts, offset) - 1
+        return line + 1, offset - line_starts[line] + 1
+
+    def line_text(self, line):
+        '''
+        Texto da linha 'line' (a partir de 1), sem a quebra de linha (nem o
+        retorno de carro das quebras CRLF).
+        '''
+        line_starts = self.line_starts
+        start = line_starts[line - 1]
+        if line < len(line_starts):
+            end = line_starts[line] - 1
+            if end > start and self.source_code[end - 1] == '\r':
+                end -= 1
+        else:
+            end = len(self.source_code)
+        return self.source_code[start:end]
+
+
+def format_position(position):
+    line, column = position
+    return f"linha {line}, coluna {column}"
@@ -1,4 +1,5 @@
 from .config import EPSILON, CONCAT_OP
+from .char_ranges import merge_ranges, class_token, is_class_token, class_token_end
 
 REGEX_META_OPERATORS = "*+?|."
 REGEX_GROUPING_SYMBOLS = "()"
@@ -35,8 +36,16 @@ def precedence(op):
     return 0
 
 def expand_char_class(char_class_str):
+    '''
+    Converte a classe de caracteres '[...]' num único token de classe
+    normalizado, com os intervalos de códigos da classe (ver char_ranges).
+    Classes de um só caractere viram o próprio caractere (escapado se for
+    metacaractere).
+    Ex: [a-c_] -> [_a-c]
+    Ex: [+] -> \+
+    '''
     content = char_class_str[1:-1]
-    expanded_chars = []
+    ranges = []
     i = 0
     # Itera sobre toda a classe de caracteres
     while i < len(content):
@@ -44,68 +53,55 @@ def expand_char_class(char_class_str):
         if content[i] == '\\' and i + 1 < len(content):
             escaped_char = content[i+1]
             # Verifica se é uma sequência de escape comum (como \n, \t)
-            if escaped_char in COMMON_ESCAPE_SEQUENCES:
-                # Adiciona o caractere real (ex: \n, não a string "\\n")
-                expanded_chars.append(COMMON_ESCAPE_SEQUENCES[escaped_char])
-            # Senão, trata como um metacaracter escapado (ex: \*, \+, \()
-            # que deve ser mantido como uma string de 2 caracteres para a próxima fase.
-            else:
-                expanded_chars.append(content[i:i+2])
+            # e usa o caractere real; senão é um metacaracter escapado (ex: \*, \+, \()
+            # que representa o próprio caractere
+            actual_char = COMMON_ESCAPE_SEQUENCES.get(escaped_char, escaped_char)
+            ranges.append((ord(actual_char), ord(actual_char)))
             i += 2
             continue
-        # A partir classe de caracteres, gera a lista de caracteres
-        # contida naquela classe
-        # Ex: [a-c] -> [a, b, c]
-        # Ex: [1-4] -> [1, 2, 3, 4]
+        # Intervalo da classe de caracteres, guardado pelos códigos das pontas;
+        # quaisquer pontas valem, desde que em ordem crescente
+        # Ex: [a-c] -> (97, 99)
+        # Ex: [1-4] -> (49, 52)
+        # Ex: [ -~] -> (32, 126)
         if i + 2 < len(content) and content[i+1] == '-':
             start_char_val = content[i]
             end_char_val = content[i+2]
-            
-            if len(start_char_val) == 1 and len(end_char_val) == 1:
-                is_alpha_range = start_char_val.isalpha() and end_char_val.isalpha()
-                is_digit_range = start_char_val.isdigit() and end_char_val.isdigit()
 
-                if (is_alpha_range or is_digit_range) and ord(start_char_val) <= ord(end_char_val):
-                    for char_code_val in range(ord(start_char_val), ord(end_char_val) + 1):
-                        char_to_add = chr(char_code_val)
-                        if char_to_add in ALL_SPECIAL_REGEX_CHARS:
-                            expanded_chars.append('\\' + char_to_add)
-                        else:
-                            expanded_chars.append(char_to_add)
-                    i += 3
-                    continue
-            
-            expanded_chars.append(content[i])
+            if ord(start_char_val) <= ord(end_char_val):
+                ranges.append((ord(start_char_val), ord(end_char_val)))
+                i += 3
+                continue
+
+            ranges.append((ord(content[i]), ord(content[i])))
             i += 1
         # Trata caracteres unitarios especiais e comuns
         else:
-            char_to_add = content[i]
-            # Se for um metacaracter, precisa ser escapado para a união
-            if char_to_add in ALL_SPECIAL_REGEX_CHARS:
-                 expanded_chars.append('\\' + char_to_add)
-            else:
-                 expanded_chars.append(char_to_add)
+            ranges.append((ord(content[i]), ord(content[i])))
             i += 1
             
-    if not expanded_chars:
+    if not ranges:
         return ""
 
-    if len(expanded_chars) == 1:
-        # Se for um caractere de escape (ex: \n), já é um único caractere
-        # Se for um metacaractere escapado (ex: \+), é uma string de 2 chars
-        return expanded_chars[0]
+    ranges = merge_ranges(ranges)
+    if len(ranges) == 1 and ranges[0][0] == ranges[0][1]:
+        # Um só caractere: metacaracteres (e colchetes) precisam ser escapados
+        char_to_add = chr(ranges[0][0])
+        if char_to_add in ALL_SPECIAL_REGEX_CHARS or char_to_add in '[]':
+            return '\\' + char_to_add
+        return char_to_add
 
-    # Retorna nova ER no formato expandido:
-    # Ex: Dado a lista [a, b, c], retorna (a|b|c)
-    return "(" + "|".join(expanded_chars) + ")"
+    # Retorna o token de classe normalizado:
+    # Ex: Dado os intervalos [(97, 99)], retorna [a-c]
+    return class_token(ranges)
 
 
 def preprocess_regex(regex_str):
     '''
     Pré processa a ER 'regex_str'. Uma ER pré processada
-    terá suas classes de caracteres expandidas e operações de
-    concatenação serão adicionadas onde necessário.
-    Ex: [a-c](ab)+c -> (a|b|c).(a.b)+.c
+    terá suas classes de caracteres convertidas em tokens de classe e
+    operações de concatenação serão adicionadas onde necessário.
+    Ex: [a-c](ab)+c -> [a-c].(a.b)+.c
     '''
     current_regex = regex_str
     processed_re_pass1 = ""
@@ -140,8 +136,8 @@ def preprocess_regex(regex_str):
                 # Se não achou, acusa erro
                 if end_bracket_idx == -1: raise ValueError("Mismatched '[' in regex")
                 
-                # Se achou, expande classe de caracteres
-                # Ex: [a-z] -> (a|b|c|...|z)
+                # Se achou, converte a classe de caracteres num token de classe
+                # Ex: [a-z] -> [a-z], [A-Za-z_] -> [A-Z_a-z]
                 char_class_segment = current_regex[i : end_bracket_idx+1]
                 expanded_segment = expand_char_class(char_class_segment)
                 processed_re_pass1 += expanded_segment
@@ -165,6 +161,11 @@ def preprocess_regex(regex_str):
             else:
                 tokens_for_concat.append(char)
                 k += 1
+        # Token de classe: um único operando
+        elif char == '[':
+            class_end = class_token_end(processed_re_pass1, k)
+            tokens_for_concat.append(processed_re_pass1[k:class_end])
+            k = class_end
         else:
             tokens_for_concat.append(char)
             k += 1
@@ -182,12 +183,14 @@ def preprocess_regex(regex_str):
             
             # Retorna true se o caracter pode finalizar uma ER
             def can_end_operand(tk):
+                if is_class_token(tk): return True
                 if len(tk) == 2 and tk.startswith('\\'): return True
                 if len(tk) == 1: return is_literal_char(tk) or tk in (')', '*', '+', '?')
                 return False
 
             # Retorna true se o caracter pode iniciar uma ER
             def can_start_operand(tk):
+                if is_class_token(tk): return True
                 if len(tk) == 2 and tk.startswith('\\'): return True
                 if len(tk) == 1: return is_literal_char(tk) or tk == '('
                 return False
@@ -199,6 +202,8 @@ def preprocess_regex(regex_str):
 
 
 def is_token_literal(token_str):
+    if is_class_token(token_str):
+        return True
     if len(token_str) == 2 and token_str.startswith('\\'):
         return True
     if token_str == EPSILON:
@@ -210,7 +215,7 @@ def is_token_literal(token_str):
 def infix_to_postfix(infix_expr):
     '''
     Pré processa e transforma a ER em sua representação pós fixa
-    Ex: [a-c](ab)+c -> (a|b|c).(a.b)+.c -> ab|c|ab.+.c.
+    Ex: [a-c](ab)+c -> [a-c].(a.b)+.c -> [a-c]ab.+.c.
     '''
     if not infix_expr: return []
     
@@ -230,6 +235,10 @@ def infix_to_postfix(infix_expr):
             else:
                 tokens.append(char)
                 i += 1
+        elif char == '[':
+            class_end = class_token_end(preprocessed_infix_str, i)
+            tokens.append(preprocessed_infix_str[i:class_end])
+            i = class_end
         elif char in ['*', CONCAT_OP, '|', '+', '?', '(', ')']:
             tokens.append(char)
             i += 1
@@ -1,11 +1,24 @@
+from ..line_index import format_position
+
+
 class SLRParser:
     def __init__(self, grammar, action_table, goto_table):
         self.grammar = grammar
         self.action_table = action_table
         self.goto_table = goto_table
 
-    def parse(self, token_stream):
+    def parse(self, token_stream, position_of=None):
+        '''
+        'position_of', quando informado, dá a (linha, coluna) do token de um
+        índice da entrada (ex: TokenArrays.position); só é chamado para o token
+        em que a análise falha, que é localizado na mensagem de erro.
+        '''
         token_stream.append( ('$', '$', '$') )
+
+        def error_location():
+            if position_of is None:
+                return ""
+            return f" ({format_position(position_of(input_ptr))})"
         
         stack = [0]
         input_ptr = 0
@@ -25,7 +38,7 @@ class SLRParser:
                     "action": f"ERRO: Ação não definida para estado {state} e entrada '{token_type}'"
                 }
                 parse_steps.append(step_info)
-                return parse_steps, False, "Erro de sintaxe: Ação indefinida."
+                return parse_steps, False, f"Erro de sintaxe: Ação indefinida{error_location()}."
 
             action, value = self.action_table[state][token_type]
             
@@ -54,7 +67,7 @@ class SLRParser:
                 if prev_state not in self.goto_table or production.head not in self.goto_table[prev_state]:
                      step_info["action"] = f"ERRO: GOTO não definido para estado {prev_state} e não-terminal '{production.head}'"
                      parse_steps.append(step_info)
-                     return parse_steps, False, "Erro de sintaxe: GOTO indefinido."
+                     return parse_steps, False, f"Erro de sintaxe: GOTO indefinido{error_location()}."
                 
                 next_state = self.goto_table[prev_state][production.head]
                 stack.append(next_state)
@@ -1,7 +1,10 @@
-from .automata import DFA
-from .config import EPSILON, CONCAT_OP
+from collections import deque
+
+from .automata import DFA, _mask_bits
+from .config import EPSILON, CONCAT_OP, INITIAL_MODE
 from .regex_utils import precedence, is_literal_char as is_simple_literal_char, preprocess_regex, infix_to_postfix
 from .automata import postfix_to_nfa, NFA, combine_nfas as thompson_combine_nfas, _finalize_nfa_properties
+from .char_ranges import is_class_token, class_token_end, split_labels
 
 
 LITERAL_NODE = 'literal'
@@ -130,6 +133,11 @@ def _build_tree_from_single_processed_re(processed_re_str, position_nodes_map):
             else:
                 re_tokens.append(char) 
                 temp_i += 1
+        # Token de classe (ex: [a-z]) é um único literal
+        elif char == '[':
+            class_end = class_token_end(processed_re_str, temp_i)
+            re_tokens.append(processed_re_str[temp_i:class_end])
+            temp_i = class_end
         else:
             re_tokens.append(char)
             temp_i += 1
@@ -147,7 +155,8 @@ def _build_tree_from_single_processed_re(processed_re_str, position_nodes_map):
         if token_char_code == EPSILON:
             operand_stack.append(AugmentedRegexSyntaxTreeNode(EPSILON, EPSILON_NODE))
         elif (len(token_char_code) == 1 and is_simple_literal_char(token_char_code)) or \
-             (len(token_char_code) == 2 and token_char_code.startswith('\\')):
+             (len(token_char_code) == 2 and token_char_code.startswith('\\')) or \
+             is_class_token(token_char_code):
             actual_symbol = token_char_code[1] if len(token_char_code) == 2 and token_char_code.startswith('\\') else token_char_code
             pos_node = PositionNode(actual_symbol)
             position_nodes_map[pos_node.id] = pos_node
@@ -176,7 +185,8 @@ def _build_tree_from_single_processed_re(processed_re_str, position_nodes_map):
     
     return operand_stack[0]
 
-def build_augmented_syntax_tree(definitions, pattern_order, position_nodes_map, end_marker_map_ref):
+def build_augmented_syntax_tree(definitions, pattern_order, position_nodes_map, end_marker_map_ref,
+                                pattern_trees_ref=None):
     all_augmented_sub_trees = []
 
     # Para cada ER, montar uma arvore sintática
@@ -209,6 +219,9 @@ def build_augmented_syntax_tree(definitions, pattern_order, position_nodes_map,
                                                                 left=sub_tree_root, 
                                                                 right=end_marker_tree_node)
         all_augmented_sub_trees.append(current_pattern_augmented_tree)
+        # Subárvore aumentada de cada padrão, cujo firstpos inicia os modos em que ele está ativo
+        if pattern_trees_ref is not None:
+            pattern_trees_ref[pattern_name] = current_pattern_augmented_tree
 
     if not all_augmented_sub_trees:
         return None, ""
@@ -297,7 +310,13 @@ def compute_followpos(node):
             pos_i_obj.followpos.update(node.left.firstpos) 
 
 
-def regex_to_direct_dfa(definitions, pattern_order):
+def regex_to_direct_dfa(definitions, pattern_order, mode_patterns=None):
+    '''
+    Construção direta do AFD pelo followpos. Com 'mode_patterns' (modo ->
+    padrões ativos, ver mode_patterns_from_directives), o estado inicial de
+    cada modo é a união dos firstpos das subárvores dos seus padrões, e todos
+    os modos compartilham o mesmo AFD (mode_start_states).
+    '''
     PositionNode.reset_id_counter()
     NFA.reset_state_ids() 
     position_nodes_map = {} 
@@ -310,10 +329,12 @@ def regex_to_direct_dfa(definitions, pattern_order):
         dfa_empty_input.start_state_id = dfa_empty_input._get_dfa_state_id(frozenset([-2])) 
         return dfa_empty_input, None, {}, None
 
+    pattern_trees = {}
     root, combined_re_for_nfa_display = build_augmented_syntax_tree(
         definitions, pattern_order, 
         position_nodes_map, 
-        end_marker_pos_id_to_pattern_name
+        end_marker_pos_id_to_pattern_name,
+        pattern_trees
     )
     
     if combined_re_for_nfa_display:
@@ -351,82 +372,106 @@ def regex_to_direct_dfa(definitions, pattern_order):
 
     dfa = DFA()
     dfa_states_map = {} 
-    unmarked_dfa_states_pos_id_sets = [] 
+
+    def mode_positions(mode_pattern_names):
+        return frozenset(p.id
+                         for pattern_name in mode_pattern_names if pattern_name in pattern_trees
+                         for p in pattern_trees[pattern_name].firstpos)
 
     s0_positions_nodes = root.firstpos
     s0_positions_ids = frozenset(p.id for p in s0_positions_nodes)
+    if mode_patterns:
+        s0_positions_ids = mode_positions(mode_patterns[INITIAL_MODE]) or frozenset([-2])
 
-    # Obtem alfabeto do automato
-    current_alphabet = set()
-    for pos_id, pos_node_obj in position_nodes_map.items():
-        if pos_id not in end_marker_pos_id_to_pattern_name: 
-            current_alphabet.add(pos_node_obj.symbol)
-    dfa.alphabet = current_alphabet
+    # Obtem alfabeto do automato: os símbolos das posições (caracteres ou
+    # tokens de classe) são cortados em intervalos disjuntos, e cada posição
+    # guarda o conjunto de intervalos que ela cobre
+    position_symbols = {pos_node_obj.symbol for pos_id, pos_node_obj in position_nodes_map.items()
+                        if pos_id not in end_marker_pos_id_to_pattern_name}
+    alphabet_symbols, symbols_by_position_symbol = split_labels(position_symbols)
+    dfa.alphabet = set(alphabet_symbols)
 
     if not s0_positions_ids and not root.nullable:
         dfa.start_state_id = dfa._get_dfa_state_id(frozenset([-2]))
         return dfa, root, position_nodes_map, pseudo_nfa_for_display
-    
+
+    # Conjuntos de posições como máscaras de bits (bit = id da posição). Para
+    # cada posição: followpos como máscara e os símbolos do alfabeto que ela
+    # cobre; para cada marcador de fim: a prioridade do seu padrão.
+    followpos_masks = {}
+    for pos_id, pos_node_obj in position_nodes_map.items():
+        mask = 0
+        for follow_pos_node_obj in pos_node_obj.followpos:
+            mask |= 1 << follow_pos_node_obj.id
+        followpos_masks[pos_id] = mask
+    symbol_position = {symbol: position for position, symbol in enumerate(alphabet_symbols)}
+    symbols_of_position = {pos_id: symbols_by_position_symbol[pos_node_obj.symbol]
+                           for pos_id, pos_node_obj in position_nodes_map.items()
+                           if pos_id not in end_marker_pos_id_to_pattern_name}
+    priority_of = {}
+    for priority, pattern_name in enumerate(pattern_order):
+        priority_of.setdefault(pattern_name, priority)
+    end_marker_priority = {pos_id: priority_of[pattern_name]
+                           for pos_id, pattern_name in end_marker_pos_id_to_pattern_name.items()
+                           if pattern_name in priority_of}
+    end_markers_mask = 0
+    for pos_id in end_marker_priority:
+        end_markers_mask |= 1 << pos_id
+
+    def positions_mask(pos_ids):
+        mask = 0
+        for pos_id in pos_ids:
+            if pos_id >= 0:
+                mask |= 1 << pos_id
+        return mask
+
     # Estado inicial é o firstpos do nodo raiz
     dfa.start_state_id = dfa._get_dfa_state_id(s0_positions_ids)
-    dfa_states_map[s0_positions_ids] = dfa.start_state_id
-    if s0_positions_ids or root.nullable : 
-      unmarked_dfa_states_pos_id_sets.append(s0_positions_ids)
-    
-    processed_dfa_states_pos_id_sets = set()
+    s0_mask = positions_mask(s0_positions_ids)
+    dfa_states_map[s0_mask] = dfa.start_state_id
+    unmarked_dfa_states_pos_id_sets = deque([s0_mask])
+
+    for mode, mode_pattern_names in (mode_patterns or {}).items():
+        mode_positions_ids = mode_positions(mode_pattern_names) or frozenset([-2])
+        mode_mask = positions_mask(mode_positions_ids)
+        if mode_mask not in dfa_states_map:
+            dfa_states_map[mode_mask] = dfa._get_dfa_state_id(mode_positions_ids)
+            unmarked_dfa_states_pos_id_sets.append(mode_mask)
+        dfa.mode_start_states[mode] = dfa_states_map[mode_mask]
 
     # Constroi automato a partir da arvore de sintaxe
     while unmarked_dfa_states_pos_id_sets:
-        current_S_pos_ids = unmarked_dfa_states_pos_id_sets.pop(0)
-        
-        if current_S_pos_ids in processed_dfa_states_pos_id_sets : continue
-        processed_dfa_states_pos_id_sets.add(current_S_pos_ids)
-
-        current_dfa_state_id = dfa_states_map[current_S_pos_ids]
-
-        # Verifica se o estado atual é um estado de aceitação ao observar
-        # todos os ids de estado que formam o estado atual
-        accepting_patterns_for_current_dfa_state = {} 
-        for pos_id_in_current_S in current_S_pos_ids:
-            if pos_id_in_current_S in end_marker_pos_id_to_pattern_name:
-                pattern_name = end_marker_pos_id_to_pattern_name[pos_id_in_current_S]
-                try:
-                    priority = pattern_order.index(pattern_name)
-                    accepting_patterns_for_current_dfa_state[pattern_name] = priority
-                except ValueError: 
-                    pass 
-        
+        current_S_mask = unmarked_dfa_states_pos_id_sets.popleft()
+        current_dfa_state_id = dfa_states_map[current_S_mask]
+
         # Se for um estado de aceitação, entre as ERs, escolhe a de maior prioridade
         # para ser a do estado de aceitação pro caso de existirem mais de uma para
         # aquele estado
-        if accepting_patterns_for_current_dfa_state:
-            best_pattern_to_accept = min(accepting_patterns_for_current_dfa_state, 
-                                         key=accepting_patterns_for_current_dfa_state.get)
-            dfa.set_accept_state(current_dfa_state_id, best_pattern_to_accept)
-
-        # Descobre novos estados a partir dos followpos dos estados que nomeiam
-        # o estado atual
-        for char_a in sorted(list(dfa.alphabet)):
-            # Descobre estado a partir do atual
-            U_target_pos_ids = set()
-            for pos_p_id in current_S_pos_ids:
-                pos_p_node = position_nodes_map.get(pos_p_id)
-                if pos_p_node and pos_p_node.symbol == char_a:
-                    for follow_pos_node_obj in pos_p_node.followpos:
-                        U_target_pos_ids.add(follow_pos_node_obj.id)
-            
-            U_fset_ids = frozenset(U_target_pos_ids)
-            if not U_fset_ids: continue
+        end_markers_in_S = current_S_mask & end_markers_mask
+        if end_markers_in_S:
+            best_end_marker = min(_mask_bits(end_markers_in_S), key=end_marker_priority.__getitem__)
+            dfa.set_accept_state(current_dfa_state_id, end_marker_pos_id_to_pattern_name[best_end_marker])
+
+        # Descobre novos estados a partir dos followpos das posições do estado
+        # atual: só os símbolos cobertos por alguma delas são visitados, e o
+        # destino por um símbolo é o OU dos followpos das posições que o cobrem
+        U_masks_by_symbol = {}
+        for pos_p_id in _mask_bits(current_S_mask & ~end_markers_mask):
+            follow_mask = followpos_masks[pos_p_id]
+            for char_a in symbols_of_position[pos_p_id]:
+                U_masks_by_symbol[char_a] = U_masks_by_symbol.get(char_a, 0) | follow_mask
+
+        for char_a in sorted(U_masks_by_symbol, key=symbol_position.__getitem__):
+            U_mask = U_masks_by_symbol[char_a]
+            if not U_mask: continue
 
             # Se o estado não existe ainda, adiciona a lista de estados
             # não marcados
-            if U_fset_ids not in dfa_states_map:
-                new_target_dfa_id = dfa._get_dfa_state_id(U_fset_ids)
-                dfa_states_map[U_fset_ids] = new_target_dfa_id
-                if U_fset_ids not in processed_dfa_states_pos_id_sets:
-                    unmarked_dfa_states_pos_id_sets.append(U_fset_ids)
-            
-            target_dfa_id = dfa_states_map[U_fset_ids]
+            target_dfa_id = dfa_states_map.get(U_mask)
+            if target_dfa_id is None:
+                target_dfa_id = dfa._get_dfa_state_id(list(_mask_bits(U_mask)))
+                dfa_states_map[U_mask] = target_dfa_id
+                unmarked_dfa_states_pos_id_sets.append(U_mask)
             dfa.add_transition(current_dfa_state_id, char_a, target_dfa_id)
             
-    return dfa, root, position_nodes_map, pseudo_nfa_for_display
\ No newline at end of file
+    return dfa, root, position_nodes_map, pseudo_nfa_for_display
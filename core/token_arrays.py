@@ -0,0 +1,357 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .line_index import LineIndex
+
+ERROR_TOKEN_TYPE = "ERRO!"
+ERROR_TYPE_ID = 0
+
+# Como o atributo de cada tipo de token é obtido a partir do lexema/slot
+ATTRIBUTE_ERROR = 0      # Erros: o próprio caractere, ou a mensagem de casamento vazio
+ATTRIBUTE_LEXEME = 1     # O próprio lexema
+ATTRIBUTE_SYMBOL = 2     # Índice na tabela de símbolos, guardado no slot de atributo
+ATTRIBUTE_CONVERTED = 3  # Calculado por um conversor em lote (ATTRIBUTE_CONVERTERS)
+ATTRIBUTE_NONE = 4       # Palavras reservadas: sem atributo
+
+
+def number_attribute(lexeme):
+    try:
+        return float(lexeme) if '.' in lexeme else int(lexeme)
+    except ValueError:
+        return lexeme
+
+
+def convert_numbers(lexemes):
+    '''
+    Converte de uma vez todos os lexemas numéricos: float se tiver '.', int
+    caso contrário. Só quando algum lexema não é número válido a conversão é
+    refeita lexema a lexema, mantendo o lexema nos inválidos.
+    '''
+    try:
+        return [float(lexeme) if '.' in lexeme else int(lexeme) for lexeme in lexemes]
+    except ValueError:
+        return [number_attribute(lexeme) for lexeme in lexemes]
+
+
+def convert_integers(lexemes):
+    try:
+        return list(map(int, lexemes))
+    except ValueError:
+        return [number_attribute(lexeme) for lexeme in lexemes]
+
+
+def convert_floats(lexemes):
+    try:
+        return list(map(float, lexemes))
+    except ValueError:
+        return [number_attribute(lexeme) for lexeme in lexemes]
+
+
+def convert_lexemes(lexemes):
+    return list(lexemes)
+
+
+def convert_to_none(lexemes):
+    return [None] * len(lexemes)
+
+
+# Conversores de atributo em lote, por nome (usados pela diretiva %attr=<nome> do
+# arquivo .re): recebem a lista de lexemas de todos os tokens de um tipo e
+# devolvem a lista de atributos, na mesma ordem.
+ATTRIBUTE_CONVERTERS = {
+    "number": convert_numbers,
+    "int": convert_integers,
+    "float": convert_floats,
+    "lexeme": convert_lexemes,
+    "none": convert_to_none,
+}
+# Conversor padrão por tipo de token, quando o .re não declara nenhum
+DEFAULT_ATTRIBUTE_CONVERTERS = {"NUM": "number"}
+
+
+def register_attribute_converter(name, converter):
+    ATTRIBUTE_CONVERTERS[name] = converter
+
+
+def resolve_attribute_converter(converter):
+    '''
+    Aceita o nome de um conversor registrado ou a própria função.
+    '''
+    if callable(converter):
+        return converter
+    if converter not in ATTRIBUTE_CONVERTERS:
+        raise ValueError(f"Unknown attribute converter '{converter}'. "
+                         f"Available: {', '.join(sorted(ATTRIBUTE_CONVERTERS))}")
+    return ATTRIBUTE_CONVERTERS[converter]
+
+
+class TokenArrays:
+    '''
+    Saída colunar do Lexer: em vez de uma tupla por token, arrays paralelos
+    com o início e o tamanho de cada token no texto fonte, o id do tipo e um
+    slot inteiro de atributo (índice na tabela de símbolos para ID, id do
+    padrão que casou vazio para erros, -1 quando não usado). 'reaches' guarda,
+    para cada token, a maior posição examinada pelas varreduras do lexer até
+    ele (inclusive de padrões ignorados), usada na reanálise incremental.
+
+    Os lexemas e atributos são obtidos sob demanda a partir do texto fonte,
+    então quem só precisa de tipos e posições não paga pelas tuplas. Os arrays
+    implementam o protocolo de buffer e podem ser expostos com memoryview.
+    Tipos com conversor ('converters', id do tipo -> função em lote) têm os
+    atributos calculados por uma única chamada sobre todos os seus lexemas.
+    Linha e coluna de um token também são calculadas só quando pedidas
+    (position), a partir do offset de início e de um LineIndex do texto.
+
+    A reanálise incremental (splice) não reescreve os inícios e alcances dos
+    tokens depois de cada edição: os deslocamentos ficam pendentes, por
+    trechos de índices, e são somados na leitura de um token (start, reach,
+    lexeme...). Só o acesso às colunas inteiras (starts, reaches, iteração,
+    buffers) os aplica aos arrays.
+    '''
+    def __init__(self, source_code, type_names, attribute_kinds, converters=None):
+        self.source_code = source_code
+        self.type_names = type_names
+        self.attribute_kinds = attribute_kinds
+        self.converters = converters if converters is not None else {}
+        self._starts = array('q')
+        self.lengths = array('q')
+        self.type_ids = array('i')
+        self.attributes = array('q')
+        self._reaches = array('q')
+        # Deslocamentos pendentes: os inícios e alcances reais dos tokens de
+        # _shift_indexes[j] em diante (até o próximo índice) são os guardados
+        # mais _shift_totals[j]; antes do primeiro índice não há deslocamento
+        self._shift_indexes = []
+        self._shift_totals = []
+        self._line_index = None
+
+    @property
+    def starts(self):
+        self._apply_shifts()
+        return self._starts
+
+    @starts.setter
+    def starts(self, starts):
+        self._apply_shifts()
+        self._starts = starts
+
+    @property
+    def reaches(self):
+        self._apply_shifts()
+        return self._reaches
+
+    @reaches.setter
+    def reaches(self, reaches):
+        self._apply_shifts()
+        self._reaches = reaches
+
+    def _apply_shifts(self):
+        if not self._shift_indexes:
+            return
+        ends = self._shift_indexes[1:] + [len(self._starts)]
+        for first, last, total in zip(self._shift_indexes, ends, self._shift_totals):
+            if total:
+                for values in (self._starts, self._reaches):
+                    values[first:last] = array('q', map(total.__add__, values[first:last]))
+        self._shift_indexes = []
+        self._shift_totals = []
+
+    def _shift_at(self, index):
+        segment = bisect_right(self._shift_indexes, index) - 1
+        return self._shift_totals[segment] if segment >= 0 else 0
+
+    def start(self, index):
+        if index < 0:
+            index += len(self._starts)
+        if self._shift_indexes:
+            return self._starts[index] + self._shift_at(index)
+        return self._starts[index]
+
+    def reach(self, index):
+        if index < 0:
+            index += len(self._reaches)
+        if self._shift_indexes:
+            return self._reaches[index] + self._shift_at(index)
+        return self._reaches[index]
+
+    def _bisect(self, values, position, first):
+        # Os valores reais são crescentes, e os guardados também dentro de cada trecho
+        bounds = [0] + self._shift_indexes
+        ends = self._shift_indexes + [len(values)]
+        totals = [0] + self._shift_totals
+        for segment in range(bisect_right(bounds, first) - 1, len(bounds)):
+            index = bisect_left(values, position - totals[segment], max(first, bounds[segment]), ends[segment])
+            if index < ends[segment]:
+                return index
+        return len(values)
+
+    def bisect_starts(self, position, first=0):
+        '''
+        Índice do primeiro token, a partir de 'first', que começa em 'position' ou depois.
+        '''
+        return self._bisect(self._starts, position, first)
+
+    def bisect_reaches(self, position, first=0):
+        '''
+        Índice do primeiro token, a partir de 'first', cujo alcance é 'position' ou mais.
+        '''
+        return self._bisect(self._reaches, position, first)
+
+    def splice(self, first, last, replacement, delta, reach):
+        '''
+        Reanálise incremental no lugar: troca os tokens [first, last) pelos de
+        'replacement' (TokenArrays do texto novo, que passa a ser o destes
+        arrays) e desloca de 'delta' as posições dos tokens seguintes, cujos
+        alcances sobem até pelo menos 'reach' (máximo acumulado).
+
+        Os tokens seguintes não são reescritos: um deslocamento pendente começa
+        logo depois dos novos tokens, e os que já existiam depois da edição são
+        somados a 'delta'. Os arrays mudam só pela troca dos tokens (uma cópia
+        em C do resto de cada coluna, quando o número de tokens muda), então o
+        custo em Python depende do tamanho da edição e do número de
+        deslocamentos pendentes, e não do texto.
+        '''
+        shift_indexes = self._shift_indexes
+        shift_totals = self._shift_totals
+        # Deslocamentos dentro do trecho trocado passam a valer a partir dos novos tokens
+        before = bisect_left(shift_indexes, first)
+        after = bisect_right(shift_indexes, last)
+        base_total = shift_totals[before - 1] if before > 0 else 0
+        suffix_total = shift_totals[after - 1] if after > 0 else 0
+
+        starts = replacement._starts
+        reaches = replacement._reaches
+        if base_total:
+            # Os novos tokens caem no trecho de base_total: guardam o valor real menos ele
+            starts = array('q', map((-base_total).__add__, starts))
+            reaches = array('q', map((-base_total).__add__, reaches))
+        self._starts[first:last] = starts
+        self.lengths[first:last] = replacement.lengths
+        self.type_ids[first:last] = replacement.type_ids
+        self.attributes[first:last] = replacement.attributes
+        self._reaches[first:last] = reaches
+
+        suffix_index = first + len(replacement)
+        growth = suffix_index - last
+        new_indexes = shift_indexes[:before]
+        new_totals = shift_totals[:before]
+        if suffix_total + delta != base_total and suffix_index < len(self._starts):
+            new_indexes.append(suffix_index)
+            new_totals.append(suffix_total + delta)
+        new_indexes.extend(index + growth for index in shift_indexes[after:])
+        new_totals.extend(total + delta for total in shift_totals[after:])
+        self._shift_indexes = new_indexes
+        self._shift_totals = new_totals
+
+        index = suffix_index
+        while index < len(self._reaches) and self.reach(index) < reach:
+            self._reaches[index] = reach - self._shift_at(index)
+            index += 1
+        self.source_code = replacement.source_code
+        self._line_index = None
+
+    @property
+    def line_index(self):
+        if self._line_index is None:
+            self._line_index = LineIndex(self.source_code)
+        return self._line_index
+
+    def position(self, index):
+        '''
+        (linha, coluna) do início do token 'index'; index == len(self) é o fim
+        da entrada (ex: o '$' do analisador sintático).
+        '''
+        offset = self.start(index) if index < len(self._starts) else len(self.source_code)
+        return self.line_index.line_column(offset)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def append(self, start, length, type_id, attribute=-1, reach=-1):
+        self._apply_shifts()
+        self._starts.append(start)
+        self.lengths.append(length)
+        self.type_ids.append(type_id)
+        self.attributes.append(attribute)
+        self._reaches.append(reach if reach >= 0 else start + length)
+
+    def buffers(self):
+        return {
+            "starts": memoryview(self.starts),
+            "lengths": memoryview(self.lengths),
+            "type_ids": memoryview(self.type_ids),
+            "attributes": memoryview(self.attributes),
+            "reaches": memoryview(self.reaches),
+        }
+
+    def lexeme(self, index):
+        start = self.start(index)
+        return self.source_code[start:start + self.lengths[index]]
+
+    def token_type(self, index):
+        return self.type_names[self.type_ids[index]]
+
+    def attribute(self, index):
+        return self._attribute_value(self.lexeme(index), self.type_ids[index],
+                                     self.attributes[index], self.start(index))
+
+    def _attribute_value(self, lexeme, type_id, attribute_slot, start):
+        kind = self.attribute_kinds[type_id]
+        if kind == ATTRIBUTE_LEXEME:
+            return lexeme
+        if kind == ATTRIBUTE_SYMBOL:
+            return attribute_slot
+        if kind == ATTRIBUTE_NONE:
+            return None
+        if kind == ATTRIBUTE_CONVERTED:
+            return self.converters[type_id]([lexeme])[0]
+        if attribute_slot >= 0:
+            return f"Zero-length match by {self.type_names[attribute_slot]} at pos {start}"
+        return lexeme
+
+    def converted_attributes(self):
+        '''
+        Roda cada conversor uma única vez, sobre os lexemas de todos os tokens
+        do seu tipo. Retorna id do tipo -> (lexemas, atributos), na ordem dos tokens.
+        '''
+        source_code = self.source_code
+        converted = {}
+        for type_id, converter in self.converters.items():
+            lexemes = [source_code[start:start + length]
+                       for start, length, token_type_id in zip(self.starts, self.lengths, self.type_ids)
+                       if token_type_id == type_id]
+            if lexemes:
+                converted[type_id] = (lexemes, converter(lexemes))
+        return converted
+
+    def __getitem__(self, index):
+        lexeme = self.lexeme(index)
+        return (lexeme, self.type_names[self.type_ids[index]],
+                self._attribute_value(lexeme, self.type_ids[index], self.attributes[index], self.start(index)))
+
+    def __iter__(self):
+        source_code = self.source_code
+        type_names = self.type_names
+        attribute_kinds = self.attribute_kinds
+        attribute_value = self._attribute_value
+        # Tuplas já prontas dos tipos convertidos, consumidas na ordem dos tokens
+        next_converted = {type_id: zip(lexemes, [type_names[type_id]] * len(lexemes), values).__next__
+                          for type_id, (lexemes, values) in self.converted_attributes().items()}
+        for start, length, type_id, attribute_slot in zip(self.starts, self.lengths, self.type_ids, self.attributes):
+            kind = attribute_kinds[type_id]
+            if kind == ATTRIBUTE_CONVERTED:
+                yield next_converted[type_id]()
+                continue
+            lexeme = source_code[start:start + length]
+            if kind == ATTRIBUTE_LEXEME:
+                yield (lexeme, type_names[type_id], lexeme)
+            elif kind == ATTRIBUTE_SYMBOL:
+                yield (lexeme, type_names[type_id], attribute_slot)
+            else:
+                yield (lexeme, type_names[type_id], attribute_value(lexeme, type_id, attribute_slot, start))
+
+    def to_tuples(self):
+        '''
+        Lista de tuplas (lexema, tipo, atributo), no formato de Lexer.tokenize.
+        '''
+        return list(self)
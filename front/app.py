@@ -12,6 +12,7 @@ from .callbacks import (load_re_from_file_for_current_mode_callback,
                         load_test_data_for_auto_mode_callback,
                         process_regular_expressions_callback,
                         combine_all_nfas_callback,
+                        show_deferred_construction_views_callback,
                         generate_final_dfa_and_minimize_callback,
                         draw_current_minimized_dfa_callback,
                         save_dfa_to_file_callback,
@@ -23,6 +24,7 @@ from .callbacks import (load_re_from_file_for_current_mode_callback,
 from .ui_utils import update_display_tab, clear_dfa_image, update_text_content
 from tests import TEST_CASES
 from syntactic_tests import SYNTACTIC_TEST_CASES
+from core.lexer_cache import LexerCache
 from core.lexer_core import SymbolTable, parse_re_file_data
 from core.syntactic.grammar import Grammar
 from core.syntactic.slr_generator import SLRGenerator
@@ -49,6 +51,7 @@ class LexerGeneratorApp(ctk.CTk):
         self.pattern_order = []
         self.reserved_words_defs = {}
         self.patterns_to_ignore = set()
+        self.pattern_directives = {}
         
         self.individual_nfas = {}
         self.combined_nfa_start_obj = None
@@ -60,17 +63,22 @@ class LexerGeneratorApp(ctk.CTk):
 
         self.unminimized_dfa = None
         self.dfa = None
+        self.cached_dfa = None
+        # Abas das Etapas A e B ainda por construir (AFD minimizado do cache)
+        self.deferred_construction_views = False
         self.lexer = None
         self.current_test_name = "Manual"
         self.active_construction_method = "thompson"
         
         self.images_output_dir = "imagens"
         self.symbol_table_instance = SymbolTable()
+        self.lexer_cache = LexerCache()
 
         self.grammar = None
         self.slr_action_table = None
         self.slr_goto_table = None
         self.generated_token_stream = []
+        self.generated_token_arrays = None
         
         self.manual_mode_widgets = {}
         self.auto_test_mode_widgets = {}
@@ -204,16 +212,18 @@ class LexerGeneratorApp(ctk.CTk):
             update_display_tab(widgets, "Saída do Analisador Léxico (Tokens)", f"({self.current_test_name}: Texto fonte alterado, reanalisar)")
 
     def reset_app_state(self):
-        self.definitions.clear(); self.pattern_order.clear(); self.reserved_words_defs.clear(); self.patterns_to_ignore.clear()
+        self.definitions.clear(); self.pattern_order.clear(); self.reserved_words_defs.clear(); self.patterns_to_ignore.clear(); self.pattern_directives.clear()
         self.individual_nfas.clear(); self.combined_nfa_start_obj = None; self.combined_nfa_accept_map = None; self.combined_nfa_alphabet = None
         self.augmented_syntax_tree_followpos = None; self.followpos_table_followpos = None;
-        self.unminimized_dfa = None; self.dfa = None; self.lexer = None
+        self.unminimized_dfa = None; self.dfa = None; self.cached_dfa = None; self.lexer = None
+        self.deferred_construction_views = False
         self.symbol_table_instance.clear()
         
         self.grammar = None
         self.slr_action_table = None
         self.slr_goto_table = None
         self.generated_token_stream = []
+        self.generated_token_arrays = None
 
         widgets = self.get_current_mode_widgets()
         if not widgets: return
@@ -253,6 +263,14 @@ class LexerGeneratorApp(ctk.CTk):
         else:
             ts_builder.append("  (Nenhuma palavra reservada definida/identificada)")
 
+        ts_builder.append("\nConversores de Atributo (Diretiva %attr):")
+        if self.pattern_directives:
+            for pattern_name, directives in sorted(self.pattern_directives.items()):
+                if "attr" in directives:
+                    ts_builder.append(f"  - {pattern_name}: {directives['attr']}")
+        else:
+            ts_builder.append("  (Nenhum)")
+
         ts_builder.append("\nPadrões a Ignorar:")
         if self.patterns_to_ignore:
             for pattern_name in sorted(list(self.patterns_to_ignore)):
@@ -277,7 +295,7 @@ class LexerGeneratorApp(ctk.CTk):
         update_text_content(current_widgets_for_full_test.get("source_display_textbox"), test_case["source_code"], keep_editable=False)
 
         try:
-            self.definitions, self.pattern_order, self.reserved_words_defs, self.patterns_to_ignore = parse_re_file_data(test_case["re_definitions"])
+            self.definitions, self.pattern_order, self.reserved_words_defs, self.patterns_to_ignore, self.pattern_directives = parse_re_file_data(test_case["re_definitions"])
         except Exception as e:
             messagebox.showerror("Erro ao Parsear Definições do Teste", f"Erro: {e}")
             return
@@ -287,14 +305,15 @@ class LexerGeneratorApp(ctk.CTk):
         try:
             self.process_regular_expressions()
             
-            if self.active_construction_method == "thompson":
+            # Com o AFD minimizado do cache, a Etapa B não tem o que construir
+            if self.cached_dfa is None and self.active_construction_method == "thompson":
                 if self.individual_nfas and any(self.individual_nfas.values()):
                     self.combine_all_nfas()
                 else:
                     messagebox.showwarning("Teste Completo", "Nenhum NFA válido gerado na Etapa A para Thompson. Interrompendo.")
                     return
             
-            if self.unminimized_dfa:
+            if self.unminimized_dfa or self.cached_dfa is not None:
                 self.generate_final_dfa_and_minimize()
             else:
                  messagebox.showwarning("Teste Completo", "Nenhum AFD não minimizado gerado. Não é possível minimizar ou analisar. Interrompendo.")
@@ -371,6 +390,7 @@ class LexerGeneratorApp(ctk.CTk):
     def load_test_data_for_auto_mode(self, test_case, show_message=True): load_test_data_for_auto_mode_callback(self, test_case, show_message)
     def process_regular_expressions(self): process_regular_expressions_callback(self)
     def combine_all_nfas(self): combine_all_nfas_callback(self)
+    def show_deferred_construction_views(self): show_deferred_construction_views_callback(self)
     def generate_final_dfa_and_minimize(self): generate_final_dfa_and_minimize_callback(self)
     def draw_current_minimized_dfa(self): draw_current_minimized_dfa_callback(self)
     def save_dfa_to_file(self): save_dfa_to_file_callback(self)
@@ -5,9 +5,14 @@ import customtkinter as ctk
 import traceback
 
 from core.automata import (NFA, DFA, NFAState, postfix_to_nfa, _finalize_nfa_properties,
-                           combine_nfas, construct_unminimized_dfa_from_nfa, _minimize_dfa)
-from core.lexer_core import Lexer, parse_re_file_data, SymbolTable
+                           combine_nfas, combine_nfas_by_mode, construct_unminimized_dfa_from_nfa, _minimize_dfa)
+from core.config import INITIAL_MODE
+from core.lexer_core import (Lexer, parse_re_file_data, SymbolTable, attribute_converters_from_directives,
+                             mode_patterns_from_directives, mode_switches_from_directives)
 from core.regex_utils import infix_to_postfix
+from core.dfa_serialization import save_dfa, DFA_TEXT_SUFFIX, DFA_BINARY_SUFFIX
+from core.lexer_cache import lexer_cache_key
+from core.line_index import format_position
 from core.syntax_tree_direct_dfa import regex_to_direct_dfa
 from core.syntactic.grammar import Grammar
 from core.syntactic.slr_generator import SLRGenerator
@@ -42,6 +47,28 @@ def load_test_data_for_auto_mode_callback(app_instance, test_case, show_message=
     if show_message and hasattr(app_instance, 'auto_test_mode_widgets') and app_instance.auto_test_mode_widgets["control_frame"].winfo_ismapped():
          messagebox.showinfo("Teste Carregado", f"Teste '{test_case['name']}' carregado (via Thompson).")
 
+# Abas das Etapas A e B, preenchidas só quando abertas se o AFD veio do cache
+CONSTRUCTION_VIEW_TABS = ("ER ➔ NFA Ind. / Árvore+Followpos", "NFA Combinado (União ε) / AFD Direto (Não-Minim.)")
+
+def _spec_cache_key(app_instance, method):
+    return lexer_cache_key(app_instance.definitions, app_instance.pattern_order, app_instance.reserved_words_defs,
+                           app_instance.patterns_to_ignore, app_instance.pattern_directives, method)
+
+def _load_cached_dfa(app_instance, method):
+    '''
+    AFD minimizado da especificação atual guardado no cache, ou None.
+    '''
+    cached_entry = app_instance.lexer_cache.get(_spec_cache_key(app_instance, method))
+    return cached_entry[0] if cached_entry else None
+
+def _store_cached_dfa(app_instance, method, minimized_dfa):
+    try:
+        app_instance.lexer_cache.put(_spec_cache_key(app_instance, method), minimized_dfa,
+                                     app_instance.reserved_words_defs, app_instance.patterns_to_ignore,
+                                     app_instance.pattern_order, app_instance.pattern_directives)
+    except OSError as e:
+        print(f"Warning: Could not write lexer cache entry: {e}")
+
 def process_regular_expressions_callback(app_instance):
     widgets = app_instance.get_current_mode_widgets()
     if not widgets: return
@@ -57,13 +84,62 @@ def process_regular_expressions_callback(app_instance):
             messagebox.showerror("Entrada Vazia", "Nenhuma definição regular fornecida."); return
         
         try:
-            app_instance.definitions, app_instance.pattern_order, app_instance.reserved_words_defs, app_instance.patterns_to_ignore = parse_re_file_data(re_content_for_parsing)
+            app_instance.definitions, app_instance.pattern_order, app_instance.reserved_words_defs, app_instance.patterns_to_ignore, app_instance.pattern_directives = parse_re_file_data(re_content_for_parsing)
         except Exception as e:
             messagebox.showerror("Erro ao Parsear Definições", f"Erro: {e}")
             return
     
     app_instance.display_definitions_and_reserved_words()
-    
+    # Com a especificação inalterada, o AFD minimizado vem do cache e nenhum
+    # autômato é construído nas Etapas A a C; os intermediários só são montados
+    # para exibição, quando a aba deles é aberta (ver show_deferred_construction_views_callback)
+    app_instance.cached_dfa = _load_cached_dfa(app_instance, app_instance.active_construction_method)
+    if app_instance.cached_dfa is not None:
+        _defer_construction_views(app_instance, widgets)
+        return
+    app_instance.deferred_construction_views = False
+    _construct_automata(app_instance, widgets)
+
+def _defer_construction_views(app_instance, widgets):
+    app_instance.deferred_construction_views = True
+    app_instance.individual_nfas.clear()
+    app_instance.unminimized_dfa = None
+    note = (f"({app_instance.current_test_name}): especificação inalterada, AFD minimizado carregado do cache.\n"
+            "Os autômatos intermediários são construídos quando esta aba é selecionada.")
+    for tab_name in CONSTRUCTION_VIEW_TABS:
+        update_display_tab(widgets, tab_name, note)
+    if app_instance.current_frame_name != "FullTestMode":
+        if widgets.get("combine_nfas_button"): widgets["combine_nfas_button"].configure(state="disabled")
+        if widgets.get("generate_dfa_button"): widgets["generate_dfa_button"].configure(state="normal")
+        messagebox.showinfo("Sucesso (Etapa A)", f"({app_instance.current_test_name}): AFD minimizado carregado do cache. Prossiga para a Etapa C.")
+
+def show_deferred_construction_views_callback(app_instance):
+    '''
+    Chamado na troca de aba. Com o AFD minimizado do cache, as abas das Etapas
+    A e B só são preenchidas quando uma delas é selecionada: os autômatos
+    intermediários são construídos aí, apenas para exibição.
+    '''
+    widgets = app_instance.get_current_mode_widgets()
+    if not widgets or not app_instance.deferred_construction_views: return
+    tab_view = widgets.get("display_tab_view")
+    if tab_view is None or tab_view.get() not in CONSTRUCTION_VIEW_TABS: return
+
+    app_instance.deferred_construction_views = False
+    if _construct_automata(app_instance, widgets, deferred=True) and app_instance.active_construction_method == "thompson":
+        try:
+            _combine_nfas(app_instance, widgets)
+        except Exception as e:
+            tb_str = traceback.format_exc()
+            update_display_tab(widgets, CONSTRUCTION_VIEW_TABS[1], f"Erro: {str(e)}\n{tb_str}")
+
+def _construct_automata(app_instance, widgets, deferred=False):
+    '''
+    Etapa A: NFAs individuais (Thompson) ou AFD direto (followpos), exibidos
+    nas abas de construção; retorna se a construção teve sucesso. Com
+    'deferred' (AFD minimizado do cache), só preenche as abas, sem mensagens
+    de sucesso nem botões.
+    '''
+    interactive = not deferred and app_instance.current_frame_name != "FullTestMode"
     construction_details_builder = [f"Processando Definições ({app_instance.current_test_name}):\n"]
     if app_instance.patterns_to_ignore: construction_details_builder.append(f"(Padrões ignorados: {', '.join(sorted(list(app_instance.patterns_to_ignore)))})\n")
     construction_details_builder.append("\n")
@@ -92,7 +168,7 @@ def process_regular_expressions_callback(app_instance):
                     else: construction_details_builder.append("  NFA: (Não gerado)\n\n")
                 except Exception as ve_re: construction_details_builder.append(f"  ERRO NFA '{name}': {ve_re}\n\n")
             process_successful = has_any_valid_nfa
-            if process_successful and widgets.get("combine_nfas_button") and app_instance.current_frame_name != "FullTestMode":
+            if process_successful and widgets.get("combine_nfas_button") and interactive:
                 widgets["combine_nfas_button"].configure(state="normal")
 
         elif app_instance.active_construction_method == "tree_direct_dfa":
@@ -101,13 +177,14 @@ def process_regular_expressions_callback(app_instance):
             
             if not app_instance.pattern_order or not app_instance.definitions:
                 update_display_tab(widgets, "ER ➔ NFA Ind. / Árvore+Followpos", "Nenhuma definição de RE para Followpos.")
-                if app_instance.current_frame_name != "FullTestMode":
+                if interactive:
                     messagebox.showwarning("Entrada Vazia", "Nenhuma definição de RE para Followpos.")
-                return
+                return False
 
             direct_dfa, aug_tree, pos_map, pseudo_nfa_union_display = regex_to_direct_dfa(
                 app_instance.definitions,
-                app_instance.pattern_order
+                app_instance.pattern_order,
+                mode_patterns_from_directives(app_instance.pattern_order, app_instance.pattern_directives)
             )
             
             followpos_nfa_union_tab_content = []
@@ -145,22 +222,24 @@ def process_regular_expressions_callback(app_instance):
             else:
                 construction_details_builder.append(f"  Falha ao gerar árvore ou followpos para AFD direto consolidado.\n")
             
-            if process_successful and direct_dfa and widgets.get("generate_dfa_button") and app_instance.current_frame_name != "FullTestMode":
+            if process_successful and direct_dfa and widgets.get("generate_dfa_button") and interactive:
                 widgets["generate_dfa_button"].configure(state="normal")
         
         update_display_tab(widgets, "ER ➔ NFA Ind. / Árvore+Followpos", "".join(construction_details_builder))
 
-        if app_instance.current_frame_name != "FullTestMode":
+        if interactive:
             if not process_successful:
                  messagebox.showwarning("Processamento Parcial/Falha", f"({app_instance.current_test_name}): Verifique os detalhes. Algumas etapas podem ter falhado.")
             else:
                 messagebox.showinfo("Sucesso (Etapa A)", f"({app_instance.current_test_name}): Processamento de REs concluído.")
+        return process_successful
 
     except Exception as e:
         tb_str = traceback.format_exc()
         error_message = f"({app_instance.current_test_name}): {type(e).__name__}: {str(e)}\n\nTraceback:\n{tb_str}"
         messagebox.showerror("Erro na Etapa A", error_message)
         update_display_tab(widgets, "ER ➔ NFA Ind. / Árvore+Followpos", f"Erro: {str(e)}\n{tb_str}")
+        return False
 
 
 def combine_all_nfas_callback(app_instance):
@@ -172,24 +251,8 @@ def combine_all_nfas_callback(app_instance):
     if not nfas_for_combination: messagebox.showerror("Sem NFAs Válidos", "Nenhum NFA individual válido para combinar."); return
     
     try:
-        DFA._next_dfa_id = 0
-        DFA._state_map = {}
-
-        app_instance.combined_nfa_start_obj, app_instance.combined_nfa_accept_map, app_instance.combined_nfa_alphabet = combine_nfas(nfas_for_combination)
-        if not app_instance.combined_nfa_start_obj:
+        if not _combine_nfas(app_instance, widgets):
             messagebox.showerror("Erro União NFA", "Falha ao criar NFA combinado."); return
-        
-        combined_nfa_shell = NFA(app_instance.combined_nfa_start_obj, None)
-        display_str_builder = [get_nfa_details_str(combined_nfa_shell, "NFA Combinado Global (Após União ε)", combined_accept_map=app_instance.combined_nfa_accept_map)]
-        
-        app_instance.unminimized_dfa = construct_unminimized_dfa_from_nfa(
-            app_instance.combined_nfa_start_obj, app_instance.combined_nfa_accept_map,
-            app_instance.combined_nfa_alphabet, app_instance.pattern_order
-        )
-        display_str_builder.append("\n\n====================\n\n")
-        display_str_builder.append(get_dfa_table_str(app_instance.unminimized_dfa, title_prefix="AFD Não Minimizado (Após Determinização): "))
-
-        update_display_tab(widgets, "NFA Combinado (União ε) / AFD Direto (Não-Minim.)", "\n".join(display_str_builder))
 
         if widgets.get("generate_dfa_button") and app_instance.current_frame_name != "FullTestMode":
             widgets["generate_dfa_button"].configure(state="normal")
@@ -201,6 +264,39 @@ def combine_all_nfas_callback(app_instance):
         messagebox.showerror("Erro Etapa B - Thompson", error_message)
         update_display_tab(widgets, "NFA Combinado (União ε) / AFD Direto (Não-Minim.)", f"Erro: {str(e)}\n{tb_str}")
 
+def _combine_nfas(app_instance, widgets):
+    '''
+    Etapa B (Thompson): une os NFAs individuais e determiniza, exibindo o NFA
+    combinado e o AFD não minimizado. Retorna False se a união falhou.
+    '''
+    nfas_for_combination = {k: v for k,v in app_instance.individual_nfas.items() if v is not None}
+    DFA._next_dfa_id = 0
+    DFA._state_map = {}
+
+    mode_patterns = mode_patterns_from_directives(app_instance.pattern_order, app_instance.pattern_directives)
+    mode_nfa_starts = None
+    if mode_patterns:
+        # Um estado inicial por modo; o NFA exibido é o do modo INITIAL
+        mode_nfa_starts, app_instance.combined_nfa_accept_map, app_instance.combined_nfa_alphabet = combine_nfas_by_mode(nfas_for_combination, mode_patterns)
+        app_instance.combined_nfa_start_obj = mode_nfa_starts[INITIAL_MODE]
+    else:
+        app_instance.combined_nfa_start_obj, app_instance.combined_nfa_accept_map, app_instance.combined_nfa_alphabet = combine_nfas(nfas_for_combination)
+    if not app_instance.combined_nfa_start_obj:
+        return False
+    
+    combined_nfa_shell = NFA(app_instance.combined_nfa_start_obj, None)
+    display_str_builder = [get_nfa_details_str(combined_nfa_shell, "NFA Combinado Global (Após União ε)", combined_accept_map=app_instance.combined_nfa_accept_map)]
+    
+    app_instance.unminimized_dfa = construct_unminimized_dfa_from_nfa(
+        app_instance.combined_nfa_start_obj, app_instance.combined_nfa_accept_map,
+        app_instance.combined_nfa_alphabet, app_instance.pattern_order, mode_nfa_starts
+    )
+    display_str_builder.append("\n\n====================\n\n")
+    display_str_builder.append(get_dfa_table_str(app_instance.unminimized_dfa, title_prefix="AFD Não Minimizado (Após Determinização): "))
+
+    update_display_tab(widgets, "NFA Combinado (União ε) / AFD Direto (Não-Minim.)", "\n".join(display_str_builder))
+    return True
+
 def generate_final_dfa_and_minimize_callback(app_instance):
     widgets = app_instance.get_current_mode_widgets()
     if not widgets: return
@@ -209,19 +305,27 @@ def generate_final_dfa_and_minimize_callback(app_instance):
     dfa_tables_display_builder = []
     
     try:
-        if not app_instance.unminimized_dfa:
+        if app_instance.cached_dfa is None and not app_instance.unminimized_dfa:
             if app_instance.current_frame_name != "FullTestMode":
                 messagebox.showerror("Processo Incompleto", "O AFD não minimizado (da Etapa B ou A-Followpos) não foi gerado.")
             return
 
-        dfa_tables_display_builder.append(get_dfa_table_str(app_instance.unminimized_dfa, title_prefix="AFD Não Minimizado (Entrada para Minimização): "))
-        
-        app_instance.dfa = _minimize_dfa(app_instance.unminimized_dfa)
-        dfa_tables_display_builder.append(get_dfa_table_str(app_instance.dfa, title_prefix="AFD Minimizado (Final): "))
+        if app_instance.cached_dfa is not None:
+            # Do cache, já com as palavras reservadas incorporadas; sem AFD não minimizado
+            app_instance.dfa = app_instance.cached_dfa
+            dfa_tables_display_builder.append(get_dfa_table_str(app_instance.dfa, title_prefix="AFD Minimizado (Final, do cache): "))
+        else:
+            dfa_tables_display_builder.append(get_dfa_table_str(app_instance.unminimized_dfa, title_prefix="AFD Não Minimizado (Entrada para Minimização): "))
+            app_instance.dfa = _minimize_dfa(app_instance.unminimized_dfa)
+            _store_cached_dfa(app_instance, app_instance.active_construction_method, app_instance.dfa)
+            dfa_tables_display_builder.append(get_dfa_table_str(app_instance.dfa, title_prefix="AFD Minimizado (Final): "))
         
         update_display_tab(widgets, "AFD Minimizado (Final)", "\n\n====================\n\n".join(dfa_tables_display_builder))
         
-        app_instance.lexer = Lexer(app_instance.dfa, app_instance.reserved_words_defs, app_instance.patterns_to_ignore, app_instance.symbol_table_instance)
+        app_instance.lexer = Lexer(app_instance.dfa, app_instance.reserved_words_defs, app_instance.patterns_to_ignore, app_instance.symbol_table_instance,
+                                   attribute_converters=attribute_converters_from_directives(app_instance.pattern_directives),
+                                   mode_patterns=mode_patterns_from_directives(app_instance.pattern_order, app_instance.pattern_directives),
+                                   mode_switches=mode_switches_from_directives(app_instance.pattern_directives))
 
         if app_instance.current_frame_name != "FullTestMode":
             if widgets.get("tokenize_button"): widgets["tokenize_button"].configure(state="normal")
@@ -333,6 +437,11 @@ def save_dfa_to_file_callback(app_instance):
             
             base_name, ext = os.path.splitext(filepath)
 
+            # Formato versionado, com nomes dos padrões, carregável com load_dfa
+            for suffix in (DFA_TEXT_SUFFIX, DFA_BINARY_SUFFIX):
+                save_dfa(f"{base_name}{suffix}", app_instance.dfa, app_instance.reserved_words_defs, app_instance.patterns_to_ignore,
+                         app_instance.pattern_order, app_instance.pattern_directives)
+
             hr_filepath_min = f"{base_name}_min_readable.txt"
             hr_content_min = get_dfa_table_str(app_instance.dfa, title_prefix="Minimized ");
             with open(hr_filepath_min, 'w', encoding='utf-8') as f_hr_min: f_hr_min.write(hr_content_min)
@@ -342,7 +451,7 @@ def save_dfa_to_file_callback(app_instance):
                 hr_content_unmin = get_dfa_table_str(app_instance.unminimized_dfa, title_prefix="Unminimized ");
                 with open(hr_filepath_unmin, 'w', encoding='utf-8') as f_hr_unmin: f_hr_unmin.write(hr_content_unmin)
 
-            messagebox.showinfo("Sucesso", "Tabela AFD Minimizada (Anexo II) e versões legíveis salvas.")
+            messagebox.showinfo("Sucesso", f"Tabela AFD Minimizada (Anexo II), versões legíveis e formatos carregáveis ({DFA_TEXT_SUFFIX}, {DFA_BINARY_SUFFIX}) salvos.")
         except Exception as e: messagebox.showerror("Erro Salvar AFD", str(e))
 
 def process_grammar_callback(app_instance):
@@ -450,15 +559,19 @@ def tokenize_source_callback(app_instance):
         return
     
     try:
-        tokens_data_list, populated_symbol_table = app_instance.lexer.tokenize(source_code)
+        # A tabela de símbolos persiste entre análises; aqui cada análise exibe a sua
+        app_instance.lexer.symbol_table.clear()
+        token_arrays, populated_symbol_table = app_instance.lexer.tokenize_columnar(source_code)
+        tokens_data_list = token_arrays.to_tuples()
         
         output_lines = [f"Tokens Gerados ({app_instance.current_test_name} - com AFD Minimizado):\n"]
         if not tokens_data_list:
             output_lines.append("(Nenhum token reconhecido)")
         else:
-            for lexema, token_type, attribute in tokens_data_list:
+            for token_index, (lexema, token_type, attribute) in enumerate(tokens_data_list):
                 if token_type == "ERRO!":
-                    output_lines.append(f"<'{lexema}', {token_type}>")
+                    # Linha e coluna só são calculadas para os erros
+                    output_lines.append(f"<'{lexema}', {token_type}> ({format_position(token_arrays.position(token_index))})")
                 elif token_type == "ID":
                     output_lines.append(f"<'{lexema}', {token_type}> (Atributo: índice {attribute})")
                 elif isinstance(attribute, (int, float)):
@@ -503,22 +616,33 @@ def run_part1_lexical_callback(app_instance):
         return
 
     try:
-        app_instance.definitions, app_instance.pattern_order, app_instance.reserved_words_defs, app_instance.patterns_to_ignore = parse_re_file_data(re_content)
+        app_instance.definitions, app_instance.pattern_order, app_instance.reserved_words_defs, app_instance.patterns_to_ignore, app_instance.pattern_directives = parse_re_file_data(re_content)
         
-        direct_dfa, _, _, _ = regex_to_direct_dfa(app_instance.definitions, app_instance.pattern_order)
-        minimized_dfa = _minimize_dfa(direct_dfa)
+        mode_patterns = mode_patterns_from_directives(app_instance.pattern_order, app_instance.pattern_directives)
+        minimized_dfa = _load_cached_dfa(app_instance, "tree_direct_dfa")
+        if minimized_dfa is None:
+            direct_dfa, _, _, _ = regex_to_direct_dfa(app_instance.definitions, app_instance.pattern_order, mode_patterns)
+            minimized_dfa = _minimize_dfa(direct_dfa)
+            _store_cached_dfa(app_instance, "tree_direct_dfa", minimized_dfa)
         
-        app_instance.lexer = Lexer(minimized_dfa, app_instance.reserved_words_defs, app_instance.patterns_to_ignore, app_instance.symbol_table_instance)
+        app_instance.lexer = Lexer(minimized_dfa, app_instance.reserved_words_defs, app_instance.patterns_to_ignore, app_instance.symbol_table_instance,
+                                   attribute_converters=attribute_converters_from_directives(app_instance.pattern_directives),
+                                   mode_patterns=mode_patterns,
+                                   mode_switches=mode_switches_from_directives(app_instance.pattern_directives))
         
-        tokens_data_list, populated_symbol_table = app_instance.lexer.tokenize(source_code)
+        app_instance.lexer.symbol_table.clear()
+        token_arrays, populated_symbol_table = app_instance.lexer.tokenize_columnar(source_code)
+        tokens_data_list = token_arrays.to_tuples()
         app_instance.generated_token_stream = tokens_data_list
+        # Mantido para localizar (linha, coluna) dos erros da Parte 2
+        app_instance.generated_token_arrays = token_arrays
 
         token_output_lines = []
         lexical_output_lines = [f"Tokens Gerados para '{app_instance.current_test_name}':\n"]
-        for lexema, token_type, attribute in tokens_data_list:
+        for token_index, (lexema, token_type, attribute) in enumerate(tokens_data_list):
             token_output_lines.append(f"{token_type},{attribute if attribute is not None else ''}")
             if token_type == "ERRO!":
-                lexical_output_lines.append(f"<'{lexema}', {token_type}>")
+                lexical_output_lines.append(f"<'{lexema}', {token_type}> ({format_position(token_arrays.position(token_index))})")
             elif token_type == "ID":
                 lexical_output_lines.append(f"<'{lexema}', {token_type}> (Atributo: índice {attribute})")
             else:
@@ -571,7 +695,9 @@ def run_part2_syntactic_callback(app_instance):
         update_display_tab(widgets, "Tabela de Análise SLR", get_slr_table_str(action_table, goto_table, grammar))
 
         parser = SLRParser(grammar, action_table, goto_table)
-        steps, success, message = parser.parse(list(app_instance.generated_token_stream))
+        token_arrays = app_instance.generated_token_arrays
+        steps, success, message = parser.parse(list(app_instance.generated_token_stream),
+                                               token_arrays.position if token_arrays is not None else None)
         update_display_tab(widgets, "Passos da Análise", get_parse_steps_str(steps, success, message))
 
         if success:
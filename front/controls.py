@@ -53,7 +53,7 @@ def create_shared_controls_and_display(parent_frame, app_instance):
     back_button.pack(pady=(20,10), padx=10, fill="x")
     widgets["back_button"] = back_button
 
-    display_tab_view = ctk.CTkTabview(parent_frame) 
+    display_tab_view = ctk.CTkTabview(parent_frame, command=app_instance.show_deferred_construction_views)
     display_tab_view.grid(row=0, column=1, padx=10, pady=10, sticky="nsew")
     widgets["display_tab_view"] = display_tab_view
     
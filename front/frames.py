@@ -243,7 +243,7 @@ def create_full_test_mode_frame_widgets(app_instance):
     )
     back_button.pack(pady=(20, 10), padx=10, fill="x")
 
-    right_panel = ctk.CTkTabview(frame)
+    right_panel = ctk.CTkTabview(frame, command=app_instance.show_deferred_construction_views)
     right_panel.grid(row=0, column=1, padx=10, pady=10, sticky="nsew")
     app_instance.full_test_mode_widgets["display_tab_view"] = right_panel
 
@@ -68,6 +68,8 @@ def get_dfa_table_str(dfa, title_prefix=""):
 
     output.append(f"Number of states: {len(dfa.states)}")
     output.append(f"Start State: {dfa.start_state_id}")
+    if dfa.mode_start_states:
+        output.append(f"Mode Start States: {', '.join(f'{mode}={s_id}' for mode, s_id in dfa.mode_start_states.items())}")
     
     accept_states_str_parts = [f"{s_id}({p_name})" for s_id, p_name in sorted(dfa.accept_states.items())]
     output.append(f"Accept States (ID(Pattern)): {', '.join(accept_states_str_parts) if accept_states_str_parts else 'None'}")
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Os testes importam 'core' e 'tests' a partir da raiz do projeto, de qualquer
+# diretório em que o pytest seja executado
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,69 @@
+import pytest
+
+from core.automata import _minimize_dfa
+from core.byte_lexer import decode_lexeme, mapped_file, utf8_character_length
+from core.lexer_core import Lexer, parse_re_file_data
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+from tests import TEST_CASES
+
+SPEC = '''ID: [a-z]+
+CJK: [一-龥]+
+WS: [ ]+ %ignore
+'''
+
+
+def build_lexer(spec=SPEC, **lexer_options):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, _ = parse_re_file_data(spec)
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0])
+    return Lexer(dfa, reserved_words, patterns_to_ignore, **lexer_options)
+
+
+@pytest.mark.parametrize("buffer, expected", [
+    ("ab 一二 x".encode(), [(0, 2, "ID"), (3, 6, "CJK"), (10, 1, "ID")]),
+    (b"ab \xff cd", [(0, 2, "ID"), (3, 1, "ERRO!"), (5, 2, "ID")]),              # byte inválido
+    (b"\x80ab", [(0, 1, "ERRO!"), (1, 2, "ID")]),                               # continuação solta
+    (b"ab \xe4\xb8", [(0, 2, "ID"), (3, 2, "ERRO!")]),                          # truncado no fim
+    (b"ab \xe4\xb8x", [(0, 2, "ID"), (3, 2, "ERRO!"), (5, 1, "ID")]),           # truncado antes de ASCII
+    (b"a\xe4\xb8\xe4\xb8\x80b", [(0, 1, "ID"), (1, 2, "ERRO!"), (3, 3, "CJK"), (6, 1, "ID")]),
+    ("ab é".encode(), [(0, 2, "ID"), (3, 2, "ERRO!")]),                          # caractere fora do alfabeto
+])
+def test_invalid_and_truncated_utf8(buffer, expected):
+    assert build_lexer().tokenize_bytes(buffer) == expected
+
+
+def test_truncated_utf8_with_coalesced_errors():
+    lexer = build_lexer(coalesce_errors=True)
+    assert lexer.tokenize_bytes(b"?\xff\xfe ab") == [(0, 3, "ERRO!"), (4, 2, "ID")]
+    # O erro para antes do caractere seguinte, que pode iniciar um token
+    assert lexer.tokenize_bytes(b"a\xe4\xb8\xe4\xb8\x80b") == [(0, 1, "ID"), (1, 2, "ERRO!"), (3, 3, "CJK"),
+                                                                (6, 1, "ID")]
+
+
+def test_character_length_stops_at_non_continuation_byte():
+    assert utf8_character_length("é".encode(), 0) == 2
+    assert utf8_character_length(b"\xf0\x9f\x98", 0) == 3
+    assert utf8_character_length(b"\xf0\x9f\x98\x80", 0) == 4
+    assert utf8_character_length(b"\xe4a", 0) == 1
+    assert utf8_character_length(b"\xbf\xbf", 0) == 1
+
+
+def test_mapped_file_matches_text_tokenization(tmp_path):
+    for case_index, test_case in enumerate(TEST_CASES):
+        lexer = build_lexer(test_case["re_definitions"])
+        source_code = test_case["source_code"] + " é 一"
+        filepath = tmp_path / f"case{case_index}.txt"
+        filepath.write_bytes(source_code.encode())
+
+        text_tokens = lexer.tokenize(source_code)[0]
+        with mapped_file(str(filepath)) as buffer:
+            byte_tokens = lexer.tokenize_bytes(buffer)
+            lexemes = [decode_lexeme(buffer, offset, length) for offset, length, _ in byte_tokens]
+        assert lexemes == [lexeme for lexeme, _, _ in text_tokens]
+        assert [token_type for _, _, token_type in byte_tokens] == [token_type for _, token_type, _ in text_tokens]
+
+
+def test_mapped_empty_file(tmp_path):
+    filepath = tmp_path / "empty.txt"
+    filepath.write_bytes(b"")
+    with mapped_file(str(filepath)) as buffer:
+        assert build_lexer().tokenize_bytes(buffer) == []
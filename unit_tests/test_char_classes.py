@@ -0,0 +1,76 @@
+import pytest
+
+from core.automata import _minimize_dfa
+from core.char_ranges import class_token_ranges
+from core.compiled_dfa import CompiledDFA, RangeClassTable
+from core.lexer_core import Lexer, parse_re_file_data
+from core.regex_utils import expand_char_class
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+
+FIRST_CJK = "一"
+LAST_CJK = "龥"
+
+
+@pytest.mark.parametrize("char_class, expected_ranges", [
+    ("[a-c_]", [(95, 95), (97, 99)]),
+    # Qualquer par de pontas em ordem crescente é um intervalo, inclusive de pontuação
+    ("[+-/]", [(43, 47)]),
+    ("[ -~]", [(32, 126)]),
+    # '-' depois de um intervalo, no início ou no fim da classe é literal
+    ("[0-9-_]", [(45, 45), (48, 57), (95, 95)]),
+    ("[-a]", [(45, 45), (97, 97)]),
+    ("[a-]", [(45, 45), (97, 97)]),
+    # Pontas em ordem decrescente não formam intervalo: os três caracteres são literais
+    ("[z-a]", [(45, 45), (97, 97), (122, 122)]),
+    ("[\\-x]", [(45, 45), (120, 120)]),
+    ("[一-龥]", [(ord(FIRST_CJK), ord(LAST_CJK))]),
+])
+def test_expand_char_class(char_class, expected_ranges):
+    assert class_token_ranges(expand_char_class(char_class)) == expected_ranges
+
+
+def test_single_character_classes_become_literals():
+    assert expand_char_class("[+]") == "\\+"
+    assert expand_char_class("[\\]]") == "\\]"
+    assert expand_char_class("[a]") == "a"
+    assert expand_char_class("[]") == ""
+
+
+def test_bmp_sized_class_keeps_a_small_alphabet():
+    definitions, pattern_order, reserved_words, patterns_to_ignore, _ = parse_re_file_data(
+        "CJK: [一-龥]+\nID: [a-z]+\nANY: [\u0080-￿]\nWS: [ ]+ %ignore")
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0])
+    # Os intervalos são rótulos de transição: o alfabeto tem poucos símbolos, não um por caractere
+    assert len(dfa.alphabet) <= 6
+    compiled_dfa = CompiledDFA(dfa)
+    assert compiled_dfa.num_classes <= 6
+    assert len(compiled_dfa.char_classes.lows) <= 3
+
+    tokens = Lexer(dfa, reserved_words, patterns_to_ignore).tokenize(
+        f"{FIRST_CJK}{LAST_CJK}中 abc é {chr(ord(FIRST_CJK) - 1)}{chr(ord(LAST_CJK) + 1)}")[0]
+    assert [(lexeme, token_type) for lexeme, token_type, _ in tokens] == [
+        (f"{FIRST_CJK}{LAST_CJK}中", "CJK"), ("abc", "ID"), ("é", "ANY"),
+        (chr(ord(FIRST_CJK) - 1), "ANY"), (chr(ord(LAST_CJK) + 1), "ANY")]
+
+
+def test_range_class_table_lookups_at_range_edges():
+    table = RangeClassTable([(1000, 2000, 3), (200, 300, 1), (301, 301, 2)])
+    expected = {150: 0, 199: 0, 200: 1, 250: 1, 300: 1, 301: 2, 302: 0, 999: 0, 1000: 3, 2000: 3, 2001: 0,
+                0x10FFFF: 0}
+    for code, class_id in expected.items():
+        assert table[chr(code)] == class_id, code
+    # O resultado da busca binária fica guardado no próprio dicionário
+    assert set(table) == {chr(code) for code in expected}
+    assert RangeClassTable([])["é"] == 0
+
+
+def test_compiled_classes_at_range_edges():
+    definitions, pattern_order, _, _, _ = parse_re_file_data("CJK: [一-龥]\nLATIN: [À-ÿ]")
+    compiled_dfa = CompiledDFA(_minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0]))
+    cjk_class = compiled_dfa.char_class(FIRST_CJK)
+    latin_class = compiled_dfa.char_class("À")
+    assert cjk_class > 0 and latin_class > 0 and cjk_class != latin_class
+    assert compiled_dfa.char_class(LAST_CJK) == cjk_class
+    assert compiled_dfa.char_class("ÿ") == latin_class
+    for outside in (chr(ord(FIRST_CJK) - 1), chr(ord(LAST_CJK) + 1), chr(ord("À") - 1), "Ā", "a"):
+        assert compiled_dfa.char_class(outside) == 0
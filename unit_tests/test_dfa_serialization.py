@@ -0,0 +1,123 @@
+import pytest
+
+from core import lexer_core
+from core.automata import _minimize_dfa
+from core.compiled_dfa import CompiledDFA
+from core.dfa_serialization import (DFA_TEXT_SUFFIX, DFA_BINARY_SUFFIX, DFATables, MappedDFA, save_dfa, load_dfa,
+                                    load_lexer, dfa_to_text, dfa_tables_from_text)
+from core.lexer_core import (Lexer, parse_re_file_data, attribute_converters_from_directives,
+                             mode_patterns_from_directives, mode_switches_from_directives)
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+from tests import TEST_CASES
+
+MODE_SPEC = r'''IF: if
+ID: [a-zA-Z_][a-zA-Z0-9_]*
+NUM: [0-9]+ %attr=int
+QUOTE: " %begin=STR
+COMMENT_OPEN: /\* %ignore %begin=COMMENT
+WS: [ ]+ %ignore
+<STR>STR_TEXT: [a-zA-Z0-9 ]+
+<STR>STR_END: " %begin=INITIAL
+<COMMENT>COMMENT_BODY: [a-zA-Z0-9 ]+ %ignore
+<COMMENT>COMMENT_END: \*/ %ignore %begin=INITIAL
+'''
+MODE_SOURCE = 'if x "if y 12" 7 /* if 3 */ if"a" 42 é'
+
+
+def build_spec(spec_text):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, directives = parse_re_file_data(spec_text)
+    mode_patterns = mode_patterns_from_directives(pattern_order, directives)
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order, mode_patterns)[0])
+    return dfa, pattern_order, reserved_words, patterns_to_ignore, directives
+
+
+def spec_lexer(dfa, pattern_order, reserved_words, patterns_to_ignore, directives, **lexer_options):
+    return Lexer(dfa, reserved_words, patterns_to_ignore,
+                 attribute_converters=attribute_converters_from_directives(directives),
+                 mode_patterns=mode_patterns_from_directives(pattern_order, directives),
+                 mode_switches=mode_switches_from_directives(directives), **lexer_options)
+
+
+@pytest.mark.parametrize("suffix", [DFA_TEXT_SUFFIX, DFA_BINARY_SUFFIX])
+def test_round_trip_keeps_modes_and_directives(tmp_path, suffix):
+    spec = build_spec(MODE_SPEC)
+    dfa, pattern_order, reserved_words, patterns_to_ignore, directives = spec
+    filepath = str(tmp_path / ("lexer" + suffix))
+    save_dfa(filepath, dfa, reserved_words, patterns_to_ignore, pattern_order, directives)
+
+    loaded_dfa, loaded_reserved, loaded_ignored, loaded_order, loaded_directives = load_dfa(filepath)
+    assert (loaded_reserved, loaded_ignored) == (reserved_words, patterns_to_ignore)
+    assert (loaded_order, loaded_directives) == (pattern_order, directives)
+    assert set(loaded_dfa.mode_start_states) == set(dfa.mode_start_states)
+
+    expected = spec_lexer(*spec).tokenize(MODE_SOURCE)[0]
+    assert ("42", "NUM", 42) in expected and ("if y 12", "STR_TEXT", "if y 12") in expected
+    assert load_lexer(filepath).tokenize(MODE_SOURCE)[0] == expected
+    assert (load_lexer(filepath, coalesce_errors=True).tokenize(MODE_SOURCE)[0]
+            == spec_lexer(*spec, coalesce_errors=True).tokenize(MODE_SOURCE)[0])
+
+
+@pytest.mark.parametrize("suffix", [DFA_TEXT_SUFFIX, DFA_BINARY_SUFFIX])
+def test_round_trip_of_test_cases(tmp_path, suffix):
+    for case_index, test_case in enumerate(TEST_CASES):
+        spec = build_spec(test_case["re_definitions"])
+        dfa, pattern_order, reserved_words, patterns_to_ignore, directives = spec
+        filepath = str(tmp_path / (f"case{case_index}" + suffix))
+        save_dfa(filepath, dfa, reserved_words, patterns_to_ignore, pattern_order, directives)
+        expected = spec_lexer(*spec).tokenize(test_case["source_code"])[0]
+        assert load_lexer(filepath).tokenize(test_case["source_code"])[0] == expected
+
+
+@pytest.mark.parametrize("suffix", [DFA_TEXT_SUFFIX, DFA_BINARY_SUFFIX])
+def test_load_lexer_builds_the_compiled_dfa_from_the_tables(tmp_path, monkeypatch, suffix):
+    spec = build_spec(MODE_SPEC)
+    dfa, pattern_order, reserved_words, patterns_to_ignore, directives = spec
+    filepath = str(tmp_path / ("lexer" + suffix))
+    save_dfa(filepath, dfa, reserved_words, patterns_to_ignore, pattern_order, directives)
+    expected_lexer = spec_lexer(*spec)
+
+    def not_called(*args, **kwargs):
+        raise AssertionError("load_lexer must not rebuild the DFA")
+
+    # Nem o AFD com seus dicionários, nem a incorporação das palavras reservadas,
+    # nem o agrupamento das classes de CompiledDFA.__init__
+    monkeypatch.setattr(DFATables, "to_dfa", not_called)
+    monkeypatch.setattr(CompiledDFA, "__init__", not_called)
+    monkeypatch.setattr(lexer_core, "fold_reserved_words", not_called)
+    lexer = load_lexer(filepath)
+    compiled_dfa, expected = lexer.compiled_dfa, expected_lexer.compiled_dfa
+    for name in ("num_states", "num_classes", "start", "mode_starts", "accepts", "keywords", "rows",
+                 "ascii_classes", "class_ranges"):
+        assert getattr(compiled_dfa, name) == getattr(expected, name), name
+    assert ([scanner is None for scanner in compiled_dfa.self_loop_scanners]
+            == [scanner is None for scanner in expected.self_loop_scanners])
+    assert lexer.tokenize(MODE_SOURCE)[0] == expected_lexer.tokenize(MODE_SOURCE)[0]
+    assert lexer.tokenize_bytes(MODE_SOURCE.encode()) == expected_lexer.tokenize_bytes(MODE_SOURCE.encode())
+
+
+def test_text_and_binary_forms_have_the_same_tables(tmp_path):
+    dfa, pattern_order, reserved_words, patterns_to_ignore, directives = build_spec(MODE_SPEC)
+    filepath = str(tmp_path / ("lexer" + DFA_BINARY_SUFFIX))
+    save_dfa(filepath, dfa, reserved_words, patterns_to_ignore, pattern_order, directives)
+    text_tables = dfa_tables_from_text(dfa_to_text(dfa, reserved_words, patterns_to_ignore, pattern_order, directives))
+    with MappedDFA(filepath) as mapped:
+        binary_tables = mapped.tables()
+        for name in ("num_states", "num_classes", "start", "accepts", "keywords", "ranges", "mode_starts",
+                     "reserved_words", "patterns_to_ignore", "pattern_order", "pattern_directives"):
+            assert getattr(binary_tables, name) == getattr(text_tables, name), name
+        assert list(binary_tables.rows) == list(text_tables.rows)
+
+
+@pytest.mark.parametrize("suffix", [DFA_TEXT_SUFFIX, DFA_BINARY_SUFFIX])
+def test_dfa_with_modes_requires_directives(tmp_path, suffix):
+    dfa, pattern_order, reserved_words, patterns_to_ignore, _ = build_spec(MODE_SPEC)
+    with pytest.raises(ValueError, match="lexer modes"):
+        save_dfa(str(tmp_path / ("lexer" + suffix)), dfa, reserved_words, patterns_to_ignore, pattern_order)
+
+
+def test_unsupported_version_is_rejected():
+    dfa, pattern_order, reserved_words, patterns_to_ignore, directives = build_spec(TEST_CASES[0]["re_definitions"])
+    text = dfa_to_text(dfa, reserved_words, patterns_to_ignore, pattern_order, directives)
+    header, _, rest = text.partition("\n")
+    with pytest.raises(ValueError, match="Unsupported"):
+        dfa_tables_from_text(header.split()[0] + " 1\n" + rest)
@@ -0,0 +1,74 @@
+import pytest
+
+from core.automata import _minimize_dfa
+from core.byte_lexer import decode_lexeme
+from core.lexer_core import Lexer, parse_re_file_data, mode_patterns_from_directives, mode_switches_from_directives
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+
+SPEC = '''ID: [a-z]+
+NUM: [0-9]+
+OP: [=+]
+WS: [ ]+ %ignore
+'''
+# Em STR, os dígitos não iniciam token: entram na sequência de erro
+MODE_SPEC = SPEC + '''QUOTE: " %begin=STR
+<STR>STR_TEXT: [a-z]+
+<STR>STR_END: " %begin=INITIAL
+'''
+
+
+def build_lexer(spec=SPEC, **lexer_options):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, directives = parse_re_file_data(spec)
+    mode_patterns = mode_patterns_from_directives(pattern_order, directives)
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order, mode_patterns)[0])
+    return Lexer(dfa, reserved_words, patterns_to_ignore, mode_patterns=mode_patterns,
+                 mode_switches=mode_switches_from_directives(directives), **lexer_options)
+
+
+@pytest.mark.parametrize("source_code, expected", [
+    # Entre tokens válidos
+    ("a ?#! b", [("a", "ID", 0), ("?#!", "ERRO!", "?#!"), ("b", "ID", 1)]),
+    ("a?#!b", [("a", "ID", 0), ("?#!", "ERRO!", "?#!"), ("b", "ID", 1)]),
+    # A sequência para no espaço, que inicia o padrão ignorado
+    ("1 ?? ?! 2", [("1", "NUM", 1), ("??", "ERRO!", "??"), ("?!", "ERRO!", "?!"), ("2", "NUM", 2)]),
+    # No fim da entrada, com caracteres não ASCII
+    ("x = 1 çã?", [("x", "ID", 0), ("=", "OP", "="), ("1", "NUM", 1), ("çã?", "ERRO!", "çã?")]),
+    ("?", [("?", "ERRO!", "?")]),
+    # No início
+    ("!!x", [("!!", "ERRO!", "!!"), ("x", "ID", 0)]),
+])
+def test_error_runs(source_code, expected):
+    assert build_lexer(coalesce_errors=True).tokenize(source_code)[0] == expected
+    token_arrays = build_lexer(coalesce_errors=True).tokenize_columnar(source_code)[0]
+    assert token_arrays.to_tuples() == expected
+    # Sem coalesce_errors, um erro por caractere
+    uncoalesced = build_lexer().tokenize(source_code)[0]
+    assert [lexeme for lexeme, token_type, _ in uncoalesced if token_type == "ERRO!"] == [
+        char for lexeme, token_type, _ in expected if token_type == "ERRO!" for char in lexeme]
+
+
+def test_error_runs_depend_on_the_mode():
+    tokens = build_lexer(MODE_SPEC, coalesce_errors=True).tokenize('a 12?? "ab12?? cd" 7')[0]
+    assert tokens == [("a", "ID", 0), ("12", "NUM", 12), ("??", "ERRO!", "??"), ('"', "QUOTE", '"'),
+                      ("ab", "STR_TEXT", "ab"), ("12?? ", "ERRO!", "12?? "), ("cd", "STR_TEXT", "cd"),
+                      ('"', "STR_END", '"'), ("7", "NUM", 7)]
+
+
+@pytest.mark.parametrize("spec", [SPEC, MODE_SPEC])
+def test_error_runs_in_byte_mode(spec):
+    source_code = 'a ?#! b çã? x = 1 "ab12 é" 2 ??'
+    expected = build_lexer(spec, coalesce_errors=True).tokenize(source_code)[0]
+    buffer = source_code.encode()
+    byte_tokens = build_lexer(spec, coalesce_errors=True).tokenize_bytes(buffer)
+    assert [(decode_lexeme(buffer, offset, length), token_type) for offset, length, token_type in byte_tokens] == [
+        (lexeme, token_type) for lexeme, token_type, _ in expected]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5])
+@pytest.mark.parametrize("spec", [SPEC, MODE_SPEC])
+def test_error_runs_across_stream_chunks(spec, chunk_size):
+    source_code = 'a ?#!?#!?#! b çã? x = 1 "ab12???? é" 2 ????????'
+    expected = build_lexer(spec, coalesce_errors=True).tokenize(source_code)[0]
+    assert ("????????", "ERRO!", "????????") in expected
+    chunks = [source_code[base:base + chunk_size] for base in range(0, len(source_code), chunk_size)]
+    assert list(build_lexer(spec, coalesce_errors=True).tokenize_stream(chunks)) == expected
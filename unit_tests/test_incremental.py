@@ -0,0 +1,107 @@
+import random
+
+import pytest
+
+from core.automata import _minimize_dfa
+from core.lexer_core import Lexer, parse_re_file_data
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+from tests import TEST_CASES
+
+SPEC = TEST_CASES[10]["re_definitions"]
+LINE = TEST_CASES[10]["source_code"]
+SOURCE = "\n".join([LINE] * 20)
+# Posição de um token no meio do texto: 'result' da 10ª linha
+MIDDLE = SOURCE.index("result", len(SOURCE) // 2)
+
+
+def build_lexer(**lexer_options):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, _ = parse_re_file_data(SPEC + "\nNL: \\n %ignore")
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0])
+    return Lexer(dfa, reserved_words, patterns_to_ignore, **lexer_options)
+
+
+def normalized(tokens, symbol_table):
+    '''
+    Tokens com o lexema no lugar do índice na tabela de símbolos: a reanálise
+    não limpa a tabela, então os índices diferem dos de uma análise nova.
+    '''
+    interned_types = symbol_table.interned_types
+    return [(lexeme, token_type, symbol_table.lexeme(attribute) if token_type in interned_types else attribute)
+            for lexeme, token_type, attribute in tokens]
+
+
+def expected_tokens(text):
+    return normalized(*build_lexer().tokenize(text))
+
+
+def apply_edit(lexer, tokens, text, edit_offset, deleted_length, inserted_text):
+    new_text = text[:edit_offset] + inserted_text + text[edit_offset + deleted_length:]
+    tokens, symbol_table = lexer.tokenize_incremental(tokens, edit_offset, deleted_length, inserted_text, new_text)
+    return tokens, symbol_table, new_text
+
+
+@pytest.mark.parametrize("edit_offset, deleted_length, inserted_text", [
+    (0, 0, "x"),                                  # inserção no início, emenda com 'let'
+    (0, 0, "let b = 1; "),                        # tokens novos no início
+    (0, 4, ""),                                   # remoção no início
+    (MIDDLE, 0, "x"),                             # meio de um token
+    (MIDDLE, 0, " "),                             # divide um token em dois
+    (MIDDLE - 1, 1, ""),                          # remove o espaço antes do token: junta dois tokens
+    (MIDDLE, 6, ""),                              # remove um token inteiro
+    (MIDDLE, 6, "a_much_longer_identifier"),      # troca um token por outro maior
+    (MIDDLE + 6, 0, "99"),                        # fim de um token
+    (MIDDLE - 20, 40, "("),                       # remove vários tokens
+    (len(SOURCE), 0, " z = 1;"),                  # inserção no fim
+    (len(SOURCE) - 1, 1, ""),                     # remove o último caractere
+    (len(SOURCE) - 4, 4, " + 2"),                 # troca o fim
+])
+def test_single_edit_matches_full_tokenization(edit_offset, deleted_length, inserted_text):
+    lexer = build_lexer()
+    tokens, _ = lexer.tokenize_columnar(SOURCE)
+    tokens, symbol_table, new_text = apply_edit(lexer, tokens, SOURCE, edit_offset, deleted_length, inserted_text)
+    assert tokens.source_code == new_text
+    assert normalized(tokens, symbol_table) == expected_tokens(new_text)
+    assert list(tokens.starts) == list(build_lexer().tokenize_columnar(new_text)[0].starts)
+
+
+def test_edit_sequence_with_pending_shifts():
+    '''
+    Várias edições sem ler as colunas inteiras entre elas: os deslocamentos
+    pendentes se acumulam e só a leitura no fim os aplica.
+    '''
+    rng = random.Random(7)
+    lexer = build_lexer()
+    text = SOURCE
+    tokens, _ = lexer.tokenize_columnar(text)
+    for _ in range(200):
+        if rng.random() < 0.5 and len(tokens):
+            # Na fronteira de um token
+            index = rng.randrange(len(tokens))
+            edit_offset = tokens.start(index) + rng.choice((0, tokens.lengths[index]))
+        else:
+            edit_offset = rng.randint(0, len(text))
+        deleted_length = rng.randint(0, min(5, len(text) - edit_offset))
+        inserted_text = "".join(rng.choice("ab1 =(;.\n") for _ in range(rng.randint(0, 5)))
+        tokens, symbol_table, text = apply_edit(lexer, tokens, text, edit_offset, deleted_length, inserted_text)
+        reaches = [tokens.reach(index) for index in range(len(tokens))]
+        assert reaches == sorted(reaches)
+    assert normalized(tokens, symbol_table) == expected_tokens(text)
+    fresh_tokens = build_lexer().tokenize_columnar(text)[0]
+    assert list(tokens.starts) == list(fresh_tokens.starts)
+    assert all(reach >= fresh_reach for reach, fresh_reach in zip(tokens.reaches, fresh_tokens.reaches))
+
+
+def test_edit_updates_previous_tokens_in_place():
+    lexer = build_lexer()
+    tokens, _ = lexer.tokenize_columnar(SOURCE)
+    new_tokens, _, new_text = apply_edit(lexer, tokens, SOURCE, MIDDLE, 0, "x")
+    assert new_tokens is tokens and tokens.source_code == new_text
+
+
+def test_edit_outside_source_is_rejected():
+    lexer = build_lexer()
+    tokens, _ = lexer.tokenize_columnar(SOURCE)
+    with pytest.raises(ValueError):
+        lexer.tokenize_incremental(tokens, len(SOURCE) + 1, 0, "x", SOURCE + "x")
+    with pytest.raises(ValueError):
+        lexer.tokenize_incremental(tokens, 0, 0, "x", SOURCE)
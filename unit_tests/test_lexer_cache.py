@@ -0,0 +1,242 @@
+import os
+
+import pytest
+
+from core.automata import _minimize_dfa
+from core import lexer_cache
+from core.dfa_serialization import load_dfa
+from core.lexer_cache import LexerCache, DEFAULT_LEXER_CACHE_DIR, LEXER_CACHE_SUFFIX, lexer_cache_key
+from core.lexer_core import (Lexer, SymbolTable, parse_re_file_data, mode_patterns_from_directives,
+                             mode_switches_from_directives)
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+
+MODE_SPEC = r'''IF: if
+ID: [a-zA-Z_][a-zA-Z0-9_]*
+NUM: [0-9]+
+QUOTE: " %begin=STR
+WS: [ ]+ %ignore
+<STR>STR_TEXT: [a-zA-Z0-9 ]+
+<STR>STR_END: " %begin=INITIAL
+'''
+MODE_SOURCE = 'if x "if y 12" 7 if"a"'
+
+
+def build_spec(spec_text):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, directives = parse_re_file_data(spec_text)
+    mode_patterns = mode_patterns_from_directives(pattern_order, directives)
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order, mode_patterns)[0])
+    return dfa, reserved_words, patterns_to_ignore, pattern_order, directives
+
+
+def spec_tokens(dfa, reserved_words, patterns_to_ignore, pattern_order, directives):
+    return Lexer(dfa, reserved_words, patterns_to_ignore,
+                 mode_patterns=mode_patterns_from_directives(pattern_order, directives),
+                 mode_switches=mode_switches_from_directives(directives)).tokenize(MODE_SOURCE)[0]
+
+
+def put_entry(cache, key):
+    cache.put(key, *build_spec(MODE_SPEC))
+    return cache.entry_path(key)
+
+
+def test_cache_get_returns_stored_entry(tmp_path):
+    spec = build_spec(MODE_SPEC)
+    cache = LexerCache(str(tmp_path))
+    key = lexer_cache_key(*parse_re_file_data(MODE_SPEC), "tree_direct_dfa")
+    assert cache.get(key) is None
+    cache.put(key, *spec)
+    # A entrada é um AFD binário de dfa_serialization, lido com load_dfa
+    assert os.listdir(tmp_path) == [key + LEXER_CACHE_SUFFIX]
+    loaded = cache.get(key)
+    assert loaded[1:] == spec[1:] == load_dfa(cache.entry_path(key))[1:]
+    assert set(loaded[0].mode_start_states) == set(spec[0].mode_start_states)
+    expected = spec_tokens(*spec)
+    assert ("if", "IF", None) in expected and ("if y 12", "STR_TEXT", "if y 12") in expected
+    assert spec_tokens(*loaded) == expected
+    # Comentários e linhas vazias não mudam a chave; o método de construção muda
+    assert lexer_cache_key(*parse_re_file_data("# modos\n\n" + MODE_SPEC), "tree_direct_dfa") == key
+    assert lexer_cache_key(*parse_re_file_data(MODE_SPEC), "thompson") != key
+
+
+@pytest.mark.parametrize("cut", [0, 10, 40, -20, -1])
+def test_truncated_file_is_rejected(tmp_path, cut):
+    cache = LexerCache(str(tmp_path))
+    filepath = put_entry(cache, "entry")
+    with open(filepath, 'rb') as f_in:
+        data = f_in.read()
+    with open(filepath, 'wb') as f_out:
+        f_out.write(data[:cut])
+    with pytest.raises(ValueError):
+        load_dfa(filepath)
+    # O cache trata a entrada ilegível como ausente e a apaga
+    assert cache.get("entry") is None
+    assert not os.path.exists(filepath)
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: b"XXXX" + data[4:],             # magic
+    lambda data: data[:4] + b"\x63" + data[5:],  # versão
+    lambda data: data + b"\x00",                 # lixo no fim
+    lambda data: data[:-12] + b"\xff" * 12,      # texto das strings
+])
+def test_corrupted_file_is_rejected(tmp_path, corrupt):
+    cache = LexerCache(str(tmp_path))
+    filepath = put_entry(cache, "entry")
+    with open(filepath, 'rb') as f_in:
+        data = f_in.read()
+    with open(filepath, 'wb') as f_out:
+        f_out.write(corrupt(data))
+    assert cache.get("entry") is None
+    assert not os.path.exists(filepath)
+
+
+def test_eviction_removes_least_recently_used_entries(tmp_path):
+    cache = LexerCache(str(tmp_path))
+    for index in range(3):
+        put_entry(cache, f"k{index}")
+        # mtimes explícitos e crescentes: k0 é a entrada usada há mais tempo
+        os.utime(cache.entry_path(f"k{index}"), ns=(index * 10**9, (index + 1) * 10**9))
+    entry_size = os.path.getsize(cache.entry_path("k0"))
+    cache.max_bytes = 3 * entry_size
+
+    # A leitura de k0 a torna a mais recente; k1 passa a ser a mais antiga
+    assert cache.get("k0") is not None
+    put_entry(cache, "k3")
+    assert sorted(os.listdir(tmp_path)) == ["k0" + LEXER_CACHE_SUFFIX, "k2" + LEXER_CACHE_SUFFIX,
+                                            "k3" + LEXER_CACHE_SUFFIX]
+
+    cache.max_bytes = entry_size
+    cache.evict(keep=cache.entry_path("k2"))
+    assert os.listdir(tmp_path) == ["k2" + LEXER_CACHE_SUFFIX]
+
+
+def test_default_cache_dir_does_not_depend_on_working_directory():
+    assert os.path.isabs(DEFAULT_LEXER_CACHE_DIR)
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(lexer_cache.__file__)))
+    assert os.path.dirname(DEFAULT_LEXER_CACHE_DIR) == project_dir
+
+
+class FakeWidget:
+    '''
+    Caixa de texto/botão/abas mínima para chamar os callbacks da interface.
+    '''
+    def __init__(self, text=""):
+        self.text = text
+
+    def get(self, *args):
+        return self.text
+
+    def configure(self, **options):
+        pass
+
+    def delete(self, *args):
+        self.text = ""
+
+    def insert(self, index, text):
+        self.text = text
+
+
+class FakeApp:
+    def __init__(self, cache_dir, method, spec=MODE_SPEC, source_code=MODE_SOURCE):
+        (self.definitions, self.pattern_order, self.reserved_words_defs, self.patterns_to_ignore,
+         self.pattern_directives) = parse_re_file_data(spec)
+        self.lexer_cache = LexerCache(cache_dir)
+        self.active_construction_method = method
+        self.current_frame_name = "FullTestMode"
+        self.current_test_name = "cache"
+        self.symbol_table_instance = SymbolTable()
+        self.individual_nfas = {}
+        self.combined_nfa_start_obj = self.combined_nfa_accept_map = self.combined_nfa_alphabet = None
+        self.augmented_syntax_tree_followpos = self.followpos_table_followpos = None
+        self.unminimized_dfa = self.dfa = self.cached_dfa = self.lexer = None
+        self.deferred_construction_views = False
+        self.generated_token_stream = []
+        self.generated_token_arrays = None
+        self.widgets = {"textboxes_map": {}, "display_tab_view": FakeWidget(), "re_input": FakeWidget(spec),
+                        "source_input": FakeWidget(source_code), "token_output_display": FakeWidget(),
+                        "part2_button": FakeWidget()}
+        # Uma caixa por aba, para ver o que cada etapa exibiu
+        for tab_name in ("ER ➔ NFA Ind. / Árvore+Followpos", "NFA Combinado (União ε) / AFD Direto (Não-Minim.)",
+                         "AFD Minimizado (Final)", "Saída Léxica (Tokens)", "Tabela de Símbolos"):
+            self.widgets["textboxes_map"][tab_name] = FakeWidget()
+
+    def get_current_mode_widgets(self):
+        return self.widgets
+
+    def display_definitions_and_reserved_words(self):
+        pass
+
+
+class FakeMessagebox:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+@pytest.fixture
+def counted_callbacks(monkeypatch):
+    '''
+    front.callbacks com os construtores de autômatos contados e sem as caixas
+    de mensagem do tkinter.
+    '''
+    callbacks = pytest.importorskip("front.callbacks")
+    calls = {}
+
+    def counted(name, builder):
+        def wrapper(*args, **kwargs):
+            calls[name] = calls.get(name, 0) + 1
+            return builder(*args, **kwargs)
+        return wrapper
+
+    for name in ("postfix_to_nfa", "construct_unminimized_dfa_from_nfa", "regex_to_direct_dfa", "_minimize_dfa"):
+        monkeypatch.setattr(callbacks, name, counted(name, getattr(callbacks, name)))
+    monkeypatch.setattr(callbacks, "messagebox", FakeMessagebox())
+    return callbacks, calls
+
+
+def run_staged_lexer(callbacks, app):
+    callbacks.process_regular_expressions_callback(app)
+    if app.cached_dfa is None and app.active_construction_method == "thompson":
+        callbacks.combine_all_nfas_callback(app)
+    callbacks.generate_final_dfa_and_minimize_callback(app)
+    return app.lexer.tokenize(MODE_SOURCE)[0]
+
+
+@pytest.mark.parametrize("method", ["thompson", "tree_direct_dfa"])
+def test_cache_hit_skips_the_automaton_builders(tmp_path, counted_callbacks, method):
+    callbacks, calls = counted_callbacks
+    expected = spec_tokens(*build_spec(MODE_SPEC))
+    assert run_staged_lexer(callbacks, FakeApp(str(tmp_path), method)) == expected
+    assert calls and len(os.listdir(tmp_path)) == 1
+
+    calls.clear()
+    app = FakeApp(str(tmp_path), method)
+    assert run_staged_lexer(callbacks, app) == expected
+    assert calls == {}
+    assert app.deferred_construction_views and app.unminimized_dfa is None
+
+    # As abas das Etapas A e B só constroem os autômatos quando selecionadas
+    app.widgets["display_tab_view"].text = "AFD Minimizado (Final)"
+    callbacks.show_deferred_construction_views_callback(app)
+    assert calls == {}
+    app.widgets["display_tab_view"].text = "NFA Combinado (União ε) / AFD Direto (Não-Minim.)"
+    callbacks.show_deferred_construction_views_callback(app)
+    assert calls and not app.deferred_construction_views
+    for tab_name in ("ER ➔ NFA Ind. / Árvore+Followpos", "NFA Combinado (União ε) / AFD Direto (Não-Minim.)"):
+        assert app.widgets["textboxes_map"][tab_name].text
+        assert "carregado do cache" not in app.widgets["textboxes_map"][tab_name].text
+    # A análise continua usando o AFD do cache
+    assert app.dfa is app.cached_dfa and app.lexer.tokenize(MODE_SOURCE)[0] == expected
+
+
+def test_part1_cache_hit_skips_the_automaton_builders(tmp_path, counted_callbacks):
+    callbacks, calls = counted_callbacks
+    app = FakeApp(str(tmp_path), "tree_direct_dfa")
+    callbacks.run_part1_lexical_callback(app)
+    assert calls["regex_to_direct_dfa"] == 1
+    expected = app.generated_token_stream
+
+    calls.clear()
+    app = FakeApp(str(tmp_path), "tree_direct_dfa")
+    callbacks.run_part1_lexical_callback(app)
+    assert calls == {}
+    assert app.generated_token_stream == expected
@@ -0,0 +1,72 @@
+import importlib.util
+
+import pytest
+
+from core.automata import _minimize_dfa
+from core.lexer_codegen import MAX_INLINE_DEPTH, generate_lexer_module, write_lexer_module
+from core.lexer_core import Lexer, parse_re_file_data, mode_patterns_from_directives
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+from tests import TEST_CASES
+
+# Palavras reservadas que são prefixo umas das outras e de identificadores, uma
+# maior que MAX_INLINE_DEPTH (o bloco embutido volta à seleção de estados) e
+# escritas em maiúsculas na entrada (estados alcançados por vários caminhos)
+LONG_KEYWORD = "k" * (MAX_INLINE_DEPTH + 10)
+KEYWORD_SPEC = f'''IF: if
+IFF: iff
+WHILE: while
+{LONG_KEYWORD.upper()}: {LONG_KEYWORD}
+ID: [a-zA-Z_][a-zA-Z0-9_]*
+NUM: [0-9]+(\\.[0-9]+)?
+OP: [=+;(){{}}<>]|==|<=
+WS: [ \\n]+ %ignore
+'''
+KEYWORD_SOURCE = (f"if iff iffy IF While whilex {LONG_KEYWORD} {LONG_KEYWORD}s {LONG_KEYWORD[:-1]} "
+                  "x1 = 3.5 == 4 <= y; ?? ção {} ")
+
+
+def build(spec):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, directives = parse_re_file_data(spec)
+    mode_patterns = mode_patterns_from_directives(pattern_order, directives)
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order, mode_patterns)[0])
+    return dfa, reserved_words, patterns_to_ignore
+
+
+def load_generated(tmp_path, name, dfa, reserved_words, patterns_to_ignore, **options):
+    filepath = str(tmp_path / f"{name}.py")
+    write_lexer_module(filepath, dfa, reserved_words, patterns_to_ignore, **options)
+    module_spec = importlib.util.spec_from_file_location(name, filepath)
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize("coalesce_errors", [False, True])
+def test_generated_lexer_matches_lexer(tmp_path, coalesce_errors):
+    cases = [(test_case["re_definitions"], test_case["source_code"] + " ?? ção ") for test_case in TEST_CASES]
+    cases.append((KEYWORD_SPEC, KEYWORD_SOURCE))
+    for case_index, (spec, source_code) in enumerate(cases):
+        dfa, reserved_words, patterns_to_ignore = build(spec)
+        module = load_generated(tmp_path, f"generated_{case_index}", dfa, reserved_words, patterns_to_ignore,
+                                coalesce_errors=coalesce_errors)
+        expected, expected_symbols = Lexer(dfa, reserved_words, patterns_to_ignore,
+                                           coalesce_errors=coalesce_errors).tokenize(source_code)
+        tokens, symbol_table = module.tokenize(source_code)
+        assert tokens == expected
+        assert str(symbol_table) == str(expected_symbols)
+
+
+def test_keywords_longer_than_inline_depth(tmp_path):
+    module = load_generated(tmp_path, "generated_keywords", *build(KEYWORD_SPEC))
+    tokens = module.tokenize(f"{LONG_KEYWORD} {LONG_KEYWORD.upper()} {LONG_KEYWORD}s")[0]
+    assert [token_type for _, token_type, _ in tokens] == [LONG_KEYWORD.upper(), LONG_KEYWORD.upper(), "ID"]
+
+
+def test_lexer_modes_are_rejected():
+    dfa, reserved_words, patterns_to_ignore = build('''ID: [a-z]+
+QUOTE: " %begin=STR
+<STR>STR_TEXT: [a-z ]+
+<STR>STR_END: " %begin=INITIAL
+''')
+    with pytest.raises(ValueError, match="lexer modes"):
+        generate_lexer_module(dfa, reserved_words, patterns_to_ignore)
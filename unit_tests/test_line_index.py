@@ -0,0 +1,90 @@
+import pytest
+
+from core.automata import _minimize_dfa
+from core.line_index import LineIndex
+from core.lexer_core import Lexer, parse_re_file_data
+from core.syntactic.grammar import Grammar
+from core.syntactic.slr_generator import SLRGenerator
+from core.syntactic.slr_parser import SLRParser
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+
+SPEC = '''ID: [a-z]+
+PLUS: \\+
+WS: [ \\r\\n]+ %ignore
+'''
+GRAMMAR = '''E ::= E PLUS T | T
+T ::= ID
+'''
+
+
+def build_lexer():
+    definitions, pattern_order, reserved_words, patterns_to_ignore, _ = parse_re_file_data(SPEC)
+    return Lexer(_minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0]), reserved_words, patterns_to_ignore)
+
+
+def build_parser():
+    grammar = Grammar.from_text(GRAMMAR)
+    action_table, goto_table = SLRGenerator(grammar).build_slr_table()
+    return SLRParser(grammar, action_table, goto_table)
+
+
+@pytest.mark.parametrize("source_code, expected", [
+    ("", {0: (1, 1)}),
+    ("ab\ncd\n", {0: (1, 1), 2: (1, 3), 3: (2, 1), 4: (2, 2), 5: (2, 3), 6: (3, 1)}),
+    # Linhas vazias seguidas
+    ("a\n\n\nb", {1: (1, 2), 2: (2, 1), 3: (3, 1), 4: (4, 1), 5: (4, 2)}),
+    # Com '\r\n', o '\r' é o último caractere da linha e a próxima começa depois do '\n'
+    ("ab\r\ncd\r\n", {0: (1, 1), 2: (1, 3), 3: (1, 4), 4: (2, 1), 5: (2, 2), 7: (2, 4), 8: (3, 1)}),
+])
+def test_line_column(source_code, expected):
+    line_index = LineIndex(source_code)
+    for offset, position in expected.items():
+        assert line_index.line_column(offset) == position, offset
+    assert len(line_index) == source_code.count("\n") + 1
+
+
+def test_line_text():
+    line_index = LineIndex("ab\r\n\ncd\nef")
+    assert [line_index.line_text(line) for line in range(1, len(line_index) + 1)] == ["ab", "", "cd", "ef"]
+    line_index = LineIndex("x\n")
+    assert [line_index.line_text(line) for line in range(1, len(line_index) + 1)] == ["x", ""]
+
+
+def test_token_positions():
+    token_arrays = build_lexer().tokenize_columnar("a +\r\n  bc\n\n+ d")[0]
+    assert [token_arrays.position(index) for index in range(len(token_arrays))] == [
+        (1, 1), (1, 3), (2, 3), (4, 1), (4, 3)]
+    # O índice len(token_arrays) é o fim da entrada
+    assert token_arrays.position(len(token_arrays)) == (4, 4)
+
+
+@pytest.mark.parametrize("source_code, location", [
+    # Token inesperado no meio da entrada
+    ("a +\r\n  b\n  c + d", "linha 3, coluna 3"),
+    ("a +\n+ b", "linha 2, coluna 1"),
+    # Entrada que termina cedo: o erro é no '$', no fim da entrada
+    ("a +\n b +\n", "linha 3, coluna 1"),
+])
+def test_parser_errors_carry_the_token_position(source_code, location):
+    token_arrays = build_lexer().tokenize_columnar(source_code)[0]
+    _, success, message = build_parser().parse(token_arrays.to_tuples(), token_arrays.position)
+    assert not success
+    assert message.endswith(f"({location}).")
+
+    # Sem position_of, a mensagem não tem posição
+    _, success, message = build_parser().parse(token_arrays.to_tuples())
+    assert not success and "linha" not in message
+
+
+def test_parser_accepts_with_position_of():
+    token_arrays = build_lexer().tokenize_columnar("a +\r\n b + c")[0]
+    positions_requested = []
+
+    def position_of(index):
+        positions_requested.append(index)
+        return token_arrays.position(index)
+
+    _, success, _ = build_parser().parse(token_arrays.to_tuples(), position_of)
+    assert success
+    # A posição só é calculada para o token em que a análise falha
+    assert positions_requested == []
@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from core.automata import _minimize_dfa
+from core.lexer_core import (Lexer, parse_re_file_data, attribute_converters_from_directives,
+                             mode_patterns_from_directives, mode_switches_from_directives)
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+from tests import TEST_CASES
+
+# No modo padrão, cada 'a' de uma sequência só de 'a' varre até o fim procurando
+# o 'b' de AB: custo quadrático
+BACKTRACKING_SPEC = '''A: a
+AB: a*b
+'''
+# Recuos do maximal munch por vários caracteres, com modos
+MODE_SPEC = '''ABC: abc
+AB: ab
+A: a
+ABCD: (abc)+d
+WS: [ ]+ %ignore
+QUOTE: " %begin=STR
+<STR>STR_TEXT: (ab)+c?
+<STR>STR_END: " %begin=INITIAL
+'''
+
+
+class CountingRows(list):
+    '''
+    Tabela de transições que conta as consultas feitas pelo laço do lexer.
+    '''
+    lookups = 0
+
+    def __getitem__(self, index):
+        self.lookups += 1
+        return list.__getitem__(self, index)
+
+
+def build_lexer(spec, **lexer_options):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, directives = parse_re_file_data(spec)
+    mode_patterns = mode_patterns_from_directives(pattern_order, directives)
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order, mode_patterns)[0])
+    return Lexer(dfa, reserved_words, patterns_to_ignore, mode_patterns=mode_patterns,
+                 mode_switches=mode_switches_from_directives(directives),
+                 attribute_converters=attribute_converters_from_directives(directives), **lexer_options)
+
+
+def transition_lookups(lexer, source_code, chunk_size=None):
+    lexer.compiled_dfa.rows = CountingRows(lexer.compiled_dfa.rows)
+    if chunk_size is None:
+        tokens = lexer.tokenize(source_code)[0]
+    else:
+        tokens = list(lexer.tokenize_stream(source_code[base:base + chunk_size]
+                                            for base in range(0, len(source_code), chunk_size)))
+    return tokens, lexer.compiled_dfa.rows.lookups
+
+
+def test_linear_time_matches_default_output():
+    rng = random.Random(7)
+    cases = [(test_case["re_definitions"], test_case["source_code"] + " ?? ") for test_case in TEST_CASES]
+    cases.append((BACKTRACKING_SPEC, "aaab" + "a" * 50 + "ba"))
+    cases.extend((MODE_SPEC, "".join(rng.choice('abcd "') for _ in range(200))) for _ in range(20))
+    for spec, source_code in cases:
+        expected, expected_symbols = build_lexer(spec).tokenize(source_code)
+        tokens, symbol_table = build_lexer(spec, linear_time=True).tokenize(source_code)
+        assert tokens == expected
+        assert str(symbol_table) == str(expected_symbols)
+        assert build_lexer(spec, linear_time=True).tokenize_columnar(source_code)[0].to_tuples() == expected
+
+
+@pytest.mark.parametrize("chunk_size", [None, 64])
+@pytest.mark.parametrize("length", [500, 1000, 2000])
+def test_linear_time_visits_each_position_a_bounded_number_of_times(length, chunk_size):
+    tokens, lookups = transition_lookups(build_lexer(BACKTRACKING_SPEC, linear_time=True), "a" * length, chunk_size)
+    assert tokens == [("a", "A", None)] * length
+    # Cada par (estado, posição) é percorrido no máximo uma vez depois do último aceite
+    assert lookups <= 3 * length
+
+
+def test_linear_time_step_count_grows_linearly():
+    lexer = build_lexer(BACKTRACKING_SPEC, linear_time=True)
+    _, small = transition_lookups(lexer, "a" * 1000)
+    _, large = transition_lookups(build_lexer(BACKTRACKING_SPEC, linear_time=True), "a" * 4000)
+    assert large <= 4.5 * small
@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from core.automata import DFA, _minimize_dfa, _refine_partition
+
+ALPHABET = "abc"
+PATTERNS = ["ID", "NUM", None]
+
+
+def random_dfa(rng, num_states):
+    '''
+    AFD parcial aleatório: parte das transições falta, e parte vai para um
+    estado morto explícito (não aceita e só leva a si mesmo).
+    '''
+    dfa = DFA()
+    dfa.alphabet = set(ALPHABET)
+    dfa.states = set(range(num_states + 1))
+    dead_state = num_states
+    dfa.start_state_id = 0
+    for state_id in range(num_states):
+        pattern = rng.choice(PATTERNS)
+        if pattern is not None:
+            dfa.set_accept_state(state_id, pattern)
+            if pattern == "ID" and rng.random() < 0.3:
+                dfa.keyword_accept_states[state_id] = "IF"
+        for symbol in ALPHABET:
+            draw = rng.random()
+            if draw < 0.2:
+                continue
+            dfa.add_transition(state_id, symbol, dead_state if draw < 0.35 else rng.randrange(num_states))
+    for symbol in ALPHABET:
+        dfa.add_transition(dead_state, symbol, dead_state)
+    return dfa
+
+
+def initial_groups(dfa):
+    groups = {}
+    for state_id in sorted(dfa.states):
+        pattern = dfa.accept_states.get(state_id)
+        groups.setdefault((pattern, dfa.keyword_accept_states.get(state_id)), []).append(state_id)
+    return list(groups.values())
+
+
+def reference_partition(dfa):
+    # Refinamento de Moore: divide os blocos pela assinatura (bloco de destino
+    # por símbolo, None quando a transição falta) até nada mudar
+    block_of = {state_id: block for block, group in enumerate(initial_groups(dfa)) for state_id in group}
+    symbols = sorted(dfa.alphabet)
+    while True:
+        signature_ids = {}
+        new_block_of = {}
+        for state_id in sorted(dfa.states):
+            signature = (block_of[state_id],) + tuple(
+                block_of.get(dfa.transitions.get((state_id, symbol))) for symbol in symbols)
+            new_block_of[state_id] = signature_ids.setdefault(signature, len(signature_ids))
+        if len(signature_ids) == len(set(block_of.values())):
+            blocks = {}
+            for state_id, block in new_block_of.items():
+                blocks.setdefault(block, set()).add(state_id)
+            return {frozenset(block) for block in blocks.values()}
+        block_of = new_block_of
+
+
+def run(dfa, text):
+    state = dfa.start_state_id
+    for char in text:
+        state = dfa.transitions.get((state, char))
+        if state is None:
+            return None
+    return dfa.accept_states.get(state), dfa.keyword_accept_states.get(state)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_refine_partition_matches_the_reference(seed):
+    rng = random.Random(seed)
+    for _ in range(25):
+        dfa = random_dfa(rng, rng.randint(1, 30))
+        blocks = _refine_partition(sorted(dfa.states), dfa.alphabet, dfa.transitions, initial_groups(dfa))
+        assert {frozenset(block) for block in blocks} == reference_partition(dfa)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_minimized_dfa_accepts_the_same_strings(seed):
+    rng = random.Random(seed)
+    texts = [""] + ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 8))) for _ in range(200)]
+    for _ in range(10):
+        dfa = random_dfa(rng, rng.randint(1, 30))
+        min_dfa = _minimize_dfa(dfa)
+        assert len(min_dfa.states) == len(reference_partition(dfa))
+        for text in texts:
+            assert run(min_dfa, text) == run(dfa, text), text
+        # Minimizar de novo não muda nada
+        assert len(_minimize_dfa(min_dfa).states) == len(min_dfa.states)
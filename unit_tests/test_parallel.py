@@ -0,0 +1,53 @@
+import pytest
+
+from core.automata import _minimize_dfa
+from core.lexer_core import (Lexer, parse_re_file_data, mode_patterns_from_directives,
+                             mode_switches_from_directives)
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+from tests import TEST_CASES
+
+# Modo RAW sem nenhum %begin: os padrões dele existem no AFD, mas a análise
+# fica sempre em INITIAL
+SPEC = '''IF: if
+ID: [a-z]+
+NUM: [0-9]+(\\.[0-9]+)?
+STR: "[a-z ]*"
+WS: [ ]+ %ignore
+<RAW>RAW_TEXT: [a-z0-9 ]+
+'''
+# Tokens bem maiores que os blocos, atravessando várias fronteiras, e erros
+SOURCE = ('if iff ' + 'x' * 40 + ' 123.45 "some long string literal" ?? 7. if' + ' abc 1 "a b" ') * 6
+
+
+def build_lexer(spec=SPEC, **lexer_options):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, directives = parse_re_file_data(spec)
+    mode_patterns = mode_patterns_from_directives(pattern_order, directives)
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order, mode_patterns)[0])
+    return Lexer(dfa, reserved_words, patterns_to_ignore, mode_patterns=mode_patterns,
+                 mode_switches=mode_switches_from_directives(directives), **lexer_options)
+
+
+@pytest.mark.parametrize("lexer_options", [{}, {"linear_time": True}, {"coalesce_errors": True}])
+@pytest.mark.parametrize("chunk_size", [2, 5, 16])
+def test_parallel_matches_sequential(lexer_options, chunk_size):
+    expected, expected_symbols = build_lexer(**lexer_options).tokenize(SOURCE)
+    tokens, symbol_table = build_lexer(**lexer_options).tokenize_parallel(SOURCE, max_workers=2,
+                                                                          chunk_size=chunk_size)
+    assert tokens == expected
+    assert str(symbol_table) == str(expected_symbols)
+
+
+def test_parallel_of_test_cases():
+    for test_case in TEST_CASES:
+        source_code = (test_case["source_code"] + " ?? ") * 3
+        expected, expected_symbols = build_lexer(test_case["re_definitions"]).tokenize(source_code)
+        tokens, symbol_table = build_lexer(test_case["re_definitions"]).tokenize_parallel(
+            source_code, max_workers=2, chunk_size=7)
+        assert tokens == expected
+        assert str(symbol_table) == str(expected_symbols)
+
+
+def test_parallel_rejects_mode_switches():
+    lexer = build_lexer(SPEC.replace('STR: "[a-z ]*"', 'QUOTE: " %begin=RAW'))
+    with pytest.raises(ValueError, match="lexer modes"):
+        lexer.tokenize_parallel(SOURCE, max_workers=2, chunk_size=5)
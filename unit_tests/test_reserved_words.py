@@ -0,0 +1,74 @@
+from core.automata import _minimize_dfa, fold_reserved_words
+from core.compiled_dfa import CompiledDFA, DEAD_STATE
+from core.lexer_core import Lexer, parse_re_file_data
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+
+# HEX vem antes de ID e também casa 'add'; COMMENT é ignorado e casa 'rem'
+SPEC = '''HEX: [a-f][a-f0-9]*
+COMMENT: rem[a-z]* %ignore
+ID: [a-zA-Z_][a-zA-Z0-9_]*
+WS: [ ]+ %ignore
+'''
+RESERVED_WORDS = {"if": "IF", "add": "ADD", "rem": "REM", "while": "WHILE"}
+
+
+def build(spec=SPEC):
+    definitions, pattern_order, _, patterns_to_ignore, _ = parse_re_file_data(spec)
+    return _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0]), patterns_to_ignore
+
+
+def run(compiled_dfa, text):
+    state = compiled_dfa.start
+    for char in text:
+        state = compiled_dfa.next_state(state, char)
+        if state == DEAD_STATE:
+            return None, None
+    return compiled_dfa.accepts[state], compiled_dfa.keywords[state]
+
+
+def test_keywords_are_accept_states_of_the_folded_dfa():
+    dfa, patterns_to_ignore = build()
+    compiled_dfa = CompiledDFA(fold_reserved_words(dfa, RESERVED_WORDS, patterns_to_ignore))
+    # O padrão original continua em accepts; o tipo reservado vem do próprio estado
+    assert run(compiled_dfa, "if") == ("ID", "IF")
+    assert run(compiled_dfa, "while") == ("ID", "WHILE")
+    assert run(compiled_dfa, "iff") == ("ID", None)
+    assert run(compiled_dfa, "whil") == ("ID", None)
+    assert run(compiled_dfa, "add") == ("HEX", "ADD")
+    assert run(compiled_dfa, "adde") == ("HEX", None)
+    # Padrões ignorados não viram palavra reservada
+    assert run(compiled_dfa, "rem") == ("COMMENT", None)
+    # Sem palavras reservadas, o AFD não muda
+    assert fold_reserved_words(dfa, {}, patterns_to_ignore) is dfa
+
+
+def test_case_insensitive_keywords():
+    dfa, patterns_to_ignore = build()
+    compiled_dfa = CompiledDFA(fold_reserved_words(dfa, RESERVED_WORDS, patterns_to_ignore))
+    assert run(compiled_dfa, "IF") == ("ID", "IF")
+    assert run(compiled_dfa, "wHiLe") == ("ID", "WHILE")
+    tokens = Lexer(dfa, RESERVED_WORDS, patterns_to_ignore).tokenize("If WHILE While_ ADD")[0]
+    assert tokens == [("If", "IF", None), ("WHILE", "WHILE", None), ("While_", "ID", 0), ("ADD", "ADD", None)]
+
+
+def test_keyword_prefix_of_identifier():
+    dfa, patterns_to_ignore = build()
+    tokens = Lexer(dfa, RESERVED_WORDS, patterns_to_ignore).tokenize("if iff i ifif whilex while")[0]
+    assert tokens == [("if", "IF", None), ("iff", "ID", 0), ("i", "ID", 1), ("ifif", "ID", 2),
+                      ("whilex", "ID", 3), ("while", "WHILE", None)]
+
+
+def test_keyword_overlapping_non_identifier_pattern():
+    dfa, patterns_to_ignore = build()
+    tokens = Lexer(dfa, RESERVED_WORDS, patterns_to_ignore).tokenize("add adde ad rem remark x")[0]
+    assert tokens == [("add", "ADD", None), ("adde", "HEX", "adde"), ("ad", "HEX", "ad"), ("x", "ID", 0)]
+
+
+def test_keyword_patterns_declared_in_the_spec():
+    # 'IF: if' declara a palavra reservada e também um padrão do AFD
+    spec = "IF: if\n" + SPEC
+    definitions, pattern_order, reserved_words, patterns_to_ignore, _ = parse_re_file_data(spec)
+    assert reserved_words == {"if": "IF"}
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0])
+    tokens = Lexer(dfa, reserved_words, patterns_to_ignore).tokenize("if IF iff")[0]
+    assert tokens == [("if", "IF", None), ("IF", "IF", None), ("iff", "ID", 0)]
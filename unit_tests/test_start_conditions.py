@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from core.automata import (NFA, _minimize_dfa, combine_nfas_by_mode, construct_unminimized_dfa_from_nfa,
+                           postfix_to_nfa)
+from core.compiled_dfa import CompiledDFA, DEAD_STATE
+from core.config import INITIAL_MODE
+from core.lexer_core import Lexer, parse_re_file_data, mode_patterns_from_directives, mode_switches_from_directives
+from core.regex_utils import infix_to_postfix
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+
+# ESC vale em dois modos; NL vale em todos e sempre volta a INITIAL
+SPEC = '''QUOTE: " %begin=STR
+HASH: # %begin=COMMENT
+ID: [a-z]+
+NUM: [0-9]+
+WS: [ ]+ %ignore
+<STR>STR_TEXT: [a-z0-9 ]+
+<STR>STR_END: " %begin=INITIAL
+<COMMENT,STR>ESC: \\\\[a-z]
+<COMMENT>COMMENT_TEXT: [a-z ]+
+<*>NL: ; %begin=INITIAL
+'''
+ALPHABET = 'ab1 "#;\\'
+
+
+def parse(spec=SPEC):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, directives = parse_re_file_data(spec)
+    return (definitions, pattern_order, reserved_words, patterns_to_ignore,
+            mode_patterns_from_directives(pattern_order, directives), mode_switches_from_directives(directives))
+
+
+def direct_dfa(definitions, pattern_order, mode_patterns):
+    return _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order, mode_patterns)[0])
+
+
+def thompson_dfa(definitions, pattern_order, mode_patterns):
+    NFA.reset_state_ids()
+    nfas = {name: postfix_to_nfa(infix_to_postfix(definitions[name])) for name in pattern_order}
+    mode_nfa_starts, accept_map, alphabet = combine_nfas_by_mode(nfas, mode_patterns)
+    return _minimize_dfa(construct_unminimized_dfa_from_nfa(
+        mode_nfa_starts[INITIAL_MODE], accept_map, alphabet, pattern_order, mode_nfa_starts))
+
+
+def build_lexer(spec=SPEC, builder=direct_dfa):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, mode_patterns, mode_switches = parse(spec)
+    return Lexer(builder(definitions, pattern_order, mode_patterns), reserved_words, patterns_to_ignore,
+                 mode_patterns=mode_patterns, mode_switches=mode_switches)
+
+
+def run(compiled_dfa, mode, text):
+    state = compiled_dfa.mode_starts[mode]
+    for char in text:
+        state = compiled_dfa.next_state(state, char)
+        if state == DEAD_STATE:
+            return None
+    return compiled_dfa.accepts[state]
+
+
+def test_begin_switches_modes():
+    tokens = build_lexer().tokenize('ab "cd 12" 3 # ab 12')[0]
+    assert [(lexeme, token_type) for lexeme, token_type, _ in tokens] == [
+        ("ab", "ID"), ('"', "QUOTE"), ("cd 12", "STR_TEXT"), ('"', "STR_END"), ("3", "NUM"),
+        ("#", "HASH"), (" ab ", "COMMENT_TEXT"), ("1", "ERRO!"), ("2", "ERRO!")]
+
+
+def test_all_modes_pattern_matches_in_every_mode():
+    tokens = build_lexer().tokenize('a; "b\\c;d "e;f # g\\h;i')[0]
+    assert [(lexeme, token_type) for lexeme, token_type, _ in tokens] == [
+        ("a", "ID"), (";", "NL"), ('"', "QUOTE"), ("b", "STR_TEXT"), ("\\c", "ESC"), (";", "NL"),
+        ("d", "ID"), ('"', "QUOTE"), ("e", "STR_TEXT"), (";", "NL"), ("f", "ID"), ("#", "HASH"),
+        (" g", "COMMENT_TEXT"), ("\\h", "ESC"), (";", "NL"), ("i", "ID")]
+    # ESC vale só nos modos listados
+    assert ("\\c", "ESC", "\\c") not in build_lexer().tokenize("\\c")[0]
+
+
+def test_mode_starts_of_the_compiled_dfa():
+    definitions, pattern_order, _, _, mode_patterns, _ = parse()
+    compiled_dfa = CompiledDFA(direct_dfa(definitions, pattern_order, mode_patterns))
+    assert set(compiled_dfa.mode_starts) == {INITIAL_MODE, "STR", "COMMENT"}
+    assert compiled_dfa.mode_starts[INITIAL_MODE] == compiled_dfa.start
+    assert len(set(compiled_dfa.mode_starts.values())) == 3
+    # O mesmo texto casa padrões diferentes conforme o estado inicial do modo
+    assert run(compiled_dfa, INITIAL_MODE, "ab") == "ID"
+    assert run(compiled_dfa, "STR", "ab") == "STR_TEXT"
+    assert run(compiled_dfa, "COMMENT", "ab") == "COMMENT_TEXT"
+    assert run(compiled_dfa, INITIAL_MODE, "\\a") is None
+    assert run(compiled_dfa, "COMMENT", "12") is None
+    assert {run(compiled_dfa, mode, ";") for mode in compiled_dfa.mode_starts} == {"NL"}
+
+    # Sem modos, só o estado inicial do AFD
+    definitions, pattern_order, _, _, mode_patterns, _ = parse("ID: [a-z]+\nNUM: [0-9]+")
+    assert mode_patterns is None
+    compiled_dfa = CompiledDFA(direct_dfa(definitions, pattern_order, mode_patterns))
+    assert compiled_dfa.mode_starts == {INITIAL_MODE: compiled_dfa.start}
+
+
+@pytest.mark.parametrize("spec", [SPEC, SPEC + "<STR>QUOTED_NUM: [0-9]+\\.[0-9]+\n"])
+def test_thompson_and_direct_builders_agree_on_moded_specs(spec):
+    definitions, pattern_order, _, _, mode_patterns, _ = parse(spec)
+    direct = CompiledDFA(direct_dfa(definitions, pattern_order, mode_patterns))
+    thompson = CompiledDFA(thompson_dfa(definitions, pattern_order, mode_patterns))
+    assert len(thompson.rows) == len(direct.rows)
+    assert set(thompson.mode_starts) == set(direct.mode_starts)
+
+    rng = random.Random(17)
+    texts = ["".join(rng.choice(ALPHABET + ".") for _ in range(rng.randint(1, 6))) for _ in range(300)]
+    for mode in direct.mode_starts:
+        for text in texts:
+            assert run(thompson, mode, text) == run(direct, mode, text), (mode, text)
+
+    for text in texts[:50]:
+        source_code = text * 5
+        assert build_lexer(spec, thompson_dfa).tokenize(source_code)[0] == build_lexer(spec).tokenize(source_code)[0]
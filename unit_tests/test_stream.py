@@ -0,0 +1,53 @@
+import io
+
+import pytest
+
+from core.automata import _minimize_dfa
+from core.lexer_core import Lexer, parse_re_file_data
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+from tests import TEST_CASES
+
+SPEC = r'''ID: [a-zA-Z_][a-zA-Z0-9_]*
+NUM: [0-9]+(\.[0-9]+)?
+STR: "([a-z ]|\\"|\\\\)*"
+PAIRS: (ab)+
+WS: [ ]+ %ignore
+'''
+# Tokens longos (bem maiores que os blocos) de caminhos diferentes no AFD: laço
+# de um estado (ID), alternância entre estados (PAIRS, STR) e recuo do maximal
+# munch até um aceite de vários blocos atrás (PAIRS seguido de 'a'), além de
+# uma sequência de erros no fim
+SOURCE = ("x" + "a1_" * 300 + " 12.5 " + '"' + 'ab\\"' * 200 + '" ' + "ab" * 400 + "a 7 "
+          + "ab" * 300 + "ac " + "?" * 150)
+
+
+def build_lexer(**lexer_options):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, _ = parse_re_file_data(SPEC)
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0])
+    return Lexer(dfa, reserved_words, patterns_to_ignore, **lexer_options)
+
+
+def chunked(text, chunk_size):
+    return [text[base:base + chunk_size] for base in range(0, len(text), chunk_size)]
+
+
+@pytest.mark.parametrize("lexer_options", [{}, {"linear_time": True}, {"coalesce_errors": True}])
+@pytest.mark.parametrize("chunk_size", [1, 3, 16, 5000])
+def test_tokens_spanning_many_chunks(lexer_options, chunk_size):
+    expected = build_lexer(**lexer_options).tokenize(SOURCE)[0]
+    assert list(build_lexer(**lexer_options).tokenize_stream(chunked(SOURCE, chunk_size))) == expected
+    assert list(build_lexer(**lexer_options).tokenize_stream(io.StringIO(SOURCE), chunk_size)) == expected
+
+
+@pytest.mark.parametrize("linear_time", [False, True])
+def test_stream_of_test_cases(linear_time):
+    for test_case in TEST_CASES:
+        definitions, pattern_order, reserved_words, patterns_to_ignore, _ = parse_re_file_data(
+            test_case["re_definitions"])
+        dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0])
+        source_code = test_case["source_code"]
+        lexer = Lexer(dfa, reserved_words, patterns_to_ignore, linear_time=linear_time)
+        expected = lexer.tokenize(source_code)[0]
+        for chunk_size in (1, 2, 7):
+            lexer = Lexer(dfa, reserved_words, patterns_to_ignore, linear_time=linear_time)
+            assert list(lexer.tokenize_stream(chunked(source_code, chunk_size))) == expected
@@ -0,0 +1,107 @@
+import struct
+
+import pytest
+
+from core.automata import _minimize_dfa
+from core.lexer_core import Lexer, SymbolTable, SYMBOL_TABLE_HEADER_FORMAT, parse_re_file_data
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+
+SPEC = '''IF: if
+ID: [a-zA-Zçãé_][a-zA-Z0-9çãé_]*
+STR: "[a-z]*"
+NUM: [0-9]+
+OP: [=+;]
+WS: [ ]+ %ignore
+'''
+SOURCE = 'if ação = b1 + 22; ação = "txt" + é; b1 = c'
+HEADER_SIZE = struct.calcsize(SYMBOL_TABLE_HEADER_FORMAT)
+
+
+def build_lexer(**lexer_options):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, _ = parse_re_file_data(SPEC)
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0])
+    return Lexer(dfa, reserved_words, patterns_to_ignore, **lexer_options)
+
+
+def test_only_interned_types_enter_the_table():
+    tokens, symbol_table = build_lexer().tokenize(SOURCE)
+    assert [symbol_table.lexeme(index) for index in range(len(symbol_table))] == ["ação", "b1", "é", "c"]
+    assert {symbol_table.token_type(index) for index in range(len(symbol_table))} == {"ID"}
+    assert ("ação", "ID", 0) in tokens and ("b1", "ID", 1) in tokens
+    assert ('"txt"', "STR", '"txt"') in tokens and ("if", "IF", None) in tokens
+
+    tokens, symbol_table = build_lexer(symbol_table_instance=SymbolTable(("ID", "STR"))).tokenize(SOURCE)
+    assert [symbol_table.lexeme(index) for index in range(len(symbol_table))] == ["ação", "b1", '"txt"', "é", "c"]
+    assert ('"txt"', "STR", 2) in tokens
+
+
+def test_arena_layout():
+    symbol_table = SymbolTable()
+    assert [symbol_table.add_symbol(lexeme, "ID") for lexeme in ("ab", "ação", "ab", "x")] == [0, 1, 0, 2]
+    assert symbol_table.add_symbol("1", "NUM") == 3
+    # Os lexemas ficam concatenados numa única string, com offsets em caracteres
+    assert symbol_table.arena() == "abaçãox1"
+    assert list(symbol_table.offsets) == [0, 2, 6, 7]
+    assert list(symbol_table.lengths) == [2, 4, 1, 1]
+    assert symbol_table.type_names == ["ID", "NUM"]
+    assert list(symbol_table.type_ids) == [0, 0, 0, 1]
+    assert symbol_table.get_index("ação") == 1 and symbol_table.get_index("y") is None
+    assert symbol_table.get_symbol_entry(3) == {"lexeme": "1", "token_type": "NUM"}
+    assert symbol_table.get_symbol_entry(4) is None
+
+
+def test_save_and_load_round_trip(tmp_path):
+    lexer = build_lexer(symbol_table_instance=SymbolTable(("ID", "STR")))
+    symbol_table = lexer.tokenize(SOURCE)[1]
+    filepath = str(tmp_path / "symbols.lxst")
+    symbol_table.save(filepath)
+
+    loaded = SymbolTable.load(filepath)
+    assert loaded.interned_types == symbol_table.interned_types
+    assert loaded.arena() == symbol_table.arena()
+    assert str(loaded) == str(symbol_table)
+    assert loaded.get_index("ação") == symbol_table.get_index("ação")
+    # A tabela carregada continua a ser usada por análises seguintes
+    tokens = build_lexer(symbol_table_instance=loaded).tokenize("ação ovo")[0]
+    assert tokens == [("ação", "ID", 0), ("ovo", "ID", len(symbol_table))]
+
+    empty_path = str(tmp_path / "empty.lxst")
+    SymbolTable().save(empty_path)
+    assert len(SymbolTable.load(empty_path)) == 0
+
+
+def corrupt_magic(data):
+    return b"XXXX" + data[4:]
+
+
+def corrupt_version(data):
+    return data[:4] + bytes([99]) + data[5:]
+
+
+def corrupt_arena_utf8(data):
+    # O último caractere da arena é 'c'; o byte solto 0xff não é UTF-8 válido
+    return data[:-1] + b"\xff"
+
+
+def corrupt_offset(data):
+    # Primeiro offset da tabela (logo depois dos nomes dos tipos e dos tipos internados)
+    _, _, _, _, _, names_size, interned_size, _ = struct.unpack_from(SYMBOL_TABLE_HEADER_FORMAT, data)
+    pos = HEADER_SIZE + names_size + interned_size
+    return data[:pos] + struct.pack("<q", 5) + data[pos + 8:]
+
+
+def corrupt_entry_count(data):
+    fields = list(struct.unpack_from(SYMBOL_TABLE_HEADER_FORMAT, data))
+    fields[3] += 1
+    return struct.pack(SYMBOL_TABLE_HEADER_FORMAT, *fields) + data[HEADER_SIZE:]
+
+
+@pytest.mark.parametrize("corrupt", [corrupt_magic, corrupt_version, corrupt_arena_utf8, corrupt_offset,
+                                     corrupt_entry_count, lambda data: data[:HEADER_SIZE - 1],
+                                     lambda data: data[:-3], lambda data: data + b"x"])
+def test_corrupted_file_is_rejected(tmp_path, corrupt):
+    filepath = tmp_path / "symbols.lxst"
+    build_lexer().tokenize(SOURCE)[1].save(str(filepath))
+    filepath.write_bytes(corrupt(filepath.read_bytes()))
+    with pytest.raises(ValueError):
+        SymbolTable.load(str(filepath))
@@ -0,0 +1,87 @@
+import pytest
+
+from core.automata import _minimize_dfa
+from core.lexer_core import Lexer, parse_re_file_data, attribute_converters_from_directives
+from core.syntax_tree_direct_dfa import regex_to_direct_dfa
+from core.token_arrays import (ATTRIBUTE_CONVERTERS, DEFAULT_ATTRIBUTE_CONVERTERS, register_attribute_converter,
+                               resolve_attribute_converter)
+from tests import TEST_CASES
+
+# Casamento vazio (DASHES casa '' antes de ';'), conversores e palavra reservada
+SPEC = '''IF: if
+ID: [a-z]+[0-9]*
+NUM: [0-9]+(\\.[0-9]+)? %attr=number
+HEX: 0x[0-9a-f]+ %attr=lexeme
+DASHES: -*
+WS: [ ]+ %ignore
+'''
+SOURCE = "if x1 12 3.5 0x1f -- ; é if2 x1"
+
+
+def build_lexer(spec=SPEC, **lexer_options):
+    definitions, pattern_order, reserved_words, patterns_to_ignore, directives = parse_re_file_data(spec)
+    dfa = _minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0])
+    return Lexer(dfa, reserved_words, patterns_to_ignore,
+                 attribute_converters=attribute_converters_from_directives(directives), **lexer_options)
+
+
+@pytest.mark.parametrize("coalesce_errors", [False, True])
+def test_tokenize_matches_columnar_tuples(coalesce_errors):
+    cases = [(test_case["re_definitions"], test_case["source_code"] + " ?? ") for test_case in TEST_CASES]
+    cases.append((SPEC, SOURCE))
+    for spec, source_code in cases:
+        expected, expected_symbols = build_lexer(spec, coalesce_errors=coalesce_errors).tokenize(source_code)
+        token_arrays, symbol_table = build_lexer(spec, coalesce_errors=coalesce_errors).tokenize_columnar(source_code)
+        assert token_arrays.to_tuples() == expected
+        assert [token_arrays[index] for index in range(len(token_arrays))] == expected
+        assert str(symbol_table) == str(expected_symbols)
+
+
+def test_registered_converter_runs_once_per_type(monkeypatch):
+    calls = []
+
+    def hex_values(lexemes):
+        calls.append(list(lexemes))
+        return [int(lexeme, 16) for lexeme in lexemes]
+
+    # O registro é global: monkeypatch remove 'hex' no fim do teste
+    monkeypatch.setitem(ATTRIBUTE_CONVERTERS, "hex", None)
+    register_attribute_converter("hex", hex_values)
+    lexer = build_lexer(SPEC.replace("%attr=lexeme", "%attr=hex"))
+    tokens = lexer.tokenize("0x1f 7 0xa0")[0]
+    assert tokens == [("0x1f", "HEX", 31), ("7", "NUM", 7), ("0xa0", "HEX", 160)]
+    assert calls == [["0x1f", "0xa0"]]
+
+    token_arrays = lexer.tokenize_columnar("0x1f 0x2")[0]
+    assert [token_arrays.attribute(index) for index in range(len(token_arrays))] == [31, 2]
+    assert token_arrays.to_tuples() == [("0x1f", "HEX", 31), ("0x2", "HEX", 2)]
+
+
+def test_unknown_converter_is_rejected():
+    with pytest.raises(ValueError, match="Unknown attribute converter 'nope'"):
+        build_lexer(SPEC.replace("%attr=lexeme", "%attr=nope"))
+    with pytest.raises(ValueError, match="Unknown attribute converter"):
+        resolve_attribute_converter("nope")
+    assert resolve_attribute_converter(len) is len
+    assert resolve_attribute_converter("int") is ATTRIBUTE_CONVERTERS["int"]
+
+
+def test_per_type_converters_override_defaults():
+    source_code = "x1 12 3.5 0x1f"
+    # Sem diretivas, NUM usa o conversor padrão (DEFAULT_ATTRIBUTE_CONVERTERS)
+    assert DEFAULT_ATTRIBUTE_CONVERTERS["NUM"] == "number"
+    plain_spec = SPEC.replace(" %attr=number", "").replace(" %attr=lexeme", "")
+    assert build_lexer(plain_spec).tokenize(source_code)[0] == [
+        ("x1", "ID", 0), ("12", "NUM", 12), ("3.5", "NUM", 3.5), ("0x1f", "HEX", "0x1f")]
+    # A diretiva %attr tem precedência sobre o padrão do tipo
+    assert build_lexer(SPEC.replace("%attr=number", "%attr=float")).tokenize(source_code)[0][1:3] == [
+        ("12", "NUM", 12.0), ("3.5", "NUM", 3.5)]
+    # e sobre a tabela de símbolos: ID convertido deixa de ser internado
+    definitions, pattern_order, reserved_words, patterns_to_ignore, _ = parse_re_file_data(plain_spec)
+    lexer = Lexer(_minimize_dfa(regex_to_direct_dfa(definitions, pattern_order)[0]), reserved_words,
+                  patterns_to_ignore, attribute_converters={"ID": "lexeme", "NUM": "none"})
+    tokens, symbol_table = lexer.tokenize(source_code)
+    assert tokens[:2] == [("x1", "ID", "x1"), ("12", "NUM", None)]
+    assert len(symbol_table) == 0
+    # Um lexema que não é número válido fica como está
+    assert ATTRIBUTE_CONVERTERS["int"](["1", "x"]) == [1, "x"]